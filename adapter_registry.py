@@ -0,0 +1,70 @@
+# adapter_registry.py
+# -*- coding: utf-8 -*-
+"""
+适配器实例缓存：按配置参数复用已创建的 LLM / Embedding 适配器（线程安全的 LRU），
+避免每个生成步骤都重新构造客户端。
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+
+def fingerprint_secret(secret: str) -> str:
+    """对 api_key 等敏感信息做摘要，避免明文出现在缓存键中"""
+    return hashlib.sha256((secret or "").encode("utf-8")).hexdigest()[:16]
+
+
+class AdapterRegistry:
+    """
+    线程安全的 LRU 适配器缓存，记录命中/未命中次数。
+    """
+    def __init__(self, name: str, max_size: int = 32):
+        self.name = name
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, key: tuple, factory):
+        """
+        若 key 已缓存则直接返回，否则调用 factory() 构造并放入缓存。
+        构造失败时异常原样抛出，不会写入缓存。
+        """
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+
+        instance = factory()
+
+        with self._lock:
+            # 并发构造时以先写入者为准，保证同一配置只有一个实例
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+            self._items[key] = instance
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+            logging.debug(f"[{self.name}] Cached new adapter, size={len(self._items)}")
+        return instance
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0
+            }
@@ -0,0 +1,349 @@
+# benchmark_pipeline.py
+# -*- coding: utf-8 -*-
+"""
+端到端生成流程基准测试：在本地模拟 LLM / embedding 服务上依次运行
+架构生成 → 章节目录 → N 章草稿 → N 章定稿，统计每个阶段的
+耗时、LLM/embedding 调用次数、提示词字节数、文件读写字节数与峰值内存，
+可写出 JSON 基线，并在某阶段相对基线退化超过阈值时以非零状态退出。
+
+用法：
+    python benchmark_pipeline.py --chapters 10 --output bench.json
+    python benchmark_pipeline.py --chapters 10 --write-baseline bench_baseline.json
+    python benchmark_pipeline.py --chapters 10 --baseline bench_baseline.json --threshold 0.2
+"""
+import argparse
+import builtins
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+STAGES = ("architecture", "blueprint", "draft", "finalize")
+LLM_ENDPOINTS = ("openai_chat", "gemini_generate", "gemini_stream")
+EMBEDDING_ENDPOINTS = ("openai_embeddings", "ollama_embeddings", "ollama_embed", "gemini_embed", "gemini_batch_embed")
+
+# 基线比较时各指标的含义：耗时类指标受机器抖动影响，额外要求超出绝对容差
+_TIMED_METRICS = ("wall_seconds",)
+_COUNTED_METRICS = ("llm_calls", "embedding_calls", "prompt_bytes", "file_read_bytes", "file_write_bytes")
+
+
+def _byte_size(data) -> int:
+    if isinstance(data, str):
+        return len(data.encode("utf-8"))
+    return len(data or b"")
+
+
+class _CountingFile:
+    """统计读写字节数的文件对象代理"""
+    def __init__(self, f, counter):
+        self._f = f
+        self._counter = counter
+
+    def read(self, *args):
+        data = self._f.read(*args)
+        self._counter.read_bytes += _byte_size(data)
+        return data
+
+    def readline(self, *args):
+        data = self._f.readline(*args)
+        self._counter.read_bytes += _byte_size(data)
+        return data
+
+    def readlines(self, *args):
+        lines = self._f.readlines(*args)
+        self._counter.read_bytes += sum(_byte_size(line) for line in lines)
+        return lines
+
+    def write(self, data):
+        self._counter.write_bytes += _byte_size(data)
+        return self._f.write(data)
+
+    def writelines(self, lines):
+        lines = list(lines)
+        self._counter.write_bytes += sum(_byte_size(line) for line in lines)
+        return self._f.writelines(lines)
+
+    def __iter__(self):
+        for line in self._f:
+            self._counter.read_bytes += _byte_size(line)
+            yield line
+
+    def __enter__(self):
+        self._f.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._f.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+class FileIOCounter:
+    """
+    在上下文内统计对 root 目录下文件的 Python 层读写字节数（不含 SQLite 等原生库的 I/O）。
+    """
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self._original_open = None
+
+    def __enter__(self):
+        self._original_open = builtins.open
+        original_open = self._original_open
+        counter = self
+
+        def counting_open(file, *args, **kwargs):
+            f = original_open(file, *args, **kwargs)
+            if isinstance(file, (str, bytes, os.PathLike)):
+                path = os.path.abspath(os.fsdecode(file))
+                if path.startswith(counter.root):
+                    return _CountingFile(f, counter)
+            return f
+
+        builtins.open = counting_open
+        return self
+
+    def __exit__(self, *exc):
+        builtins.open = self._original_open
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB），无法获取时返回 None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 以字节为单位，Linux 以 KB 为单位
+        return round(peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024, 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def _empty_stage() -> dict:
+    return {
+        "runs": 0,
+        "wall_seconds": 0.0,
+        "llm_calls": 0,
+        "embedding_calls": 0,
+        "prompt_bytes": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "file_read_bytes": 0,
+        "file_write_bytes": 0,
+        "peak_rss_mb": None,
+        "errors": 0
+    }
+
+
+def run_benchmark(chapters: int = 3, word_number: int = 800, latency=None, chars_per_second: float = None,
+                  max_tokens: int = 4096, workdir: str = None, seed: int = 0, embedding_backend: str = "mock") -> dict:
+    """
+    在模拟服务上运行完整生成流程，返回各阶段的统计结果。
+    :param chapters: 生成草稿与定稿的章节数
+    :param latency: 模拟 LLM 的延迟分布，见 mock_llm_server.parse_latency
+    :param embedding_backend: "mock" 使用模拟服务的 Ollama 接口，"local" 使用离线本地 embedding（不产生 HTTP 调用）
+    :param workdir: 小说输出目录，None 时使用临时目录并在结束后删除
+    """
+    from mock_llm_server import MockLLMServer
+    from novel_generator.llm_cache import configure_llm_cache
+    from novel_generator import (
+        Novel_architecture_generate,
+        Chapter_blueprint_generate,
+        generate_chapter_draft,
+        finalize_chapter
+    )
+
+    configure_llm_cache(None)  # 基准测试需要真实调用，不使用响应缓存
+    # 预先导入延迟加载的 SDK 与向量库，使首个阶段的耗时不包含一次性的导入开销（导入耗时另有 test_import_time 覆盖）
+    import langchain_openai  # noqa: F401
+    import langchain_chroma  # noqa: F401
+    owns_workdir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="novel_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    stages = {stage: _empty_stage() for stage in STAGES}
+
+    with MockLLMServer(latency=latency, chars_per_second=chars_per_second, seed=seed) as server:
+        llm = {
+            "interface_format": "OpenAI",
+            "api_key": "mock-key",
+            "base_url": server.openai_base_url,
+            "temperature": 0.7,
+            "max_tokens": max_tokens,
+            "timeout": 60
+        }
+        embedding = {
+            "embedding_api_key": "",
+            "embedding_url": f"{server.url}/api",
+            "embedding_interface_format": "Ollama",
+            "embedding_model_name": "mock-embedding"
+        }
+        if embedding_backend == "local":
+            embedding.update(embedding_url="", embedding_interface_format="Local", embedding_model_name="local-ngram-512")
+
+        def measure(stage, func):
+            before = server.stats()
+            started = time.perf_counter()
+            with FileIOCounter(workdir) as io_counter:
+                try:
+                    func()
+                except Exception as e:
+                    logging.error(f"[benchmark] Stage '{stage}' failed: {e}")
+                    stages[stage]["errors"] += 1
+            elapsed = time.perf_counter() - started
+            after = server.stats()
+            result = stages[stage]
+            result["runs"] += 1
+            result["wall_seconds"] += elapsed
+            result["llm_calls"] += sum(after["by_endpoint"].get(e, 0) - before["by_endpoint"].get(e, 0) for e in LLM_ENDPOINTS)
+            result["embedding_calls"] += sum(after["by_endpoint"].get(e, 0) - before["by_endpoint"].get(e, 0) for e in EMBEDDING_ENDPOINTS)
+            for key in ("prompt_bytes", "prompt_tokens", "completion_tokens"):
+                result[key] += after[key] - before[key]
+            result["file_read_bytes"] += io_counter.read_bytes
+            result["file_write_bytes"] += io_counter.write_bytes
+            result["peak_rss_mb"] = peak_rss_mb()
+
+        try:
+            measure("architecture", lambda: Novel_architecture_generate(
+                interface_format=llm["interface_format"], api_key=llm["api_key"], base_url=llm["base_url"],
+                llm_model="mock-model", topic="雨夜来信", genre="悬疑", number_of_chapters=chapters,
+                word_number=word_number, filepath=workdir, temperature=llm["temperature"],
+                max_tokens=llm["max_tokens"], timeout=llm["timeout"]
+            ))
+            measure("blueprint", lambda: Chapter_blueprint_generate(
+                interface_format=llm["interface_format"], api_key=llm["api_key"], base_url=llm["base_url"],
+                llm_model="mock-model", filepath=workdir, number_of_chapters=chapters,
+                temperature=llm["temperature"], max_tokens=llm["max_tokens"], timeout=llm["timeout"]
+            ))
+            for novel_number in range(1, chapters + 1):
+                measure("draft", lambda: generate_chapter_draft(
+                    api_key=llm["api_key"], base_url=llm["base_url"], model_name="mock-model", filepath=workdir,
+                    novel_number=novel_number, word_number=word_number, temperature=llm["temperature"],
+                    user_guidance="", characters_involved="", key_items="", scene_location="", time_constraint="",
+                    embedding_retrieval_k=2, interface_format=llm["interface_format"],
+                    max_tokens=llm["max_tokens"], timeout=llm["timeout"], **embedding
+                ))
+                measure("finalize", lambda: finalize_chapter(
+                    novel_number=novel_number, word_number=word_number, api_key=llm["api_key"],
+                    base_url=llm["base_url"], model_name="mock-model", temperature=llm["temperature"],
+                    filepath=workdir, interface_format=llm["interface_format"],
+                    max_tokens=llm["max_tokens"], timeout=llm["timeout"], **embedding
+                ))
+        finally:
+            if owns_workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    for result in stages.values():
+        result["wall_seconds"] = round(result["wall_seconds"], 4)
+    return {
+        "config": {
+            "chapters": chapters,
+            "word_number": word_number,
+            "latency": latency if isinstance(latency, (str, int, float, type(None))) else repr(latency),
+            "chars_per_second": chars_per_second,
+            "max_tokens": max_tokens,
+            "python": platform.python_version(),
+            "platform": platform.platform()
+        },
+        "stages": stages,
+        "total_wall_seconds": round(sum(r["wall_seconds"] for r in stages.values()), 4),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float = 0.2, min_delta_seconds: float = 0.05) -> list:
+    """
+    返回相对基线退化超过 threshold（比例）的指标说明列表，空列表表示无退化。
+    耗时类指标还需超出 min_delta_seconds 的绝对差，避免极短阶段的抖动误报。
+    """
+    regressions = []
+    for stage, base in baseline.get("stages", {}).items():
+        current = results.get("stages", {}).get(stage)
+        if current is None:
+            continue
+        for metric in _TIMED_METRICS + _COUNTED_METRICS + ("peak_rss_mb",):
+            base_value = base.get(metric)
+            value = current.get(metric)
+            if base_value is None or value is None:
+                continue
+            limit = base_value * (1 + threshold)
+            if value <= limit:
+                continue
+            if metric in _TIMED_METRICS and value - base_value < min_delta_seconds:
+                continue
+            regressions.append(f"{stage}.{metric}: {base_value} -> {value} (+{(value / base_value - 1) * 100 if base_value else float('inf'):.1f}%)")
+    return regressions
+
+
+def format_report(results: dict) -> str:
+    header = f"{'stage':<14}{'runs':>6}{'wall(s)':>10}{'llm':>6}{'embed':>7}{'prompt KB':>11}{'read KB':>9}{'write KB':>10}{'rss MB':>9}"
+    lines = [header, "-" * len(header)]
+    for stage in STAGES:
+        r = results["stages"][stage]
+        lines.append(
+            f"{stage:<14}{r['runs']:>6}{r['wall_seconds']:>10.3f}{r['llm_calls']:>6}{r['embedding_calls']:>7}"
+            f"{r['prompt_bytes'] / 1024:>11.1f}{r['file_read_bytes'] / 1024:>9.1f}{r['file_write_bytes'] / 1024:>10.1f}"
+            f"{(r['peak_rss_mb'] if r['peak_rss_mb'] is not None else float('nan')):>9.1f}"
+        )
+    lines.append(f"total wall time: {results['total_wall_seconds']:.3f}s")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="端到端生成流程基准测试（本地模拟 LLM）")
+    parser.add_argument("--chapters", type=int, default=3)
+    parser.add_argument("--word-number", type=int, default=800)
+    parser.add_argument("--latency", default=None, help="模拟 LLM 延迟分布，如 fixed:0.05")
+    parser.add_argument("--chars-per-second", type=float, default=None, help="模拟流式输出速率")
+    parser.add_argument("--max-tokens", type=int, default=4096)
+    parser.add_argument("--workdir", default=None, help="保留输出文件的目录（默认使用临时目录）")
+    parser.add_argument("--output", default=None, help="将本次结果写入 JSON 文件")
+    parser.add_argument("--baseline", default=None, help="与该 JSON 基线比较")
+    parser.add_argument("--write-baseline", default=None, help="将本次结果写为新的基线")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许的退化比例（默认 0.2 即 20%%）")
+    parser.add_argument("--embedding", choices=("mock", "local"), default="mock", help="embedding 后端")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run_benchmark(
+        chapters=args.chapters,
+        word_number=args.word_number,
+        latency=args.latency,
+        chars_per_second=args.chars_per_second,
+        max_tokens=args.max_tokens,
+        workdir=args.workdir,
+        embedding_backend=args.embedding
+    )
+    print(format_report(results))
+
+    for path in (args.output, args.write_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, threshold=args.threshold)
+        if regressions:
+            print("Regressions beyond threshold:")
+            for item in regressions:
+                print(f"  - {item}")
+            return 1
+        print("No regressions beyond threshold.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,9 +2,23 @@
 # -*- coding: utf-8 -*-
 import json
 import os
+import logging
 import threading
-from llm_adapters import create_llm_adapter
+from llm_adapters import create_llm_adapter, configure_llm_routing
 from embedding_adapters import create_embedding_adapter
+from http_transport import configure_http_pool
+from novel_generator.llm_cache import configure_llm_cache
+from rate_limiter import configure_rate_limit
+
+_ROUTING_OPTIONS = ("hedge_percentile", "initial_hedge_delay", "min_hedge_delay", "min_samples", "window_size")
+_HTTP_POOL_OPTIONS = ("pool_connections", "pool_maxsize", "keepalive_expiry")
+_LLM_CACHE_OPTIONS = {"max_entries": int, "max_bytes": int, "ttl_seconds": float}
+_RATE_LIMIT_OPTIONS = {"rpm": float, "tpm": float, "max_concurrency": int, "min_concurrency": int}
+DEFAULT_LLM_CACHE_PATH = "llm_cache.sqlite"
+# 由 apply_runtime_config 应用的 config.json 配置段（界面不编辑，保存配置时需原样保留）
+RUNTIME_CONFIG_SECTIONS = ("llm_routing", "http_pool", "llm_cache", "rate_limits")
+# 由 "rate_limits" 配置过的 provider；从配置中删除后恢复默认限流参数
+_rate_limited_providers = set()
 
 
 def load_config(config_file: str) -> dict:
@@ -26,6 +40,110 @@ def save_config(config_data: dict, config_file: str) -> bool:
     except:
         return False
 
+def apply_llm_routing_config(config_data: dict) -> bool:
+    """
+    按 config.json 中的 "llm_routing" 配置多服务商对冲/故障转移路由，返回是否启用。
+    "fallbacks" 为备用服务商在 "llm_configs" 中的名称列表，其余键（hedge_percentile、
+    initial_hedge_delay、min_hedge_delay、min_samples、window_size）原样传给 HedgedRoutingAdapter。
+    例：{"llm_routing": {"enabled": true, "fallbacks": ["DeepSeek", "Gemini"], "initial_hedge_delay": 60}}
+    """
+    routing = dict((config_data or {}).get("llm_routing") or {})
+    llm_configs = (config_data or {}).get("llm_configs", {})
+    enabled = bool(routing.pop("enabled", True))
+    fallbacks = []
+    for name in routing.pop("fallbacks", []):
+        conf = llm_configs.get(name)
+        if conf is None:
+            logging.warning(f"[llm_routing] Fallback provider '{name}' not found in llm_configs, skipped.")
+            continue
+        fallbacks.append({
+            "interface_format": name,
+            "base_url": conf.get("base_url", ""),
+            "model_name": conf.get("model_name", ""),
+            "api_key": conf.get("api_key", "")
+        })
+    options = {k: routing[k] for k in _ROUTING_OPTIONS if k in routing}
+    configure_llm_routing(fallbacks, enabled=enabled and bool(fallbacks), **options)
+    return enabled and bool(fallbacks)
+
+def apply_http_pool_config(config_data: dict) -> bool:
+    """
+    按 config.json 中的 "http_pool" 调整共享 HTTP 连接池大小，返回参数是否有变化（有变化时重建连接池）。
+    例：{"http_pool": {"pool_connections": 10, "pool_maxsize": 32, "keepalive_expiry": 60}}
+    """
+    pool = (config_data or {}).get("http_pool") or {}
+    options = {}
+    for key in _HTTP_POOL_OPTIONS:
+        if key not in pool:
+            continue
+        try:
+            options[key] = float(pool[key]) if key == "keepalive_expiry" else int(pool[key])
+        except (TypeError, ValueError):
+            logging.warning(f"[http_pool] Invalid value for '{key}': {pool[key]!r}, skipped.")
+    return configure_http_pool(**options) if options else False
+
+def apply_llm_cache_config(config_data: dict) -> bool:
+    """
+    按 config.json 中的 "llm_cache" 启用或关闭 LLM 响应缓存，返回是否启用。
+    "path" 缺省为 llm_cache.sqlite；max_entries、max_bytes、ttl_seconds、stages、exclude_stages 透传给 LLMResponseCache。
+    没有该配置段时保持现状（仍可用环境变量 NOVEL_LLM_CACHE_PATH 启用）。
+    例：{"llm_cache": {"enabled": true, "path": "llm_cache.sqlite", "ttl_seconds": 604800, "exclude_stages": ["draft"]}}
+    """
+    section = (config_data or {}).get("llm_cache")
+    if section is None:
+        return False
+    if not section.get("enabled", True):
+        configure_llm_cache(None)
+        return False
+    options = {}
+    for key, cast in _LLM_CACHE_OPTIONS.items():
+        if key not in section:
+            continue
+        try:
+            options[key] = cast(section[key])
+        except (TypeError, ValueError):
+            logging.warning(f"[llm_cache] Invalid value for '{key}': {section[key]!r}, skipped.")
+    for key in ("stages", "exclude_stages"):
+        if isinstance(section.get(key), list):
+            options[key] = tuple(section[key])
+    path = str(section.get("path") or DEFAULT_LLM_CACHE_PATH).strip()
+    return configure_llm_cache(path, **options) is not None
+
+def apply_rate_limit_config(config_data: dict) -> list:
+    """
+    按 config.json 中的 "rate_limits" 为各 provider（interface_format，embedding 为 "<provider> embedding"）
+    设置限流参数（rpm、tpm、max_concurrency、min_concurrency），返回参数有变化的 provider 列表。
+    之前配置过、现已从配置中删除的 provider 恢复默认参数。
+    例：{"rate_limits": {"OpenAI": {"rpm": 60, "tpm": 90000, "max_concurrency": 4}, "OpenAI embedding": {"rpm": 300}}}
+    """
+    limits = (config_data or {}).get("rate_limits") or {}
+    changed = []
+    for provider, limit in limits.items():
+        options = {}
+        for key, cast in _RATE_LIMIT_OPTIONS.items():
+            if (limit or {}).get(key) is None:
+                continue
+            try:
+                options[key] = cast(limit[key])
+            except (TypeError, ValueError):
+                logging.warning(f"[rate_limits] Invalid value for '{provider}.{key}': {limit[key]!r}, skipped.")
+        if configure_rate_limit(provider, **options):
+            changed.append(provider)
+    configured = {provider.strip().lower() for provider in limits}
+    for provider in _rate_limited_providers - configured:
+        if configure_rate_limit(provider):
+            changed.append(provider)
+    _rate_limited_providers.clear()
+    _rate_limited_providers.update(configured)
+    return changed
+
+def apply_runtime_config(config_data: dict):
+    """加载或保存 config.json 后调用：应用路由、连接池、响应缓存、限流等运行时配置"""
+    apply_llm_routing_config(config_data)
+    apply_http_pool_config(config_data)
+    apply_llm_cache_config(config_data)
+    apply_rate_limit_config(config_data)
+
 def test_llm_config(interface_format, api_key, base_url, model_name, temperature, max_tokens, timeout, log_func, handle_exception_func):
     """测试当前的LLM配置是否可用"""
     def task():
@@ -38,7 +156,8 @@ def test_llm_config(interface_format, api_key, base_url, model_name, temperature
                 api_key=api_key,
                 temperature=temperature,
                 max_tokens=max_tokens,
-                timeout=timeout
+                timeout=timeout,
+                routing=False  # 只测试当前这一个服务商
             )
 
             test_prompt = "Please reply 'OK'"
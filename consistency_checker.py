@@ -1,6 +1,8 @@
 # consistency_checker.py
 # -*- coding: utf-8 -*-
 from llm_adapters import create_llm_adapter
+from llm_telemetry import LLMCallTracker
+from llm_logging import log_llm_text, should_sample, PROMPT, RESPONSE
 
 # ============== 增加对“剧情要点/未解决冲突”进行检查的可选引导 ==============
 CONSISTENCY_PROMPT = """\
@@ -59,14 +61,19 @@ def check_consistency(
         timeout=timeout
     )
 
-    # 调试日志
-    print("\n[ConsistencyChecker] Prompt >>>", prompt)
+    sampled = should_sample()
+    log_llm_text(PROMPT, prompt, stage="consistency", source="check_consistency", sampled=sampled)
 
-    response = llm_adapter.invoke(prompt)
+    tracker = LLMCallTracker(llm_adapter, prompt, stage="consistency")
+    tracker.attempts = 1
+    try:
+        response = llm_adapter.invoke(prompt)
+    except Exception as e:
+        tracker.finish(error=e)
+        raise
+    tracker.finish(response)
+    log_llm_text(RESPONSE, response, stage="consistency", source="check_consistency", sampled=sampled)
     if not response:
         return "审校Agent无回复"
-    
-    # 调试日志
-    print("[ConsistencyChecker] Response <<<", response)
 
     return response
@@ -1,10 +1,34 @@
 # embedding_adapters.py
 # -*- coding: utf-8 -*-
+import asyncio
 import logging
 import traceback
 from typing import List
 import requests
-from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
+from http_transport import get_http_session, get_httpx_client, get_async_httpx_client, on_http_pool_reset
+from adapter_registry import AdapterRegistry, fingerprint_secret
+from rate_limiter import get_rate_limiter
+from retry_policy import get_status_code
+
+# 批量向量化默认参数：单批最多条数、单批文本总字符数（避免触发服务端请求体大小限制）
+DEFAULT_EMBEDDING_BATCH_SIZE = 64
+DEFAULT_EMBEDDING_BATCH_CHARS = 100000
+
+# 服务端以 400/422 拒绝超大批次时，错误信息中常见的提示词
+_PAYLOAD_LIMIT_HINTS = ("too large", "too long", "too many", "exceed", "at most", "maximum", "limit")
+
+class EmbeddingError(list):
+    """
+    适配器捕获请求异常后返回的空向量：与 [] 行为一致（为假、长度为 0），
+    同时以 .error 保留原始异常，供并发执行层按 retry_policy 分类（鉴权失败、4xx 等不可重试错误立即放弃）。
+    """
+    def __init__(self, error: Exception):
+        super().__init__()
+        self.error = error
+
+def embedding_error(vector):
+    """返回失败向量携带的异常；正常向量或不带异常信息的空向量返回 None"""
+    return getattr(vector, "error", None)
 
 def ensure_openai_base_url_has_v1(url: str) -> str:
     """
@@ -19,25 +43,133 @@ def ensure_openai_base_url_has_v1(url: str) -> str:
             url = url.rstrip('/') + '/v1'
     return url
 
+def split_into_batches(texts: List[str], batch_size: int, max_batch_chars: int) -> List[List[str]]:
+    """
+    按条数与总字符数将 texts 切分为多批，保持原有顺序。单条超长文本独占一批。
+    """
+    batches, current, current_chars = [], [], 0
+    for text in texts:
+        size = len(text or "")
+        if current and (len(current) >= batch_size or current_chars + size > max_batch_chars):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(text)
+        current_chars += size
+    if current:
+        batches.append(current)
+    return batches
+
+def _is_payload_too_large(exc: Exception) -> bool:
+    """判断异常是否由批次过大引起（413，或 400/422 且错误信息提示超限）"""
+    status = get_status_code(exc)
+    if status == 413:
+        return True
+    if status not in (400, 422):
+        return False
+    response = getattr(exc, "response", None)
+    detail = f"{exc} {getattr(response, 'text', '') or ''}".lower()
+    return any(hint in detail for hint in _PAYLOAD_LIMIT_HINTS)
+
+def _check_batch_result(batch: List[str], vectors) -> List[List[float]]:
+    if not isinstance(vectors, list) or len(vectors) != len(batch):
+        count = len(vectors) if isinstance(vectors, list) else type(vectors).__name__
+        raise ValueError(f"Expected {len(batch)} embeddings, got {count}")
+    return vectors
+
+def _embed_batch_with_split(batch: List[str], embed_batch, label: str) -> List[List[float]]:
+    try:
+        return _check_batch_result(batch, embed_batch(batch))
+    except Exception as e:
+        if len(batch) > 1 and _is_payload_too_large(e):
+            mid = len(batch) // 2
+            logging.warning(f"{label} batch of {len(batch)} exceeds payload limit, splitting: {e}")
+            return (_embed_batch_with_split(batch[:mid], embed_batch, label)
+                    + _embed_batch_with_split(batch[mid:], embed_batch, label))
+        logging.error(f"{label} batch embeddings error: {e}")
+        return [EmbeddingError(e) for _ in batch]
+
+async def _aembed_batch_with_split(batch: List[str], aembed_batch, label: str) -> List[List[float]]:
+    try:
+        return _check_batch_result(batch, await aembed_batch(batch))
+    except Exception as e:
+        if len(batch) > 1 and _is_payload_too_large(e):
+            mid = len(batch) // 2
+            logging.warning(f"{label} batch of {len(batch)} exceeds payload limit, splitting: {e}")
+            return (await _aembed_batch_with_split(batch[:mid], aembed_batch, label)
+                    + await _aembed_batch_with_split(batch[mid:], aembed_batch, label))
+        logging.error(f"{label} async batch embeddings error: {e}")
+        return [EmbeddingError(e) for _ in batch]
+
+def embed_in_batches(texts: List[str], embed_batch, batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+                     max_batch_chars: int = DEFAULT_EMBEDDING_BATCH_CHARS, label: str = "Embedding") -> List[List[float]]:
+    """
+    将 texts 分批交给 embed_batch(batch) -> List[List[float]]，按原顺序拼接结果。
+    服务端因批次过大拒绝时自动对半拆分重发；其他错误记录日志，该批返回携带异常的空向量 EmbeddingError（与逐条调用时的行为一致）。
+    """
+    embeddings = []
+    for batch in split_into_batches(texts, batch_size, max_batch_chars):
+        embeddings.extend(_embed_batch_with_split(batch, embed_batch, label))
+    return embeddings
+
+async def aembed_in_batches(texts: List[str], aembed_batch, batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+                            max_batch_chars: int = DEFAULT_EMBEDDING_BATCH_CHARS, label: str = "Embedding") -> List[List[float]]:
+    """embed_in_batches 的异步版本，各批次并发发送"""
+    batches = split_into_batches(texts, batch_size, max_batch_chars)
+    results = await asyncio.gather(*(_aembed_batch_with_split(b, aembed_batch, label) for b in batches))
+    return [vec for batch_vectors in results for vec in batch_vectors]
+
 class BaseEmbeddingAdapter:
     """
     Embedding 接口统一基类
     """
+    # 由 create_embedding_adapter 注入的 (provider, api_key) 级共享限流器
+    rate_limiter = None
+    # embed_documents 是否以批量请求发送；为 False 时并发执行层逐条切块
+    supports_batch = False
+    # embed_queries 是否以批量请求发送（查询与文档向量化方式相同的适配器）；为 False 时逐条调用 embed_query
+    supports_query_batch = False
+
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         raise NotImplementedError
 
     def embed_query(self, query: str) -> List[float]:
         raise NotImplementedError
 
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        批量向量化查询，结果与逐条 embed_query 一致（不可用 embed_documents 代替：
+        部分 provider 对查询与文档使用不同的任务类型）。默认逐条调用，子类可覆盖为批量请求。
+        """
+        return [self.embed_query(query) for query in queries]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        异步批量向量化。默认在线程池中执行 embed_documents，子类可覆盖为原生异步实现。
+        """
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return await asyncio.to_thread(self.embed_query, query)
+
+    async def aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*(self.aembed_query(query) for query in queries)))
+
 class OpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
     """
     基于 OpenAIEmbeddings（或兼容接口）的适配器
     """
+    supports_batch = True
+
     def __init__(self, api_key: str, base_url: str, model_name: str):
+        openai_api_base = ensure_openai_base_url_has_v1(base_url)
+        self.model_name = model_name
+        from langchain_openai import OpenAIEmbeddings  # 延迟导入，避免启动时加载 SDK
         self._embedding = OpenAIEmbeddings(
             openai_api_key=api_key,
-            openai_api_base=ensure_openai_base_url_has_v1(base_url),
-            model=model_name
+            openai_api_base=openai_api_base,
+            model=model_name,
+            max_retries=0,  # 重试统一由 call_with_retry / retry_policy 处理
+            http_client=get_httpx_client(openai_api_base)
         )
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
@@ -46,10 +178,18 @@ class OpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
     def embed_query(self, query: str) -> List[float]:
         return self._embedding.embed_query(query)
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._embedding.aembed_documents(texts)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return await self._embedding.aembed_query(query)
+
 class AzureOpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
     """
     基于 AzureOpenAIEmbeddings（或兼容接口）的适配器
     """
+    supports_batch = True
+
     def __init__(self, api_key: str, base_url: str, model_name: str):
         import re
         match = re.match(r'https://(.+?)/openai/deployments/(.+?)/embeddings\?api-version=(.+)', base_url)
@@ -59,12 +199,16 @@ class AzureOpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
             self.api_version = match.group(3)
         else:
             raise ValueError("Invalid Azure OpenAI base_url format")
+        self.model_name = model_name
         
+        from langchain_openai import AzureOpenAIEmbeddings
         self._embedding = AzureOpenAIEmbeddings(
             azure_endpoint=self.azure_endpoint,
             azure_deployment=self.azure_deployment,
             openai_api_key=api_key,
             api_version=self.api_version,
+            max_retries=0,
+            http_client=get_httpx_client(self.azure_endpoint)
         )
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
@@ -73,28 +217,53 @@ class AzureOpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
     def embed_query(self, query: str) -> List[float]:
         return self._embedding.embed_query(query)
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._embedding.aembed_documents(texts)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return await self._embedding.aembed_query(query)
+
+def _l2_normalize(vector: List[float]) -> List[float]:
+    import math
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm > 0 else list(vector)
+
 class OllamaEmbeddingAdapter(BaseEmbeddingAdapter):
     """
-    其接口路径为 /api/embeddings
+    优先使用批量接口 /api/embed（input 为列表）；旧版 Ollama 没有该接口时自动回退到逐条调用 /api/embeddings。
+    /api/embed 返回归一化后的向量，回退接口的结果也做 L2 归一化，保证两条路径的向量同分布。
+    旧版本（只用 /api/embeddings、未归一化）构建的向量库与缓存使用不同的模型标识（见 model_id_tag），
+    打开时校验不通过，需清空后重建。
     """
-    def __init__(self, model_name: str, base_url: str):
+    model_id_tag = "embed"
+    def __init__(self, model_name: str, base_url: str,
+                 batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+                 max_batch_chars: int = DEFAULT_EMBEDDING_BATCH_CHARS):
         self.model_name = model_name
         self.base_url = base_url.rstrip("/")
+        self.batch_size = max(1, int(batch_size))
+        self.max_batch_chars = max(1, int(max_batch_chars))
+        self._batch_supported = True
+
+    @property
+    def supports_batch(self) -> bool:
+        return self._batch_supported
+
+    @property
+    def supports_query_batch(self) -> bool:
+        return self._batch_supported
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in texts:
-            vec = self._embed_single(text)
-            embeddings.append(vec)
-        return embeddings
+        return embed_in_batches(texts, self._embed_batch, self.batch_size, self.max_batch_chars, "Ollama")
 
     def embed_query(self, query: str) -> List[float]:
-        return self._embed_single(query)
+        # 与文档走同一接口，保证查询向量与文档向量同分布
+        return self.embed_documents([query])[0]
 
-    def _embed_single(self, text: str) -> List[float]:
-        """
-        调用 Ollama 本地服务 /api/embeddings 接口，获取文本 embedding
-        """
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return self.embed_documents(queries)
+
+    def _endpoint_url(self) -> str:
         url = self.base_url.rstrip("/")
         if "/api/embeddings" not in url:
             if "/api" in url:
@@ -103,26 +272,99 @@ class OllamaEmbeddingAdapter(BaseEmbeddingAdapter):
                 if "/v1" in url:
                     url = url[:url.index("/v1")]
                 url = f"{url}/api/embeddings"
+        return url
+
+    def _batch_endpoint_url(self) -> str:
+        url = self._endpoint_url()
+        return url[:url.rindex("/api/embeddings")] + "/api/embed"
+
+    def _batch_unsupported(self, response) -> bool:
+        """/api/embed 不存在（旧版 Ollama）时返回 404 且不涉及模型；模型不存在的 404 不回退"""
+        if response.status_code != 404 or "model" in response.text.lower():
+            return False
+        logging.warning("Ollama /api/embed not available, falling back to /api/embeddings per text.")
+        self._batch_supported = False
+        return True
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        if not self._batch_supported:
+            return [self._embed_single(text) for text in batch]
+        url = self._batch_endpoint_url()
+        response = get_http_session(url).post(url, json={"model": self.model_name, "input": batch})
+        if self._batch_unsupported(response):
+            return [self._embed_single(text) for text in batch]
+        response.raise_for_status()
+        result = response.json()
+        if "embeddings" not in result:
+            raise ValueError("No 'embeddings' field in Ollama response.")
+        return result["embeddings"]
 
+    async def _aembed_batch(self, batch: List[str]) -> List[List[float]]:
+        if not self._batch_supported:
+            return list(await asyncio.gather(*(self._aembed_single(text) for text in batch)))
+        url = self._batch_endpoint_url()
+        response = await get_async_httpx_client(url).post(url, json={"model": self.model_name, "input": batch})
+        if self._batch_unsupported(response):
+            return list(await asyncio.gather(*(self._aembed_single(text) for text in batch)))
+        response.raise_for_status()
+        result = response.json()
+        if "embeddings" not in result:
+            raise ValueError("No 'embeddings' field in Ollama response.")
+        return result["embeddings"]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await aembed_in_batches(texts, self._aembed_batch, self.batch_size, self.max_batch_chars, "Ollama")
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return (await self.aembed_documents([query]))[0]
+
+    async def aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        return await self.aembed_documents(queries)
+
+    async def _aembed_single(self, text: str) -> List[float]:
+        url = self._endpoint_url()
         data = {
             "model": self.model_name,
             "prompt": text
         }
         try:
-            response = requests.post(url, json=data)
+            response = await get_async_httpx_client(url).post(url, json=data)
             response.raise_for_status()
             result = response.json()
             if "embedding" not in result:
                 raise ValueError("No 'embedding' field in Ollama response.")
-            return result["embedding"]
+            return _l2_normalize(result["embedding"])
+        except Exception as e:
+            logging.error(f"Ollama async embeddings request error: {e}")
+            return EmbeddingError(e)
+
+    def _embed_single(self, text: str) -> List[float]:
+        """
+        调用 Ollama 本地服务 /api/embeddings 接口，获取文本 embedding
+        """
+        url = self._endpoint_url()
+
+        data = {
+            "model": self.model_name,
+            "prompt": text
+        }
+        try:
+            response = get_http_session(url).post(url, json=data)
+            response.raise_for_status()
+            result = response.json()
+            if "embedding" not in result:
+                raise ValueError("No 'embedding' field in Ollama response.")
+            return _l2_normalize(result["embedding"])
         except requests.exceptions.RequestException as e:
             logging.error(f"Ollama embeddings request error: {e}\n{traceback.format_exc()}")
-            return []
+            return EmbeddingError(e)
 
 class MLStudioEmbeddingAdapter(BaseEmbeddingAdapter):
     """
     基于 LM Studio 的 embedding 适配器
     """
+    supports_batch = True
+
     def __init__(self, api_key: str, base_url: str, model_name: str):
         self.url = ensure_openai_base_url_has_v1(base_url)
         if not self.url.endswith('/embeddings'):
@@ -140,7 +382,7 @@ class MLStudioEmbeddingAdapter(BaseEmbeddingAdapter):
                 "input": texts,
                 "model": self.model_name
             }
-            response = requests.post(self.url, json=payload, headers=self.headers)
+            response = get_http_session(self.url).post(self.url, json=payload, headers=self.headers)
             response.raise_for_status()
             result = response.json()
             if "data" not in result:
@@ -149,10 +391,10 @@ class MLStudioEmbeddingAdapter(BaseEmbeddingAdapter):
             return [item.get("embedding", []) for item in result["data"]]
         except requests.exceptions.RequestException as e:
             logging.error(f"LM Studio API request failed: {str(e)}")
-            return [[]] * len(texts)
+            return [EmbeddingError(e)] * len(texts)
         except (KeyError, IndexError, ValueError, TypeError) as e:
             logging.error(f"Error parsing LM Studio API response: {str(e)}")
-            return [[]] * len(texts)
+            return [EmbeddingError(e)] * len(texts)
 
     def embed_query(self, query: str) -> List[float]:
         try:
@@ -160,7 +402,7 @@ class MLStudioEmbeddingAdapter(BaseEmbeddingAdapter):
                 "input": query,
                 "model": self.model_name
             }
-            response = requests.post(self.url, json=payload, headers=self.headers)
+            response = get_http_session(self.url).post(self.url, json=payload, headers=self.headers)
             response.raise_for_status()
             result = response.json()
             if "data" not in result or not result["data"]:
@@ -169,10 +411,27 @@ class MLStudioEmbeddingAdapter(BaseEmbeddingAdapter):
             return result["data"][0].get("embedding", [])
         except requests.exceptions.RequestException as e:
             logging.error(f"LM Studio API request failed: {str(e)}")
-            return []
+            return EmbeddingError(e)
         except (KeyError, IndexError, ValueError, TypeError) as e:
             logging.error(f"Error parsing LM Studio API response: {str(e)}")
-            return []
+            return EmbeddingError(e)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        try:
+            payload = {
+                "input": texts,
+                "model": self.model_name
+            }
+            response = await get_async_httpx_client(self.url).post(self.url, json=payload, headers=self.headers)
+            response.raise_for_status()
+            result = response.json()
+            if "data" not in result:
+                logging.error(f"Invalid response format from LM Studio API: {result}")
+                return [[]] * len(texts)
+            return [item.get("embedding", []) for item in result["data"]]
+        except Exception as e:
+            logging.error(f"LM Studio async API request failed: {str(e)}")
+            return [EmbeddingError(e)] * len(texts)
 
 class GeminiEmbeddingAdapter(BaseEmbeddingAdapter):
     """
@@ -180,30 +439,32 @@ class GeminiEmbeddingAdapter(BaseEmbeddingAdapter):
     使用直接 POST 请求方式，URL 示例：
     https://generativelanguage.googleapis.com/v1beta/models/text-embedding-004:embedContent?key=YOUR_API_KEY
     """
-    def __init__(self, api_key: str, model_name: str, base_url: str):
+    # batchEmbedContents 单次最多 100 条
+    MAX_BATCH_SIZE = 100
+    supports_batch = True
+
+    def __init__(self, api_key: str, model_name: str, base_url: str,
+                 batch_size: int = MAX_BATCH_SIZE,
+                 max_batch_chars: int = DEFAULT_EMBEDDING_BATCH_CHARS):
         """
         :param api_key: 传入的 Google API Key
         :param model_name: 这里一般是 "text-embedding-004"
         :param base_url: e.g. https://generativelanguage.googleapis.com/v1beta/models
+        :param batch_size: embed_documents 每次 batchEmbedContents 请求的最大条数
         """
         self.api_key = api_key
         self.model_name = model_name
         self.base_url = base_url.rstrip("/")
+        self.batch_size = min(max(1, int(batch_size)), self.MAX_BATCH_SIZE)
+        self.max_batch_chars = max(1, int(max_batch_chars))
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in texts:
-            vec = self._embed_single(text)
-            embeddings.append(vec)
-        return embeddings
+        return embed_in_batches(texts, self._embed_batch, self.batch_size, self.max_batch_chars, "Gemini")
 
     def embed_query(self, query: str) -> List[float]:
         return self._embed_single(query)
 
-    def _embed_single(self, text: str) -> List[float]:
-        """
-        直接调用 Google Generative Language API (Gemini) 接口，获取文本 embedding
-        """
+    def _build_request(self, text: str):
         url = f"{self.base_url}/{self.model_name}:embedContent?key={self.api_key}"
         payload = {
             "model": self.model_name,
@@ -213,30 +474,89 @@ class GeminiEmbeddingAdapter(BaseEmbeddingAdapter):
                 ]
             }
         }
+        return url, payload
+
+    def _build_batch_request(self, batch: List[str]):
+        url = f"{self.base_url}/{self.model_name}:batchEmbedContents?key={self.api_key}"
+        # 批量接口要求每个子请求的 model 带 "models/" 前缀
+        model = self.model_name if self.model_name.startswith("models/") else f"models/{self.model_name}"
+        payload = {
+            "requests": [
+                {"model": model, "content": {"parts": [{"text": text}]}}
+                for text in batch
+            ]
+        }
+        return url, payload
+
+    @staticmethod
+    def _parse_batch_response(result: dict) -> List[List[float]]:
+        return [item.get("values", []) for item in result.get("embeddings", [])]
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        url, payload = self._build_batch_request(batch)
+        response = get_http_session(url).post(url, json=payload)
+        response.raise_for_status()
+        return self._parse_batch_response(response.json())
+
+    async def _aembed_batch(self, batch: List[str]) -> List[List[float]]:
+        url, payload = self._build_batch_request(batch)
+        response = await get_async_httpx_client(url).post(url, json=payload)
+        response.raise_for_status()
+        return self._parse_batch_response(response.json())
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await aembed_in_batches(texts, self._aembed_batch, self.batch_size, self.max_batch_chars, "Gemini")
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return await self._aembed_single(query)
+
+    async def _aembed_single(self, text: str) -> List[float]:
+        url, payload = self._build_request(text)
+        try:
+            response = await get_async_httpx_client(url).post(url, json=payload)
+            response.raise_for_status()
+            result = response.json()
+            return result.get("embedding", {}).get("values", [])
+        except Exception as e:
+            logging.error(f"Gemini async embed_content error: {e}")
+            return EmbeddingError(e)
+
+    def _embed_single(self, text: str) -> List[float]:
+        """
+        直接调用 Google Generative Language API (Gemini) 接口，获取文本 embedding
+        """
+        url, payload = self._build_request(text)
 
         try:
-            response = requests.post(url, json=payload)
-            print(response.text)
+            response = get_http_session(url).post(url, json=payload)
+            logging.debug(f"Gemini embed_content response: {response.text[:200]}")
             response.raise_for_status()
             result = response.json()
             embedding_data = result.get("embedding", {})
             return embedding_data.get("values", [])
         except requests.exceptions.RequestException as e:
             logging.error(f"Gemini embed_content request error: {e}\n{traceback.format_exc()}")
-            return []
+            return EmbeddingError(e)
         except Exception as e:
             logging.error(f"Gemini embed_content parse error: {e}\n{traceback.format_exc()}")
-            return []
+            return EmbeddingError(e)
 
 class SiliconFlowEmbeddingAdapter(BaseEmbeddingAdapter):
     """
-    基于 SiliconFlow 的 embedding 适配器
+    基于 SiliconFlow 的 embedding 适配器，embed_documents 以列表形式的 input 批量请求
     """
-    def __init__(self, api_key: str, base_url: str, model_name: str):
+    # SiliconFlow 单次请求 input 列表最多 32 条
+    MAX_BATCH_SIZE = 32
+    supports_batch = True
+
+    def __init__(self, api_key: str, base_url: str, model_name: str,
+                 batch_size: int = MAX_BATCH_SIZE,
+                 max_batch_chars: int = DEFAULT_EMBEDDING_BATCH_CHARS):
         # 自动为 base_url 添加 scheme（如果缺失）
         if not base_url.startswith("http://") and not base_url.startswith("https://"):
             base_url = "https://" + base_url
         self.url = base_url if base_url else "https://api.siliconflow.cn/v1/embeddings"
+        self.model_name = model_name
 
         self.payload = {
             "model": model_name,
@@ -247,33 +567,35 @@ class SiliconFlowEmbeddingAdapter(BaseEmbeddingAdapter):
             "Authorization": "Bearer {api_key}".format(api_key=api_key),
             "Content-Type": "application/json"
         }
+        self.batch_size = min(max(1, int(batch_size)), self.MAX_BATCH_SIZE)
+        self.max_batch_chars = max(1, int(max_batch_chars))
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in texts:
-            try:
-                self.payload["input"] = text
-                response = requests.post(self.url, json=self.payload, headers=self.headers)
-                response.raise_for_status()
-                result = response.json()
-                if not result or "data" not in result or not result["data"]:
-                    logging.error(f"Invalid response format from SiliconFlow API: {result}")
-                    embeddings.append([])
-                    continue
-                emb = result["data"][0].get("embedding", [])
-                embeddings.append(emb)
-            except requests.exceptions.RequestException as e:
-                logging.error(f"SiliconFlow API request failed: {str(e)}")
-                embeddings.append([])
-            except (KeyError, IndexError, ValueError, TypeError) as e:
-                logging.error(f"Error parsing SiliconFlow API response: {str(e)}")
-                embeddings.append([])
-        return embeddings
+        return embed_in_batches(texts, self._embed_batch, self.batch_size, self.max_batch_chars, "SiliconFlow")
+
+    @staticmethod
+    def _parse_batch_response(result: dict) -> List[List[float]]:
+        if not result or "data" not in result:
+            raise ValueError(f"Invalid response format from SiliconFlow API: {result}")
+        data = sorted(result["data"], key=lambda item: item.get("index", 0))
+        return [item.get("embedding", []) for item in data]
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        payload = dict(self.payload, input=batch)  # 适配器可能被多线程共享，不修改实例状态
+        response = get_http_session(self.url).post(self.url, json=payload, headers=self.headers)
+        response.raise_for_status()
+        return self._parse_batch_response(response.json())
+
+    async def _aembed_batch(self, batch: List[str]) -> List[List[float]]:
+        payload = dict(self.payload, input=batch)
+        response = await get_async_httpx_client(self.url).post(self.url, json=payload, headers=self.headers)
+        response.raise_for_status()
+        return self._parse_batch_response(response.json())
 
     def embed_query(self, query: str) -> List[float]:
         try:
-            self.payload["input"] = query
-            response = requests.post(self.url, json=self.payload, headers=self.headers)
+            payload = dict(self.payload, input=query)
+            response = get_http_session(self.url).post(self.url, json=payload, headers=self.headers)
             response.raise_for_status()
             result = response.json()
             if not result or "data" not in result or not result["data"]:
@@ -282,10 +604,115 @@ class SiliconFlowEmbeddingAdapter(BaseEmbeddingAdapter):
             return result["data"][0].get("embedding", [])
         except requests.exceptions.RequestException as e:
             logging.error(f"SiliconFlow API request failed: {str(e)}")
-            return []
+            return EmbeddingError(e)
         except (KeyError, IndexError, ValueError, TypeError) as e:
             logging.error(f"Error parsing SiliconFlow API response: {str(e)}")
+            return EmbeddingError(e)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await aembed_in_batches(texts, self._aembed_batch, self.batch_size, self.max_batch_chars, "SiliconFlow")
+
+    async def aembed_query(self, query: str) -> List[float]:
+        try:
+            payload = dict(self.payload, input=query)
+            response = await get_async_httpx_client(self.url).post(self.url, json=payload, headers=self.headers)
+            response.raise_for_status()
+            result = response.json()
+            if not result or "data" not in result or not result["data"]:
+                logging.error(f"Invalid response format from SiliconFlow API: {result}")
+                return []
+            return result["data"][0].get("embedding", [])
+        except Exception as e:
+            logging.error(f"SiliconFlow async API request failed: {str(e)}")
+            return EmbeddingError(e)
+
+class LocalEmbeddingAdapter(BaseEmbeddingAdapter):
+    """
+    离线本地 embedding：对文本做字符 n-gram（中日韩文字）与单词（字母数字）特征哈希，
+    带符号地累加到固定维度，按次线性词频加权后 L2 归一化。无需任何服务，结果跨进程稳定，
+    适用于断网环境、测试与基准测试。向量维度由 dim 显式指定，或取 model_name 末尾的数字，如 "local-ngram-512"；
+    末尾数字不在 [MIN_DIM, MAX_DIM] 内（如 "bge-m3" 的 3）时视为模型名的一部分，改用 DEFAULT_DIM。
+    维度与模型名不一致时通过 model_id_tag 区分，避免与按旧规则建立的向量库、缓存混用。
+    """
+    supports_batch = True
+    supports_query_batch = True
+    batch_size = 1024
+
+    DEFAULT_DIM = 512
+    MIN_DIM = 16
+    MAX_DIM = 16384
+    _CJK_RUN = r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+'
+    _WORD = r'[A-Za-z0-9_]+'
+
+    def __init__(self, model_name: str = "", ngram_max: int = 2, dim: int = None):
+        import re
+        self.model_name = model_name or f"local-ngram-{self.DEFAULT_DIM}"
+        match = re.search(r'(\d+)$', self.model_name)
+        named_dim = int(match.group(1)) if match else None
+        if dim is None:
+            dim = named_dim if named_dim and self.MIN_DIM <= named_dim <= self.MAX_DIM else self.DEFAULT_DIM
+            if named_dim and dim != named_dim:
+                logging.warning(
+                    f"Local embedding model '{self.model_name}': trailing number {named_dim} is not a usable "
+                    f"dimension ({self.MIN_DIM}-{self.MAX_DIM}), using {dim}."
+                )
+        elif not self.MIN_DIM <= int(dim) <= self.MAX_DIM:
+            raise ValueError(f"Local embedding dim must be between {self.MIN_DIM} and {self.MAX_DIM}, got {dim}")
+        self.dim = int(dim)
+        if self.dim != named_dim:
+            self.model_id_tag = f"dim{self.dim}"
+        self.ngram_max = max(1, int(ngram_max))
+        self._token_re = re.compile(f"{self._CJK_RUN}|{self._WORD}")
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        for token in self._token_re.findall(text or ""):
+            if token[0].isascii():
+                features.append(token.lower())
+                continue
+            for n in range(1, self.ngram_max + 1):
+                features.extend(token[i:i + n] for i in range(len(token) - n + 1))
+        return features
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        import zlib
+        import numpy as np
+        if not texts:
             return []
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                rows.append(row)
+                hashes.append(zlib.crc32(feature.encode("utf-8")))
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float64)
+        if hashes:
+            hashes = np.asarray(hashes, dtype=np.uint32)
+            buckets = np.asarray(rows, dtype=np.int64) * self.dim + (hashes % self.dim).astype(np.int64)
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0)  # 最高位决定符号，抵消哈希冲突带来的偏差
+            matrix = np.bincount(buckets, weights=signs, minlength=len(texts) * self.dim).reshape(len(texts), self.dim)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+        return matrix.tolist()
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.embed_documents([query])[0]
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return self.embed_documents(queries)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return self.embed_query(query)
+
+    async def aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        return self.embed_documents(queries)
+
+embedding_adapter_registry = AdapterRegistry("embedding_adapter_registry")
+# 连接池按新参数重建时，缓存的适配器仍持有旧客户端，需一并丢弃
+on_http_pool_reset(embedding_adapter_registry.clear)
 
 def create_embedding_adapter(
     interface_format: str,
@@ -295,7 +722,27 @@ def create_embedding_adapter(
 ) -> BaseEmbeddingAdapter:
     """
     工厂函数：根据 interface_format 返回不同的 embedding 适配器实例
+    相同配置的适配器会从 embedding_adapter_registry 中复用。
     """
+    key = (
+        interface_format.strip().lower(),
+        (base_url or "").strip(),
+        model_name,
+        fingerprint_secret(api_key)
+    )
+    def factory():
+        adapter = _build_embedding_adapter(interface_format, api_key, base_url, model_name)
+        # 与同一 provider 的 LLM 调用分开限流，可通过 configure_rate_limit("<provider> embedding", ...) 配置
+        adapter.rate_limiter = get_rate_limiter(f"{interface_format} embedding", api_key)
+        return adapter
+    return embedding_adapter_registry.get_or_create(key, factory)
+
+def _build_embedding_adapter(
+    interface_format: str,
+    api_key: str,
+    base_url: str,
+    model_name: str
+) -> BaseEmbeddingAdapter:
     fmt = interface_format.strip().lower()
     if fmt == "openai":
         return OpenAIEmbeddingAdapter(api_key, base_url, model_name)
@@ -309,5 +756,7 @@ def create_embedding_adapter(
         return GeminiEmbeddingAdapter(api_key, model_name, base_url)
     elif fmt == "siliconflow":
         return SiliconFlowEmbeddingAdapter(api_key, base_url, model_name)
+    elif fmt == "local":
+        return LocalEmbeddingAdapter(model_name)
     else:
         raise ValueError(f"Unknown embedding interface_format: {interface_format}")
@@ -0,0 +1,195 @@
+# embedding_executor.py
+# -*- coding: utf-8 -*-
+"""
+并发 Embedding 执行层：把 embed_documents 的文本按适配器的批大小切块，
+在有界线程池中并发请求（结果保持原顺序），每块受 provider 共享限流器约束，
+向量为空或请求失败的条目按统一重试策略单独重试；适配器吞掉的异常（EmbeddingError）同样参与错误分类，
+鉴权失败、4xx 等不可重试的错误立即放弃。
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from embedding_adapters import BaseEmbeddingAdapter, DEFAULT_EMBEDDING_BATCH_SIZE, embedding_error
+from rate_limiter import is_rate_limit_error, get_retry_after
+from retry_policy import get_default_retry_policy
+from token_budget import count_tokens
+
+# 默认并发请求数，可通过 configure_embedding_concurrency 调整
+_settings = {"max_workers": 4}
+
+
+def configure_embedding_concurrency(max_workers: int):
+    """设置之后创建的 ConcurrentEmbeddingAdapter 的默认并发数"""
+    _settings["max_workers"] = max(1, int(max_workers))
+
+
+class ConcurrentEmbeddingAdapter(BaseEmbeddingAdapter):
+    """
+    包装任意 BaseEmbeddingAdapter：
+    - 支持批量接口的适配器按其 batch_size 切块，否则逐条切块；
+    - 最多 max_workers 个块同时请求，并受 adapter.rate_limiter（若有）的并发/RPM/TPM 限制；
+    - 某条文本返回空向量或整块抛出异常时，仅对失败的条目按 retry_policy 退避重试；
+      空向量携带的异常（EmbeddingError.error）与抛出的异常一样按 classify_error 分类，不可重试时立即放弃。
+    """
+    def __init__(self, adapter: BaseEmbeddingAdapter, max_workers: int = None,
+                 chunk_size: int = None, retry_policy=None):
+        self.adapter = adapter
+        self.max_workers = max(1, int(max_workers or _settings["max_workers"]))
+        self.chunk_size = chunk_size
+        self.retry_policy = retry_policy
+        self.rate_limiter = getattr(adapter, "rate_limiter", None)
+
+    def _chunk_size(self) -> int:
+        if self.chunk_size:
+            return max(1, int(self.chunk_size))
+        if not getattr(self.adapter, "supports_batch", False):
+            return 1
+        return max(1, int(getattr(self.adapter, "batch_size", DEFAULT_EMBEDDING_BATCH_SIZE)))
+
+    def _chunks(self, texts: List[str], queries: bool = False) -> List[List[str]]:
+        # 查询只有适配器声明 supports_query_batch 时才成批请求，否则逐条走 embed_query 语义
+        size = self._chunk_size() if not queries or getattr(self.adapter, "supports_query_batch", False) else 1
+        return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+    def _estimate_tokens(self, texts: List[str]) -> int:
+        model_name = getattr(self.adapter, "model_name", None)
+        return sum(count_tokens(text, model_name) for text in texts)
+
+    @staticmethod
+    def _first_error(vectors):
+        """返回批量结果中第一个失败向量携带的异常"""
+        for vec in vectors or []:
+            error = embedding_error(vec)
+            if error is not None:
+                return error
+        return None
+
+    def _report(self, error: Exception = None, succeeded: bool = False):
+        if self.rate_limiter is None:
+            return
+        if error is not None and is_rate_limit_error(error):
+            self.rate_limiter.on_throttle(get_retry_after(error))
+        elif succeeded:
+            self.rate_limiter.on_success()
+
+    def _embed_limited(self, texts: List[str], embed=None) -> List[List[float]]:
+        embed = embed or self.adapter.embed_documents
+        if self.rate_limiter is None:
+            return embed(texts)
+        with self.rate_limiter.slot(self._estimate_tokens(texts)):
+            try:
+                vectors = embed(texts)
+            except Exception as e:
+                self._report(error=e)
+                raise
+        self._report(error=self._first_error(vectors), succeeded=bool(vectors) and all(vectors))
+        return vectors
+
+    async def _aembed_limited(self, texts: List[str], aembed=None) -> List[List[float]]:
+        aembed = aembed or self.adapter.aembed_documents
+        if self.rate_limiter is None:
+            return await aembed(texts)
+        async with self.rate_limiter.aslot(self._estimate_tokens(texts)):
+            try:
+                vectors = await aembed(texts)
+            except Exception as e:
+                self._report(error=e)
+                raise
+        self._report(error=self._first_error(vectors), succeeded=bool(vectors) and all(vectors))
+        return vectors
+
+    @staticmethod
+    def _merge(vectors: List[List[float]], pending: List[int], result):
+        """把本次返回的向量写回对应位置，返回 (仍需重试的条目下标, 失败条目携带的异常)"""
+        error = None
+        if isinstance(result, list) and len(result) == len(pending):
+            for index, vec in zip(pending, result):
+                vectors[index] = vec or []
+                if error is None:
+                    error = embedding_error(vec)
+        return [index for index in pending if not vectors[index]], error
+
+    def _embed_chunk(self, chunk: List[str], embed=None) -> List[List[float]]:
+        policy = self.retry_policy or get_default_retry_policy()
+        vectors = [[] for _ in chunk]
+        pending = list(range(len(chunk)))
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            error, result = None, None
+            try:
+                result = self._embed_limited([chunk[i] for i in pending], embed)
+            except Exception as e:
+                error = e
+            pending, item_error = self._merge(vectors, pending, result)
+            error = error or item_error
+            if not pending:
+                return vectors
+            delay = policy.next_delay(attempt, started, error)
+            if delay is None:
+                logging.error(f"[embedding] {len(pending)}/{len(chunk)} texts failed after {attempt} attempts: {error}")
+                return vectors
+            logging.warning(f"[embedding] {len(pending)} texts failed (attempt {attempt}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    async def _aembed_chunk(self, chunk: List[str], semaphore: asyncio.Semaphore, aembed=None) -> List[List[float]]:
+        policy = self.retry_policy or get_default_retry_policy()
+        vectors = [[] for _ in chunk]
+        pending = list(range(len(chunk)))
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            error, result = None, None
+            try:
+                async with semaphore:
+                    result = await self._aembed_limited([chunk[i] for i in pending], aembed)
+            except Exception as e:
+                error = e
+            pending, item_error = self._merge(vectors, pending, result)
+            error = error or item_error
+            if not pending:
+                return vectors
+            delay = policy.next_delay(attempt, started, error)
+            if delay is None:
+                logging.error(f"[embedding] {len(pending)}/{len(chunk)} texts failed after {attempt} attempts: {error}")
+                return vectors
+            logging.warning(f"[embedding] {len(pending)} texts failed (attempt {attempt}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    def _run_chunks(self, chunks: List[List[str]], embed) -> List[List[float]]:
+        if len(chunks) <= 1 or self.max_workers == 1:
+            results = [self._embed_chunk(chunk, embed) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks)),
+                                    thread_name_prefix="embedding") as pool:
+                results = list(pool.map(lambda chunk: self._embed_chunk(chunk, embed), chunks))
+        return [vec for chunk_vectors in results for vec in chunk_vectors]
+
+    async def _arun_chunks(self, chunks: List[List[str]], aembed) -> List[List[float]]:
+        semaphore = asyncio.Semaphore(self.max_workers)
+        results = await asyncio.gather(*(self._aembed_chunk(chunk, semaphore, aembed) for chunk in chunks))
+        return [vec for chunk_vectors in results for vec in chunk_vectors]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._run_chunks(self._chunks(list(texts)), self.adapter.embed_documents)
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """批量向量化查询（查询语义，如 Gemini 的检索查询向量与文档向量不同），同样受限流与逐条重试约束"""
+        return self._run_chunks(self._chunks(list(queries), queries=True), self.adapter.embed_queries)
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.embed_queries([query])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._arun_chunks(self._chunks(list(texts)), self.adapter.aembed_documents)
+
+    async def aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        return await self._arun_chunks(self._chunks(list(queries), queries=True), self.adapter.aembed_queries)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return (await self.aembed_queries([query]))[0]
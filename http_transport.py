@@ -0,0 +1,238 @@
+# http_transport.py
+# -*- coding: utf-8 -*-
+"""
+进程级共享的 HTTP 连接池（requests.Session / httpx.Client），按 base_url 的 scheme+host 复用，
+供所有 LLM 与 Embedding 适配器使用，避免每次请求重新建立 TCP+TLS 连接。
+连接池大小可在 config.json 的 "http_pool" 中配置（见 config_manager.apply_http_pool_config）。
+"""
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 连接池默认参数，可通过 configure_http_pool 调整
+_pool_settings = {
+    "pool_connections": 10,   # 每个 Session 缓存的 host 连接池个数
+    "pool_maxsize": 20,       # 每个 host 的最大长连接数
+    "keepalive_expiry": 60.0  # httpx 空闲长连接保留秒数
+}
+
+_lock = threading.Lock()
+_sessions = {}
+_httpx_clients = {}
+_async_httpx_clients = {}
+_request_counts = {}
+# 连接池重建时的回调（适配器缓存据此失效，避免已缓存的适配器继续持有已关闭的客户端）
+_reset_listeners = []
+
+
+def _pool_key(base_url: str) -> str:
+    """以 scheme://host[:port] 作为连接池的键，同一服务的不同路径共享连接"""
+    parts = urlsplit((base_url or "").strip())
+    if not parts.scheme or not parts.netloc:
+        return (base_url or "").strip().rstrip("/")
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+
+def _count_request(key: str):
+    with _lock:
+        _request_counts[key] = _request_counts.get(key, 0) + 1
+
+
+def on_http_pool_reset(callback):
+    """注册连接池被关闭时的回调（如清空适配器缓存）"""
+    with _lock:
+        if callback not in _reset_listeners:
+            _reset_listeners.append(callback)
+
+
+def get_http_pool_settings() -> dict:
+    with _lock:
+        return dict(_pool_settings)
+
+
+def configure_http_pool(pool_connections: int = None, pool_maxsize: int = None, keepalive_expiry: float = None) -> bool:
+    """
+    调整连接池大小。参数有变化时关闭已创建的连接池（并使缓存的适配器失效），后续请求按新参数重新建立；
+    返回是否发生了变化。
+    """
+    with _lock:
+        settings = dict(_pool_settings)
+        if pool_connections is not None:
+            settings["pool_connections"] = max(1, int(pool_connections))
+        if pool_maxsize is not None:
+            settings["pool_maxsize"] = max(1, int(pool_maxsize))
+        if keepalive_expiry is not None:
+            settings["keepalive_expiry"] = float(keepalive_expiry)
+        if settings == _pool_settings:
+            return False
+        _pool_settings.update(settings)
+    close_all_http_clients()
+    return True
+
+
+def get_http_session(base_url: str, verify: bool = True) -> requests.Session:
+    """
+    获取与 base_url 对应的共享 requests.Session（线程安全，长连接复用）。
+    """
+    key = (_pool_key(base_url), verify)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            session.verify = verify
+            adapter = HTTPAdapter(
+                pool_connections=_pool_settings["pool_connections"],
+                pool_maxsize=_pool_settings["pool_maxsize"],
+                max_retries=0
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.hooks["response"].append(lambda resp, *args, **kwargs: _count_request(key[0]))
+            _sessions[key] = session
+            logging.debug(f"[http_transport] Created pooled session for {key[0]}")
+        return session
+
+
+def _httpx_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=_pool_settings["pool_maxsize"],
+        max_keepalive_connections=_pool_settings["pool_maxsize"],
+        keepalive_expiry=_pool_settings["keepalive_expiry"]
+    )
+
+
+def get_httpx_client(base_url: str):
+    """
+    获取与 base_url 对应的共享 httpx.Client，用于 OpenAI SDK / langchain_openai 的 http_client 参数。
+    超时由 SDK 在每次请求时传入，因此同一 host 的不同适配器可安全共享。
+    """
+    import httpx
+    key = _pool_key(base_url)
+    with _lock:
+        client = _httpx_clients.get(key)
+        if client is None:
+            client = httpx.Client(
+                limits=_httpx_limits(),
+                event_hooks={"response": [lambda resp: _count_request(key)]}
+            )
+            _httpx_clients[key] = client
+            logging.debug(f"[http_transport] Created pooled httpx client for {key}")
+        return client
+
+
+def get_async_httpx_client(base_url: str, verify: bool = True):
+    """
+    获取与 base_url 及当前事件循环对应的共享 httpx.AsyncClient。
+    异步连接绑定在事件循环上，因此需在协程内调用；已关闭的事件循环对应的客户端会被清理。
+    """
+    import asyncio
+    import httpx
+    key = _pool_key(base_url)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    async def _on_response(resp):
+        _count_request(key)
+
+    with _lock:
+        for stale_key in [k for k, (lp, _c) in _async_httpx_clients.items() if lp is not None and lp.is_closed()]:
+            _async_httpx_clients.pop(stale_key, None)
+        cache_key = (key, verify, id(loop))
+        entry = _async_httpx_clients.get(cache_key)
+        if entry is None:
+            client = httpx.AsyncClient(
+                verify=verify,
+                limits=_httpx_limits(),
+                event_hooks={"response": [_on_response]}
+            )
+            entry = (loop, client)
+            _async_httpx_clients[cache_key] = entry
+        return entry[1]
+
+
+def _session_connection_count(session: requests.Session) -> int:
+    """统计 Session 中 urllib3 连接池实际新建的连接数"""
+    total = 0
+    for adapter in set(session.adapters.values()):
+        pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+        if pools is None:
+            continue
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            total += getattr(pool, "num_connections", 0) if pool else 0
+    return total
+
+
+def _httpx_connection_count(client) -> int:
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    return len(getattr(pool, "connections", []) or [])
+
+
+def get_http_pool_stats() -> dict:
+    """
+    返回各 host 的请求数、新建连接数与复用次数，用于确认长连接是否生效。
+    """
+    stats = {}
+    with _lock:
+        sessions = list(_sessions.items())
+        clients = list(_httpx_clients.items()) + [(k[0], c) for k, (_lp, c) in _async_httpx_clients.items()]
+        counts = dict(_request_counts)
+    for (key, _verify), session in sessions:
+        entry = stats.setdefault(key, {"requests": counts.get(key, 0), "connections": 0})
+        entry["connections"] += _session_connection_count(session)
+    for key, client in clients:
+        entry = stats.setdefault(key, {"requests": counts.get(key, 0), "connections": 0})
+        entry["connections"] += _httpx_connection_count(client)
+    for entry in stats.values():
+        entry["reused"] = max(0, entry["requests"] - entry["connections"])
+    return stats
+
+
+def _close_async_client(loop, client):
+    """异步客户端只能在其所属事件循环上关闭：循环仍在运行时投递到该循环，未运行时就地关闭"""
+    import asyncio
+    try:
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        elif loop is not None and not loop.is_closed():
+            loop.run_until_complete(client.aclose())
+        else:
+            logging.debug("[http_transport] Event loop already closed; its connections were dropped with it.")
+    except Exception as e:
+        logging.debug(f"[http_transport] Failed to close async httpx client: {e}")
+
+
+def close_all_http_clients():
+    """关闭并清空所有共享连接池，并通知已注册的回调（清空持有这些客户端的适配器缓存）"""
+    with _lock:
+        sessions = list(_sessions.values())
+        clients = list(_httpx_clients.values())
+        async_clients = list(_async_httpx_clients.values())
+        listeners = list(_reset_listeners)
+        _sessions.clear()
+        _httpx_clients.clear()
+        _async_httpx_clients.clear()
+        _request_counts.clear()
+    for callback in listeners:
+        try:
+            callback()
+        except Exception as e:
+            logging.debug(f"[http_transport] Pool reset callback failed: {e}")
+    for loop, client in async_clients:
+        _close_async_client(loop, client)
+    for session in sessions:
+        try:
+            session.close()
+        except Exception as e:
+            logging.debug(f"[http_transport] Failed to close session: {e}")
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logging.debug(f"[http_transport] Failed to close httpx client: {e}")
@@ -1,15 +1,16 @@
 # llm_adapters.py
 # -*- coding: utf-8 -*-
+import asyncio
+import json
 import logging
-from typing import Optional
-from langchain_openai import ChatOpenAI, AzureChatOpenAI
-from google import genai
-from google.genai import types
-from azure.ai.inference import ChatCompletionsClient
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.inference.models import SystemMessage, UserMessage
-from openai import OpenAI
-import requests
+import threading
+import weakref
+from typing import Iterator, Optional
+from http_transport import get_http_session, get_httpx_client, get_async_httpx_client, on_http_pool_reset
+from adapter_registry import AdapterRegistry, fingerprint_secret
+from rate_limiter import get_rate_limiter
+from retry_policy import ProviderHTTPError, classify_error, RETRYABLE
+from utils import run_coroutine_sync
 
 
 def check_base_url(url: str) -> str:
@@ -31,13 +32,47 @@ def check_base_url(url: str) -> str:
             url = url.rstrip('/') + '/v1'
     return url
 
+_async_client_lock = threading.Lock()
+
 class BaseLLMAdapter:
     """
     统一的 LLM 接口基类，为不同后端（OpenAI、Ollama、ML Studio、Gemini等）提供一致的方法签名。
     """
+    # 由 create_llm_adapter 注入的 (provider, api_key) 级共享限流器
+    rate_limiter = None
+
+    def _loop_client(self, build):
+        """
+        返回绑定在当前事件循环上的异步客户端，每个适配器在每个事件循环中只调用一次 build() 构造。
+        异步连接池不能跨事件循环使用；生成流程的异步调用都在 run_coroutine_sync 的常驻循环中执行，因此通常只构造一次。
+        """
+        loop = asyncio.get_running_loop()
+        with _async_client_lock:
+            clients = self.__dict__.get("_async_clients")
+            if clients is None:
+                clients = self._async_clients = weakref.WeakKeyDictionary()
+            client = clients.get(loop)
+            if client is None:
+                client = clients[loop] = build()
+        return client
+
     def invoke(self, prompt: str) -> str:
         raise NotImplementedError("Subclasses must implement .invoke(prompt) method.")
 
+    async def ainvoke(self, prompt: str) -> str:
+        """
+        异步调用。默认在线程池中执行 invoke，子类可覆盖为原生异步实现。
+        """
+        return await asyncio.to_thread(self.invoke, prompt)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """
+        流式调用，逐段产出生成的文本。默认一次性产出 invoke 的完整结果，子类可覆盖为真正的流式实现。
+        """
+        text = self.invoke(prompt)
+        if text:
+            yield text
+
 class DeepSeekAdapter(BaseLLMAdapter):
     """
     适配官方/OpenAI兼容接口（使用 langchain.ChatOpenAI）
@@ -50,15 +85,25 @@ class DeepSeekAdapter(BaseLLMAdapter):
         self.temperature = temperature
         self.timeout = timeout
 
-        self._client = ChatOpenAI(
+        self._client = self._build_client()
+
+    def _build_client(self, http_async_client=None):
+        from langchain_openai import ChatOpenAI  # 延迟导入，避免启动时加载 SDK
+        return ChatOpenAI(
             model=self.model_name,
             api_key=self.api_key,
             base_url=self.base_url,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
-            timeout=self.timeout
+            timeout=self.timeout,
+            max_retries=0,  # 重试统一由 retry_policy 在调用层处理
+            http_client=get_httpx_client(self.base_url),
+            http_async_client=http_async_client
         )
 
+    def _async_client(self):
+        return self._loop_client(lambda: self._build_client(get_async_httpx_client(self.base_url)))
+
     def invoke(self, prompt: str) -> str:
         response = self._client.invoke(prompt)
         if not response:
@@ -66,6 +111,18 @@ class DeepSeekAdapter(BaseLLMAdapter):
             return ""
         return response.content
 
+    async def ainvoke(self, prompt: str) -> str:
+        response = await self._async_client().ainvoke(prompt)
+        if not response:
+            logging.warning("No response from DeepSeekAdapter.")
+            return ""
+        return response.content
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._client.stream(prompt):
+            if chunk.content:
+                yield chunk.content
+
 class OpenAIAdapter(BaseLLMAdapter):
     """
     适配官方/OpenAI兼容接口（使用 langchain.ChatOpenAI）
@@ -78,15 +135,25 @@ class OpenAIAdapter(BaseLLMAdapter):
         self.temperature = temperature
         self.timeout = timeout
 
-        self._client = ChatOpenAI(
+        self._client = self._build_client()
+
+    def _build_client(self, http_async_client=None):
+        from langchain_openai import ChatOpenAI  # 延迟导入，避免启动时加载 SDK
+        return ChatOpenAI(
             model=self.model_name,
             api_key=self.api_key,
             base_url=self.base_url,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
-            timeout=self.timeout
+            timeout=self.timeout,
+            max_retries=0,  # 重试统一由 retry_policy 在调用层处理
+            http_client=get_httpx_client(self.base_url),
+            http_async_client=http_async_client
         )
 
+    def _async_client(self):
+        return self._loop_client(lambda: self._build_client(get_async_httpx_client(self.base_url)))
+
     def invoke(self, prompt: str) -> str:
         response = self._client.invoke(prompt)
         if not response:
@@ -94,6 +161,18 @@ class OpenAIAdapter(BaseLLMAdapter):
             return ""
         return response.content
 
+    async def ainvoke(self, prompt: str) -> str:
+        response = await self._async_client().ainvoke(prompt)
+        if not response:
+            logging.warning("No response from OpenAIAdapter.")
+            return ""
+        return response.content
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._client.stream(prompt):
+            if chunk.content:
+                yield chunk.content
+
 class GeminiAdapter(BaseLLMAdapter):
     """
     适配 Google Gemini (Google Generative AI) 接口
@@ -115,13 +194,10 @@ class GeminiAdapter(BaseLLMAdapter):
 
         logging.info(f"Gemini适配器初始化成功，模型: {self.full_model_name}")
 
-    def _make_request(self, prompt: str) -> dict:
+    def _build_request(self, prompt: str):
         """
-        使用requests直接调用Gemini API
+        构造 generateContent 请求的 url、headers、params 与 payload
         """
-        import requests
-        import json
-
         url = f"{self.base_url}/{self.full_model_name}:generateContent"
 
         headers = {
@@ -145,10 +221,29 @@ class GeminiAdapter(BaseLLMAdapter):
                 "temperature": self.temperature
             }
         }
+        return url, headers, params, payload
+
+    @staticmethod
+    def _extract_text(result: dict) -> Optional[str]:
+        """
+        从 generateContent 响应中提取文本，格式不正确时返回 None
+        """
+        if "candidates" in result and len(result["candidates"]) > 0:
+            candidate = result["candidates"][0]
+            if "content" in candidate and "parts" in candidate["content"]:
+                parts = candidate["content"]["parts"]
+                if len(parts) > 0 and "text" in parts[0]:
+                    return parts[0]["text"]
+        return None
 
-        # 配置requests会话以处理SSL问题
-        session = requests.Session()
-        session.verify = False  # 禁用SSL验证
+    def _make_request(self, prompt: str) -> dict:
+        """
+        使用requests直接调用Gemini API
+        """
+        url, headers, params, payload = self._build_request(prompt)
+
+        # 使用共享的长连接会话（禁用SSL验证以处理SSL问题）
+        session = get_http_session(self.base_url, verify=False)
 
         # 禁用SSL警告
         import urllib3
@@ -164,101 +259,152 @@ class GeminiAdapter(BaseLLMAdapter):
 
         return response
 
+    @staticmethod
+    def _raise_for_status(status_code: int, text: str, headers=None):
+        """
+        非 200 响应统一抛出 ProviderHTTPError，由调用层的 retry_policy 判断是否重试
+        （401/400 等立即失败，429/5xx 退避重试）。
+        """
+        logging.error(f"HTTP错误: {status_code}")
+        logging.error(f"错误响应: {text}")
+        if status_code == 401:
+            logging.error("API密钥认证失败")
+        elif status_code in (429, 503):
+            logging.error("API配额限制或请求过于频繁")
+        elif status_code == 400:
+            logging.error("请求参数错误")
+        retry_after = None
+        try:
+            retry_after = float((headers or {}).get("Retry-After"))
+        except (TypeError, ValueError):
+            pass
+        raise ProviderHTTPError(status_code, text[:500], retry_after=retry_after)
+
     def invoke(self, prompt: str) -> str:
         """
-        调用Gemini API，带重试机制和详细错误信息
+        调用Gemini API（单次请求）。HTTP 错误以 ProviderHTTPError 抛出，
+        网络异常原样抛出，响应格式不正确时返回空字符串；重试由调用层统一处理。
         """
-        max_retries = 3
-        retry_delay = 1
+        try:
+            logging.info("Gemini API调用开始")
+            logging.debug(f"请求参数: 模型={self.full_model_name}, max_tokens={self.max_tokens}, temperature={self.temperature}")
+            logging.debug(f"提示词长度: {len(prompt)} 字符")
 
-        for attempt in range(max_retries):
-            try:
-                logging.info(f"Gemini API调用开始 (尝试 {attempt + 1}/{max_retries})")
-                logging.debug(f"请求参数: 模型={self.full_model_name}, max_tokens={self.max_tokens}, temperature={self.temperature}")
-                logging.debug(f"提示词长度: {len(prompt)} 字符")
-
-                # 使用requests直接调用API
-                response = self._make_request(prompt)
-
-                logging.debug(f"HTTP状态码: {response.status_code}")
-                logging.debug(f"响应头: {dict(response.headers)}")
-
-                if response.status_code == 200:
-                    result = response.json()
-                    logging.debug(f"完整响应: {result}")
-
-                    # 解析响应
-                    if "candidates" in result and len(result["candidates"]) > 0:
-                        candidate = result["candidates"][0]
-                        if "content" in candidate and "parts" in candidate["content"]:
-                            parts = candidate["content"]["parts"]
-                            if len(parts) > 0 and "text" in parts[0]:
-                                text = parts[0]["text"]
-                                logging.info(f"Gemini API调用成功，返回内容长度: {len(text)} 字符")
-                                logging.debug(f"返回内容预览: {text[:200]}...")
-                                return text
-
-                    logging.warning(f"Gemini API返回了响应但格式不正确 (尝试 {attempt + 1})")
-                    logging.debug(f"完整响应: {result}")
-                else:
-                    logging.error(f"HTTP错误: {response.status_code}")
-                    logging.error(f"错误响应: {response.text}")
-
-                    # 分析具体错误
-                    if response.status_code == 401:
-                        logging.error("API密钥认证失败")
-                        return ""  # 认证错误不重试
-                    elif response.status_code == 429:
-                        logging.error("API配额限制或请求过于频繁")
-                    elif response.status_code == 400:
-                        logging.error("请求参数错误")
-                        return ""  # 参数错误不重试
-
-                # 如果不是最后一次尝试，等待后重试
-                if attempt < max_retries - 1:
-                    import time
-                    logging.info(f"等待 {retry_delay} 秒后重试...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
-                    logging.error("所有重试均失败，返回空字符串")
-                    return ""
+            # 使用requests直接调用API
+            response = self._make_request(prompt)
 
-            except Exception as e:
-                error_type = type(e).__name__
-                error_msg = str(e)
-
-                logging.error(f"Gemini API调用失败 (尝试 {attempt + 1}/{max_retries})")
-                logging.error(f"错误类型: {error_type}")
-                logging.error(f"错误信息: {error_msg}")
-
-                # 详细的错误分析
-                if "SSL" in error_msg or "EOF" in error_msg:
-                    logging.error("检测到SSL/网络连接问题，可能的原因:")
-                    logging.error("1. 网络连接不稳定")
-                    logging.error("2. 防火墙或代理设置问题")
-                    logging.error("3. Gemini服务器临时不可用")
-                elif "timeout" in error_msg.lower():
-                    logging.error("请求超时，可能的原因:")
-                    logging.error("1. 网络延迟过高")
-                    logging.error("2. 服务器响应慢")
-                elif "connection" in error_msg.lower():
-                    logging.error("连接错误，可能的原因:")
-                    logging.error("1. 网络连接问题")
-                    logging.error("2. DNS解析失败")
-
-                # 如果不是最后一次尝试，等待后重试
-                if attempt < max_retries - 1:
-                    import time
-                    logging.info(f"等待 {retry_delay} 秒后重试...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
-                    logging.error("所有重试均失败，返回空字符串")
-                    return ""
+            logging.debug(f"HTTP状态码: {response.status_code}")
+            logging.debug(f"响应头: {dict(response.headers)}")
+
+            if response.status_code != 200:
+                self._raise_for_status(response.status_code, response.text, response.headers)
+
+            result = response.json()
+            logging.debug(f"完整响应: {result}")
+
+            # 解析响应
+            text = self._extract_text(result)
+            if text is not None:
+                logging.info(f"Gemini API调用成功，返回内容长度: {len(text)} 字符")
+                logging.debug(f"返回内容预览: {text[:200]}...")
+                return text
 
+            logging.warning("Gemini API返回了响应但格式不正确")
+            return ""
+
+        except ProviderHTTPError:
+            raise
+        except Exception as e:
+            error_type = type(e).__name__
+            error_msg = str(e)
+
+            logging.error("Gemini API调用失败")
+            logging.error(f"错误类型: {error_type}")
+            logging.error(f"错误信息: {error_msg}")
+
+            # 详细的错误分析
+            if "SSL" in error_msg or "EOF" in error_msg:
+                logging.error("检测到SSL/网络连接问题，可能的原因:")
+                logging.error("1. 网络连接不稳定")
+                logging.error("2. 防火墙或代理设置问题")
+                logging.error("3. Gemini服务器临时不可用")
+            elif "timeout" in error_msg.lower():
+                logging.error("请求超时，可能的原因:")
+                logging.error("1. 网络延迟过高")
+                logging.error("2. 服务器响应慢")
+            elif "connection" in error_msg.lower():
+                logging.error("连接错误，可能的原因:")
+                logging.error("1. 网络连接问题")
+                logging.error("2. DNS解析失败")
+            raise
+
+    async def ainvoke(self, prompt: str) -> str:
+        """
+        异步调用Gemini API（httpx.AsyncClient），错误处理规则与 invoke 一致
+        """
+        url, headers, params, payload = self._build_request(prompt)
+        client = get_async_httpx_client(self.base_url, verify=False)
+        try:
+            response = await client.post(
+                url,
+                json=payload,
+                headers=headers,
+                params=params,
+                timeout=self.timeout
+            )
+        except Exception as e:
+            logging.error(f"Gemini API异步调用失败: {type(e).__name__}: {e}")
+            raise
+        if response.status_code != 200:
+            self._raise_for_status(response.status_code, response.text, response.headers)
+        text = self._extract_text(response.json())
+        if text is not None:
+            logging.info(f"Gemini API异步调用成功，返回内容长度: {len(text)} 字符")
+            return text
+        logging.warning("Gemini API返回了响应但格式不正确")
         return ""
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        """
+        使用 streamGenerateContent (SSE) 流式调用Gemini API。
+        限流/服务端错误直接抛出交给调用层重试；其他失败在产出任何内容前回退到 invoke。
+        """
+        url, headers, params, payload = self._build_request(prompt)
+        url = url.replace(":generateContent", ":streamGenerateContent")
+        params["alt"] = "sse"
+        produced = False
+        try:
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            session = get_http_session(self.base_url, verify=False)
+            with session.post(url, json=payload, headers=headers, params=params,
+                              timeout=self.timeout, stream=True) as response:
+                if response.status_code != 200:
+                    logging.error(f"Gemini流式调用HTTP错误: {response.status_code}")
+                    if classify_error(ProviderHTTPError(response.status_code)) == RETRYABLE:
+                        self._raise_for_status(response.status_code, response.text, response.headers)
+                else:
+                    # 按字节切分后再以 UTF-8 解码：SSE 响应常不带 charset，
+                    # decode_unicode 会按 Latin-1 解码并在 \x85 等字符处错误断行
+                    for raw_line in response.iter_lines():
+                        line = raw_line.decode("utf-8") if raw_line else ""
+                        if not line.startswith("data:"):
+                            continue
+                        text = self._extract_text(json.loads(line[len("data:"):].strip()))
+                        if text:
+                            produced = True
+                            yield text
+        except ProviderHTTPError:
+            raise
+        except Exception as e:
+            logging.error(f"Gemini流式调用失败: {type(e).__name__}: {e}")
+            if produced:
+                raise
+        if not produced:
+            text = self.invoke(prompt)
+            if text:
+                yield text
+
 class AzureOpenAIAdapter(BaseLLMAdapter):
     """
     适配 Azure OpenAI 接口（使用 langchain.ChatOpenAI）
@@ -279,16 +425,26 @@ class AzureOpenAIAdapter(BaseLLMAdapter):
         self.temperature = temperature
         self.timeout = timeout
 
-        self._client = AzureChatOpenAI(
+        self._client = self._build_client()
+
+    def _build_client(self, http_async_client=None):
+        from langchain_openai import AzureChatOpenAI
+        return AzureChatOpenAI(
             azure_endpoint=self.azure_endpoint,
             azure_deployment=self.azure_deployment,
             api_version=self.api_version,
             api_key=self.api_key,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
-            timeout=self.timeout
+            timeout=self.timeout,
+            max_retries=0,  # 重试统一由 retry_policy 在调用层处理
+            http_client=get_httpx_client(self.azure_endpoint),
+            http_async_client=http_async_client
         )
 
+    def _async_client(self):
+        return self._loop_client(lambda: self._build_client(get_async_httpx_client(self.azure_endpoint)))
+
     def invoke(self, prompt: str) -> str:
         response = self._client.invoke(prompt)
         if not response:
@@ -296,6 +452,18 @@ class AzureOpenAIAdapter(BaseLLMAdapter):
             return ""
         return response.content
 
+    async def ainvoke(self, prompt: str) -> str:
+        response = await self._async_client().ainvoke(prompt)
+        if not response:
+            logging.warning("No response from AzureOpenAIAdapter.")
+            return ""
+        return response.content
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._client.stream(prompt):
+            if chunk.content:
+                yield chunk.content
+
 class OllamaAdapter(BaseLLMAdapter):
     """
     Ollama 同样有一个 OpenAI-like /v1/chat 接口，可直接使用 ChatOpenAI。
@@ -311,15 +479,25 @@ class OllamaAdapter(BaseLLMAdapter):
         if self.api_key == '':
             self.api_key= 'ollama'
 
-        self._client = ChatOpenAI(
+        self._client = self._build_client()
+
+    def _build_client(self, http_async_client=None):
+        from langchain_openai import ChatOpenAI  # 延迟导入，避免启动时加载 SDK
+        return ChatOpenAI(
             model=self.model_name,
             api_key=self.api_key,
             base_url=self.base_url,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
-            timeout=self.timeout
+            timeout=self.timeout,
+            max_retries=0,  # 重试统一由 retry_policy 在调用层处理
+            http_client=get_httpx_client(self.base_url),
+            http_async_client=http_async_client
         )
 
+    def _async_client(self):
+        return self._loop_client(lambda: self._build_client(get_async_httpx_client(self.base_url)))
+
     def invoke(self, prompt: str) -> str:
         response = self._client.invoke(prompt)
         if not response:
@@ -327,6 +505,18 @@ class OllamaAdapter(BaseLLMAdapter):
             return ""
         return response.content
 
+    async def ainvoke(self, prompt: str) -> str:
+        response = await self._async_client().ainvoke(prompt)
+        if not response:
+            logging.warning("No response from OllamaAdapter.")
+            return ""
+        return response.content
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._client.stream(prompt):
+            if chunk.content:
+                yield chunk.content
+
 class MLStudioAdapter(BaseLLMAdapter):
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
         self.base_url = check_base_url(base_url)
@@ -336,15 +526,25 @@ class MLStudioAdapter(BaseLLMAdapter):
         self.temperature = temperature
         self.timeout = timeout
 
-        self._client = ChatOpenAI(
+        self._client = self._build_client()
+
+    def _build_client(self, http_async_client=None):
+        from langchain_openai import ChatOpenAI  # 延迟导入，避免启动时加载 SDK
+        return ChatOpenAI(
             model=self.model_name,
             api_key=self.api_key,
             base_url=self.base_url,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
-            timeout=self.timeout
+            timeout=self.timeout,
+            max_retries=0,  # 重试统一由 retry_policy 在调用层处理
+            http_client=get_httpx_client(self.base_url),
+            http_async_client=http_async_client
         )
 
+    def _async_client(self):
+        return self._loop_client(lambda: self._build_client(get_async_httpx_client(self.base_url)))
+
     def invoke(self, prompt: str) -> str:
         try:
             response = self._client.invoke(prompt)
@@ -354,7 +554,27 @@ class MLStudioAdapter(BaseLLMAdapter):
             return response.content
         except Exception as e:
             logging.error(f"ML Studio API 调用超时或失败: {e}")
-            return ""
+            raise
+
+    async def ainvoke(self, prompt: str) -> str:
+        try:
+            response = await self._async_client().ainvoke(prompt)
+            if not response:
+                logging.warning("No response from MLStudioAdapter.")
+                return ""
+            return response.content
+        except Exception as e:
+            logging.error(f"ML Studio API 调用超时或失败: {e}")
+            raise
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        try:
+            for chunk in self._client.stream(prompt):
+                if chunk.content:
+                    yield chunk.content
+        except Exception as e:
+            logging.error(f"ML Studio API 流式调用超时或失败: {e}")
+            raise
 
 class AzureAIAdapter(BaseLLMAdapter):
     """
@@ -380,16 +600,22 @@ class AzureAIAdapter(BaseLLMAdapter):
         self.temperature = temperature
         self.timeout = timeout
 
+        from azure.ai.inference import ChatCompletionsClient
+        from azure.core.credentials import AzureKeyCredential
+        from azure.core.pipeline.transport import RequestsTransport
         self._client = ChatCompletionsClient(
             endpoint=self.endpoint,
             credential=AzureKeyCredential(self.api_key),
             model=self.model_name,
             temperature=self.temperature,
             max_tokens=self.max_tokens,
-            timeout=self.timeout
+            timeout=self.timeout,
+            retry_total=0,  # 重试统一由 retry_policy 在调用层处理
+            transport=RequestsTransport(session=get_http_session(self.endpoint), session_owner=False)
         )
 
     def invoke(self, prompt: str) -> str:
+        from azure.ai.inference.models import SystemMessage, UserMessage
         try:
             response = self._client.complete(
                 messages=[
@@ -404,7 +630,59 @@ class AzureAIAdapter(BaseLLMAdapter):
                 return ""
         except Exception as e:
             logging.error(f"Azure AI Inference API 调用失败: {e}")
+            raise
+
+    def _async_client(self):
+        def build():
+            from azure.ai.inference.aio import ChatCompletionsClient as AsyncChatCompletionsClient
+            from azure.core.credentials import AzureKeyCredential
+            from azure.core.pipeline.transport import AsyncioRequestsTransport
+            # azure-core 没有 httpx 异步传输，使用与同步客户端相同的共享 requests 连接池
+            return AsyncChatCompletionsClient(
+                endpoint=self.endpoint,
+                credential=AzureKeyCredential(self.api_key),
+                model=self.model_name,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                timeout=self.timeout,
+                retry_total=0,
+                transport=AsyncioRequestsTransport(session=get_http_session(self.endpoint), session_owner=False)
+            )
+        return self._loop_client(build)
+
+    async def ainvoke(self, prompt: str) -> str:
+        from azure.ai.inference.models import SystemMessage, UserMessage
+        try:
+            response = await self._async_client().complete(
+                messages=[
+                    SystemMessage("You are a helpful assistant."),
+                    UserMessage(prompt)
+                ]
+            )
+            if response and response.choices:
+                return response.choices[0].message.content
+            logging.warning("No response from AzureAIAdapter.")
             return ""
+        except Exception as e:
+            logging.error(f"Azure AI Inference API 异步调用失败: {e}")
+            raise
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        from azure.ai.inference.models import SystemMessage, UserMessage
+        try:
+            response = self._client.complete(
+                stream=True,
+                messages=[
+                    SystemMessage("You are a helpful assistant."),
+                    UserMessage(prompt)
+                ]
+            )
+            for update in response:
+                if update.choices and update.choices[0].delta and update.choices[0].delta.content:
+                    yield update.choices[0].delta.content
+        except Exception as e:
+            logging.error(f"Azure AI Inference API 流式调用失败: {e}")
+            raise
 
 # 火山引擎实现
 class VolcanoEngineAIAdapter(BaseLLMAdapter):
@@ -415,12 +693,29 @@ class VolcanoEngineAIAdapter(BaseLLMAdapter):
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.timeout = timeout
+        self.raw_base_url = base_url  # OpenAI SDK 客户端使用用户原始填写的地址
 
+        from openai import OpenAI
         self._client = OpenAI(
             base_url=base_url,
             api_key=api_key,
-            timeout=timeout  # 添加超时配置
+            timeout=timeout,  # 添加超时配置
+            max_retries=0,
+            http_client=get_httpx_client(base_url)
         )
+
+    def _async_client(self):
+        def build():
+            from openai import AsyncOpenAI
+            return AsyncOpenAI(
+                base_url=self.raw_base_url,
+                api_key=self.api_key,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=get_async_httpx_client(self.raw_base_url)
+            )
+        return self._loop_client(build)
+
     def invoke(self, prompt: str) -> str:
         try:
             response = self._client.chat.completions.create(
@@ -437,7 +732,43 @@ class VolcanoEngineAIAdapter(BaseLLMAdapter):
             return response.choices[0].message.content
         except Exception as e:
             logging.error(f"火山引擎API调用超时或失败: {e}")
-            return ""
+            raise
+
+    async def ainvoke(self, prompt: str) -> str:
+        try:
+            response = await self._async_client().chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
+                    {"role": "user", "content": prompt},
+                ],
+                timeout=self.timeout
+            )
+            if not response:
+                logging.warning("No response from DeepSeekAdapter.")
+                return ""
+            return response.choices[0].message.content
+        except Exception as e:
+            logging.error(f"火山引擎API异步调用超时或失败: {e}")
+            raise
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        try:
+            response = self._client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
+                    {"role": "user", "content": prompt},
+                ],
+                timeout=self.timeout,
+                stream=True
+            )
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            logging.error(f"火山引擎API流式调用超时或失败: {e}")
+            raise
 
 class SiliconFlowAdapter(BaseLLMAdapter):
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
@@ -447,12 +778,29 @@ class SiliconFlowAdapter(BaseLLMAdapter):
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.timeout = timeout
+        self.raw_base_url = base_url  # OpenAI SDK 客户端使用用户原始填写的地址
 
+        from openai import OpenAI
         self._client = OpenAI(
             base_url=base_url,
             api_key=api_key,
-            timeout=timeout  # 添加超时配置
+            timeout=timeout,  # 添加超时配置
+            max_retries=0,
+            http_client=get_httpx_client(base_url)
         )
+
+    def _async_client(self):
+        def build():
+            from openai import AsyncOpenAI
+            return AsyncOpenAI(
+                base_url=self.raw_base_url,
+                api_key=self.api_key,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=get_async_httpx_client(self.raw_base_url)
+            )
+        return self._loop_client(build)
+
     def invoke(self, prompt: str) -> str:
         try:
             response = self._client.chat.completions.create(
@@ -469,7 +817,85 @@ class SiliconFlowAdapter(BaseLLMAdapter):
             return response.choices[0].message.content
         except Exception as e:
             logging.error(f"硅基流动API调用超时或失败: {e}")
-            return ""
+            raise
+
+    async def ainvoke(self, prompt: str) -> str:
+        try:
+            response = await self._async_client().chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
+                    {"role": "user", "content": prompt},
+                ],
+                timeout=self.timeout
+            )
+            if not response:
+                logging.warning("No response from DeepSeekAdapter.")
+                return ""
+            return response.choices[0].message.content
+        except Exception as e:
+            logging.error(f"硅基流动API异步调用超时或失败: {e}")
+            raise
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        try:
+            response = self._client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
+                    {"role": "user", "content": prompt},
+                ],
+                timeout=self.timeout,
+                stream=True
+            )
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            logging.error(f"硅基流动API流式调用超时或失败: {e}")
+            raise
+
+llm_adapter_registry = AdapterRegistry("llm_adapter_registry")
+# 连接池按新参数重建时，缓存的适配器仍持有旧客户端，需一并丢弃
+on_http_pool_reset(llm_adapter_registry.clear)
+
+# 多服务商路由配置，见 configure_llm_routing
+_routing_lock = threading.Lock()
+_routing_settings = {"enabled": False, "fallbacks": (), "options": ()}
+
+def configure_llm_routing(fallbacks: list = None, enabled: bool = True, **options):
+    """
+    配置多服务商路由。启用且存在备用服务商时，create_llm_adapter 返回 HedgedRoutingAdapter：
+    调用方传入的配置为主服务商，fallbacks 按顺序作为对冲与故障转移的目标。
+    :param fallbacks: 备用服务商列表，每项包含 interface_format、base_url、model_name、api_key；
+                      temperature / max_tokens / timeout 沿用主服务商的调用参数
+    :param enabled: False 表示关闭路由，create_llm_adapter 恢复返回单一适配器
+    :param options: 传给 HedgedRoutingAdapter 的参数（hedge_percentile、initial_hedge_delay、min_hedge_delay 等）
+    """
+    normalized = []
+    for cfg in fallbacks or []:
+        normalized.append((
+            cfg["interface_format"],
+            cfg.get("base_url", ""),
+            cfg.get("model_name", ""),
+            cfg.get("api_key", "")
+        ))
+    with _routing_lock:
+        _routing_settings["enabled"] = bool(enabled)
+        _routing_settings["fallbacks"] = tuple(normalized)
+        _routing_settings["options"] = tuple(sorted(options.items()))
+
+def get_llm_routing() -> dict:
+    """返回当前的路由配置（api_key 以摘要表示）"""
+    with _routing_lock:
+        return {
+            "enabled": _routing_settings["enabled"],
+            "fallbacks": [
+                {"interface_format": fmt, "base_url": url, "model_name": model, "api_key": fingerprint_secret(key)}
+                for fmt, url, model, key in _routing_settings["fallbacks"]
+            ],
+            "options": dict(_routing_settings["options"])
+        }
 
 def create_llm_adapter(
     interface_format: str,
@@ -478,11 +904,58 @@ def create_llm_adapter(
     api_key: str,
     temperature: float,
     max_tokens: int,
-    timeout: int
+    timeout: int,
+    routing: bool = True
 ) -> BaseLLMAdapter:
     """
     工厂函数：根据 interface_format 返回不同的适配器实例。
+    相同配置的适配器会从 llm_adapter_registry 中复用，不再重复构造客户端。
+    通过 configure_llm_routing 启用多服务商路由时返回 HedgedRoutingAdapter；routing=False 总是返回单一适配器。
     """
+    key = (
+        interface_format.strip().lower(),
+        (base_url or "").strip(),
+        model_name,
+        fingerprint_secret(api_key),
+        temperature,
+        max_tokens,
+        timeout
+    )
+    if routing:
+        with _routing_lock:
+            enabled = _routing_settings["enabled"]
+            fallbacks = [f for f in _routing_settings["fallbacks"]
+                         if (f[0].strip().lower(), f[1].strip(), f[2], fingerprint_secret(f[3])) != key[:4]]
+            options = _routing_settings["options"]
+        if enabled and fallbacks:
+            provider_configs = [
+                dict(interface_format=fmt, base_url=url, model_name=model, api_key=secret,
+                     temperature=temperature, max_tokens=max_tokens, timeout=timeout)
+                for fmt, url, model, secret in [(interface_format, base_url, model_name, api_key)] + fallbacks
+            ]
+            routed_key = ("hedged", key, tuple(
+                (f[0].strip().lower(), f[1].strip(), f[2], fingerprint_secret(f[3])) for f in fallbacks
+            ), options)
+            return llm_adapter_registry.get_or_create(
+                routed_key, lambda: HedgedRoutingAdapter(provider_configs, **dict(options))
+            )
+
+    def factory():
+        adapter = _build_llm_adapter(interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout)
+        adapter.rate_limiter = get_rate_limiter(interface_format, api_key)
+        adapter.interface_format = interface_format  # 供响应缓存等按服务商区分
+        return adapter
+    return llm_adapter_registry.get_or_create(key, factory)
+
+def _build_llm_adapter(
+    interface_format: str,
+    base_url: str,
+    model_name: str,
+    api_key: str,
+    temperature: float,
+    max_tokens: int,
+    timeout: int
+) -> BaseLLMAdapter:
     fmt = interface_format.strip().lower()
     if fmt == "deepseek":
         return DeepSeekAdapter(api_key, base_url, model_name, max_tokens, temperature, timeout)
@@ -506,3 +979,153 @@ def create_llm_adapter(
         return SiliconFlowAdapter(api_key, base_url, model_name, max_tokens, temperature, timeout)
     else:
         raise ValueError(f"Unknown interface_format: {interface_format}")
+
+class HedgedRoutingAdapter(BaseLLMAdapter):
+    """
+    多服务商路由适配器：按顺序持有多个由 create_llm_adapter 创建的适配器。
+    - 对冲：最近发出的一路在该服务商历史延迟（含失败与被取消的请求）的 hedge_percentile 分位时间内未返回时，
+      向下一个服务商并发发出相同请求，取最先返回的有效结果并取消其余请求；
+    - 故障转移：某个服务商报错（如 429、5xx）或返回空结果时，立即改用下一个服务商。
+    每一路请求都经过该服务商自身的共享限流器（429 会使该服务商并发减半并进入冷却），
+    所有服务商都失败时抛出最后一个错误，由外层 invoke_with_cleaning 的 RetryPolicy 退避后整体重试。
+    本适配器不持有限流器，通常由 create_llm_adapter 在 configure_llm_routing 启用后创建。
+    注意：仅实现了线程池回退的适配器（未覆盖 ainvoke）在取消后其后台线程仍会跑完，但结果会被丢弃。
+    """
+    def __init__(
+        self,
+        provider_configs: list,
+        hedge_percentile: float = 0.95,
+        initial_hedge_delay: float = 60.0,
+        min_hedge_delay: float = 5.0,
+        min_samples: int = 5,
+        window_size: int = 50
+    ):
+        """
+        :param provider_configs: 有序的服务商配置列表，每项为 create_llm_adapter 的关键字参数字典
+        :param hedge_percentile: 以主服务商延迟的该分位数作为发出对冲请求的等待时间
+        :param initial_hedge_delay: 延迟样本不足 min_samples 时使用的对冲等待秒数
+        :param min_hedge_delay: 对冲等待时间下限，避免对快速请求过度对冲
+        """
+        from collections import deque
+        if not provider_configs:
+            raise ValueError("HedgedRoutingAdapter requires at least one provider config")
+        self.adapters = [create_llm_adapter(**cfg, routing=False) for cfg in provider_configs]
+        primary = self.adapters[0]
+        self.model_name = getattr(primary, "model_name", "")
+        self.temperature = getattr(primary, "temperature", None)
+        self.max_tokens = getattr(primary, "max_tokens", None)
+        self.hedge_percentile = hedge_percentile
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self._latencies = [deque(maxlen=window_size) for _ in self.adapters]
+        self.hedges_sent = 0
+        self.failovers = 0
+        self.wins = [0] * len(self.adapters)
+
+    def hedge_delay(self, index: int = 0) -> float:
+        """根据第 index 个服务商的历史延迟计算对冲等待时间"""
+        samples = sorted(self._latencies[index])
+        if len(samples) < self.min_samples:
+            return self.initial_hedge_delay
+        pos = min(len(samples) - 1, int(round(self.hedge_percentile * (len(samples) - 1))))
+        return max(self.min_hedge_delay, samples[pos])
+
+    async def _timed_call(self, index: int, prompt: str) -> str:
+        import time
+        from novel_generator.common import _ainvoke_rate_limited
+        start = time.monotonic()
+        try:
+            return await _ainvoke_rate_limited(self.adapters[index], prompt)
+        finally:
+            # 失败与被取消的请求同样记录（被取消时为实际延迟的下界），
+            # 否则分位数只统计快速返回的样本，对冲等待时间会持续偏小
+            self._latencies[index].append(time.monotonic() - start)
+
+    async def ainvoke(self, prompt: str) -> str:
+        tasks = {}
+        next_index = 0
+        last_error = None
+
+        def launch():
+            nonlocal next_index
+            task = asyncio.ensure_future(self._timed_call(next_index, prompt))
+            tasks[task] = next_index
+            next_index += 1
+
+        launch()
+        try:
+            while tasks:
+                can_hedge = next_index < len(self.adapters)
+                # 按最近发出的那一路服务商自身的延迟分布决定何时发出下一路
+                done, _pending = await asyncio.wait(
+                    set(tasks),
+                    timeout=self.hedge_delay(next_index - 1) if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # 超过对冲等待时间仍无结果，向下一个服务商发出对冲请求
+                    self.hedges_sent += 1
+                    logging.info(f"[HedgedRoutingAdapter] Hedging request to provider #{next_index}.")
+                    launch()
+                    continue
+                for task in done:
+                    index = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = e
+                        logging.warning(f"[HedgedRoutingAdapter] Provider #{index} failed: {e}")
+                        result = ""
+                    if result:
+                        self.wins[index] += 1
+                        return result
+                if not tasks and next_index < len(self.adapters):
+                    self.failovers += 1
+                    launch()
+        finally:
+            # 取消仍在进行的请求，并等待取消完成，使限流器槽位及时释放
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        if last_error is not None:
+            raise last_error
+        return ""
+
+    def invoke(self, prompt: str) -> str:
+        return run_coroutine_sync(self.ainvoke(prompt))
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """流式调用只做故障转移：按顺序尝试，直到某个服务商产出内容"""
+        from novel_generator.common import _stream_rate_limited
+        last_error = None
+        for index, adapter in enumerate(self.adapters):
+            produced = False
+            try:
+                for chunk in _stream_rate_limited(adapter, prompt):
+                    if chunk:
+                        produced = True
+                        yield chunk
+            except Exception as e:
+                if produced:
+                    raise
+                last_error = e
+                logging.warning(f"[HedgedRoutingAdapter] Provider #{index} stream failed: {e}")
+            if produced:
+                self.wins[index] += 1
+                return
+            if index + 1 < len(self.adapters):
+                self.failovers += 1
+        if last_error is not None:
+            raise last_error
+
+    def stats(self) -> dict:
+        return {
+            "hedges_sent": self.hedges_sent,
+            "failovers": self.failovers,
+            "wins": list(self.wins),
+            "hedge_delay": self.hedge_delay(0),
+            "hedge_delays": [self.hedge_delay(i) for i in range(len(self.adapters))]
+        }
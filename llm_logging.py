@@ -0,0 +1,187 @@
+# llm_logging.py
+# -*- coding: utf-8 -*-
+"""
+LLM 提示词/响应日志：调用线程只把记录放入队列（QueueHandler），由后台 QueueListener 线程写出，
+不再在每次调用时同步向 stdout 打印几十 KB 的完整提示词。
+- 控制台：按级别输出截断后的摘要（默认每段最多 500 字符），可按比例采样；
+- 完整转录（可选）：整段提示词与响应以 JSONL 写入文件，同样在后台线程写出。
+通过 configure_llm_logging() 或环境变量 NOVEL_LLM_LOG_LEVEL / NOVEL_LLM_LOG_SAMPLE / NOVEL_LLM_TRANSCRIPT_PATH 配置。
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+PROMPT = "prompt"
+RESPONSE = "response"
+
+_TITLES = {PROMPT: "发送到 LLM 的提示词", RESPONSE: "LLM 返回的内容"}
+
+_logger = logging.getLogger("novel.llm")
+_logger.propagate = False  # 只经由本模块的队列输出，不重复进入应用根日志
+
+_lock = threading.Lock()
+_listener = None
+_settings = {}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _default_settings() -> dict:
+    level = os.environ.get("NOVEL_LLM_LOG_LEVEL", "INFO").strip().upper()
+    return {
+        "level": logging.getLevelName(level) if isinstance(logging.getLevelName(level), int) else logging.INFO,
+        "excerpt_chars": 500,
+        "sample_rate": _env_float("NOVEL_LLM_LOG_SAMPLE", 1.0),
+        "transcript_path": os.environ.get("NOVEL_LLM_TRANSCRIPT_PATH", "").strip() or None,
+        "stream": None
+    }
+
+
+def make_excerpt(text: str, limit: int) -> str:
+    """保留首尾、省略中间的摘要，便于同时看到提示词的开头（任务）与结尾（格式要求）"""
+    text = text or ""
+    if limit <= 0 or len(text) <= limit:
+        return text
+    head = limit * 2 // 3
+    tail = limit - head
+    return f"{text[:head]}\n…（省略 {len(text) - limit} 字符）…\n{text[-tail:]}"
+
+
+class _ConsoleFormatter(logging.Formatter):
+    """在后台线程中生成摘要，调用线程不做字符串截断与拼接"""
+    def __init__(self, excerpt_chars: int):
+        super().__init__()
+        self.excerpt_chars = excerpt_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = getattr(record, "llm_text", "") or ""
+        title = _TITLES.get(getattr(record, "llm_kind", ""), "LLM")
+        stage = getattr(record, "llm_stage", None) or "llm"
+        return (
+            f"\n{'=' * 50}\n[{stage}] {title}（{len(text)} 字符）:\n{'-' * 50}\n"
+            f"{make_excerpt(text, self.excerpt_chars)}\n{'=' * 50}"
+        )
+
+
+class _TranscriptFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({
+            "ts": round(record.created, 3),
+            "stage": getattr(record, "llm_stage", None),
+            "kind": getattr(record, "llm_kind", None),
+            "source": getattr(record, "llm_source", None),
+            "chars": len(getattr(record, "llm_text", "") or ""),
+            "text": getattr(record, "llm_text", "")
+        }, ensure_ascii=False)
+
+
+class _SampledFilter(logging.Filter):
+    """控制台只输出被采样的记录"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        return getattr(record, "llm_sampled", True)
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()  # 等待队列中剩余的记录写完
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+
+
+def configure_llm_logging(level=None, excerpt_chars: int = None, sample_rate: float = None,
+                          transcript_path: str = None, stream=None):
+    """
+    配置 LLM 提示词/响应日志。
+    :param level: 控制台摘要的日志级别，高于 INFO（如 WARNING）时不输出摘要
+    :param excerpt_chars: 每段摘要的最大字符数，0 表示不截断
+    :param sample_rate: 控制台摘要的采样比例（0~1），完整转录不采样
+    :param transcript_path: 完整转录 JSONL 路径，None 表示不记录；传空字符串可关闭已启用的转录
+    :param stream: 控制台输出流，默认 sys.stdout
+    """
+    global _listener
+    with _lock:
+        if not _settings:
+            _settings.update(_default_settings())
+        for key, value in (("level", level), ("excerpt_chars", excerpt_chars), ("sample_rate", sample_rate),
+                           ("transcript_path", transcript_path), ("stream", stream)):
+            if value is None:
+                continue
+            if key == "transcript_path":
+                value = value or None
+            _settings[key] = value
+        _stop_listener()
+
+        handlers = []
+        console = logging.StreamHandler(_settings["stream"] or sys.stdout)
+        console.setLevel(_settings["level"])
+        console.setFormatter(_ConsoleFormatter(_settings["excerpt_chars"]))
+        console.addFilter(_SampledFilter())
+        handlers.append(console)
+        if _settings["transcript_path"]:
+            os.makedirs(os.path.dirname(os.path.abspath(_settings["transcript_path"])), exist_ok=True)
+            transcript = logging.FileHandler(_settings["transcript_path"], encoding="utf-8")
+            transcript.setLevel(logging.DEBUG)
+            transcript.setFormatter(_TranscriptFormatter())
+            handlers.append(transcript)
+
+        log_queue = queue.SimpleQueue()
+        _logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        _logger.setLevel(min(h.level for h in handlers))
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def _ensure_configured():
+    if _listener is None:
+        configure_llm_logging()
+
+
+def flush_llm_logging():
+    """等待队列中已有的记录全部写出（重启监听线程），用于测试或退出前"""
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener.start()
+
+
+def log_llm_text(kind: str, text: str, stage: str = None, source: str = None, sampled: bool = True):
+    """
+    记录一段提示词（kind=PROMPT）或响应（kind=RESPONSE）。调用线程只做级别判断与入队。
+    sampled 由调用方通过 should_sample() 决定，使同一次调用的提示词与响应一起输出或一起省略。
+    """
+    _ensure_configured()
+    if not _logger.isEnabledFor(logging.INFO):
+        return
+    _logger.info(kind, extra={
+        "llm_kind": kind,
+        "llm_text": text or "",
+        "llm_stage": stage,
+        "llm_source": source,
+        "llm_sampled": sampled
+    })
+
+
+def should_sample() -> bool:
+    """按配置的采样比例决定本次调用是否在控制台输出摘要"""
+    _ensure_configured()
+    rate = _settings.get("sample_rate", 1.0)
+    return rate >= 1.0 or random.random() < rate
+
+
+atexit.register(_stop_listener)
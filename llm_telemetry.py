@@ -0,0 +1,214 @@
+# llm_telemetry.py
+# -*- coding: utf-8 -*-
+"""
+LLM 调用遥测：每次调用（含缓存命中）以一行 JSON 记录阶段、provider、模型、提示词/响应大小、
+估算 token 数、耗时、重试次数与结果，写入按大小轮转的 JSONL 台账；并提供按阶段统计 p50/p95 的汇总工具。
+默认关闭，通过 configure_llm_telemetry() 或环境变量 NOVEL_LLM_TELEMETRY_PATH 启用。
+
+汇总：python llm_telemetry.py llm_calls.jsonl
+"""
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+
+from token_budget import count_tokens
+
+
+class LLMTelemetryLedger:
+    """
+    JSONL 台账，超过 max_bytes 时轮转为 .1 ~ .backup_count（由 RotatingFileHandler 负责，线程安全）。
+    """
+    def __init__(self, path: str, max_bytes: int = 20 * 1024 * 1024, backup_count: int = 5):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        # 独立的 Logger 实例，不注册到 logging 树中，避免台账内容混入应用日志
+        self._logger = logging.Logger(f"llm_telemetry:{path}")
+        self._logger.addHandler(self._handler)
+
+    def record(self, entry: dict):
+        self._logger.info(json.dumps(entry, ensure_ascii=False))
+
+    def close(self):
+        self._logger.removeHandler(self._handler)
+        self._handler.close()
+
+
+class LLMCallTracker:
+    """
+    一次逻辑调用（可能包含多次重试）的计时与记录。
+    调用方在每次实际请求前递增 attempts，结束时调用 finish()；遥测未启用时 finish() 不做任何事。
+    """
+    def __init__(self, llm_adapter, prompt: str, stage: str = None, mode: str = "invoke"):
+        self.llm_adapter = llm_adapter
+        self.prompt = prompt or ""
+        self.stage = stage or "unknown"
+        self.mode = mode
+        self.attempts = 0
+        self.started = time.perf_counter()
+        self.first_chunk_at = None
+
+    def mark_first_chunk(self):
+        """流式调用收到首个片段时调用，用于记录首字延迟"""
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+
+    def finish(self, response: str = None, error: Exception = None, outcome: str = None):
+        ledger = get_llm_telemetry()
+        if ledger is None:
+            return
+        response = response or ""
+        if outcome is None:
+            outcome = "error" if error is not None else ("ok" if response else "empty")
+        model_name = getattr(self.llm_adapter, "model_name", "")
+        entry = {
+            "ts": round(time.time(), 3),
+            "stage": self.stage,
+            "mode": self.mode,
+            "provider": type(self.llm_adapter).__name__,
+            "model": model_name,
+            "prompt_chars": len(self.prompt),
+            "response_chars": len(response),
+            "prompt_tokens": count_tokens(self.prompt, model_name),
+            "response_tokens": count_tokens(response, model_name),
+            "latency_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "attempts": self.attempts,
+            "retries": max(0, self.attempts - 1),
+            "outcome": outcome
+        }
+        if self.first_chunk_at is not None:
+            entry["ttft_ms"] = round((self.first_chunk_at - self.started) * 1000, 1)
+        if error is not None:
+            entry["error"] = f"{type(error).__name__}: {error}"[:300]
+        try:
+            ledger.record(entry)
+        except Exception as e:
+            logging.warning(f"[telemetry] Failed to record LLM call: {e}")
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+_env_checked = False
+
+
+def configure_llm_telemetry(path: str = None, **kwargs):
+    """
+    启用（path 非空）或关闭（path 为 None）LLM 调用遥测。
+    其余参数透传给 LLMTelemetryLedger，如 max_bytes、backup_count。
+    """
+    global _ledger, _env_checked
+    with _ledger_lock:
+        _env_checked = True
+        if _ledger is not None:
+            _ledger.close()
+            _ledger = None
+        if path:
+            _ledger = LLMTelemetryLedger(path, **kwargs)
+            logging.info(f"[telemetry] LLM call ledger enabled at {path}")
+    return _ledger
+
+
+def get_llm_telemetry():
+    """返回当前启用的台账；未启用时返回 None"""
+    global _ledger, _env_checked
+    if not _env_checked:
+        with _ledger_lock:
+            if not _env_checked:
+                _env_checked = True
+                env_path = os.environ.get("NOVEL_LLM_TELEMETRY_PATH", "").strip()
+                if env_path:
+                    _ledger = LLMTelemetryLedger(env_path)
+    return _ledger
+
+
+# ---------- 汇总 ----------
+
+def read_ledger(path: str, include_rotated: bool = True) -> list:
+    """读取台账记录（含已轮转的 .N 文件，按时间先后），跳过无法解析的行"""
+    paths = [path]
+    if include_rotated:
+        index = 1
+        while os.path.exists(f"{path}.{index}"):
+            paths.insert(0, f"{path}.{index}")
+            index += 1
+    records = []
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+def _percentile(values: list, q: float) -> float:
+    """线性插值百分位数，q 取 0~100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize_ledger(records: list) -> dict:
+    """按阶段汇总：调用次数、p50/p95 耗时、平均重试、token 合计、缓存命中与失败次数"""
+    by_stage = {}
+    for r in records:
+        by_stage.setdefault(r.get("stage", "unknown"), []).append(r)
+    summary = {}
+    for stage, items in sorted(by_stage.items()):
+        latencies = [r.get("latency_ms", 0.0) for r in items if r.get("outcome") != "cache_hit"]
+        summary[stage] = {
+            "calls": len(items),
+            "p50_ms": round(_percentile(latencies, 50), 1),
+            "p95_ms": round(_percentile(latencies, 95), 1),
+            "retries": sum(r.get("retries", 0) for r in items),
+            "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in items),
+            "response_tokens": sum(r.get("response_tokens", 0) for r in items),
+            "cache_hits": sum(1 for r in items if r.get("outcome") == "cache_hit"),
+            "failures": sum(1 for r in items if r.get("outcome") in ("error", "empty"))
+        }
+    return summary
+
+
+def format_summary(summary: dict) -> str:
+    header = f"{'stage':<22}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'retries':>9}{'in tok':>10}{'out tok':>10}{'cached':>8}{'failed':>8}"
+    lines = [header, "-" * len(header)]
+    for stage, s in summary.items():
+        lines.append(
+            f"{stage:<22}{s['calls']:>7}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['retries']:>9}"
+            f"{s['prompt_tokens']:>10}{s['response_tokens']:>10}{s['cache_hits']:>8}{s['failures']:>8}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="汇总 LLM 调用遥测台账（按阶段 p50/p95）")
+    parser.add_argument("path", help="JSONL 台账路径")
+    parser.add_argument("--no-rotated", action="store_true", help="不读取已轮转的 .N 文件")
+    args = parser.parse_args(argv)
+    records = read_ledger(args.path, include_rotated=not args.no_rotated)
+    if not records:
+        print(f"No records found in {args.path}")
+        return 1
+    print(format_summary(summarize_ledger(records)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,543 @@
+# mock_llm_server.py
+# -*- coding: utf-8 -*-
+"""
+本地模拟 LLM 服务（仅依赖标准库），用于离线基准测试与回归测试，不消耗真实配额。
+兼容以下线路格式：
+  - OpenAI chat completions：POST .../chat/completions（支持 stream=true 的 SSE）
+  - Gemini：POST ...:generateContent / ...:streamGenerateContent?alt=sse
+  - Embedding：OpenAI/SiliconFlow .../embeddings、Ollama /api/embeddings 与 /api/embed、
+    Gemini :embedContent 与 :batchEmbedContents
+支持脚本化响应、按提示词生成合法格式的模板响应（章节目录、摘要、检索词、正文）、
+可注入的延迟分布、流式输出速率，以及 429 / 超时 / 流式中途失败的故障注入。
+
+用法：
+    with MockLLMServer(latency="uniform:0.05,0.2", rate_limit_ratio=0.1) as server:
+        adapter = create_llm_adapter("OpenAI", server.openai_base_url, "mock-model", "k", 0.7, 4096, 30)
+
+命令行：python mock_llm_server.py --port 8765 --latency lognormal:0.3,0.5 --rate-limit-ratio 0.05
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from token_budget import count_tokens
+
+_FILLER_SENTENCES = [
+    "夜色沉沉，城外的钟声隔着雨幕传来。",
+    "他握紧手中的信，指节因用力而发白。",
+    "走廊尽头的灯忽明忽暗，仿佛有人刚刚离开。",
+    "她没有回头，只是轻声说了一句“该走了”。",
+    "旧案卷宗里夹着一张泛黄的照片，背面写着一个陌生的地名。",
+    "风从破碎的窗棂灌进来，吹散了桌上的灰尘。",
+]
+
+
+def parse_latency(spec):
+    """
+    将延迟描述解析为无参函数，返回每次请求的延迟秒数。
+    支持：数字、callable、"fixed:0.2"、"uniform:0.1,0.5"、"normal:0.3,0.1"、"lognormal:中位数,sigma"
+    """
+    if spec is None:
+        return lambda: 0.0
+    if callable(spec):
+        return spec
+    if isinstance(spec, (int, float)):
+        return lambda: float(spec)
+    kind, _, args = str(spec).partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()]
+    kind = kind.strip().lower()
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+def hashed_embedding(text: str, dim: int = 64) -> list:
+    """将字符二元组哈希到 dim 维并归一化，相似文本得到相近的向量"""
+    vector = [0.0] * dim
+    text = text or ""
+    grams = [text[i:i + 2] for i in range(max(1, len(text) - 1))]
+    for gram in grams:
+        digest = hashlib.md5(gram.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _filler_text(length: int) -> str:
+    parts = []
+    total = 0
+    index = 0
+    while total < length:
+        sentence = _FILLER_SENTENCES[index % len(_FILLER_SENTENCES)]
+        parts.append(sentence)
+        total += len(sentence)
+        index += 1
+    return "".join(parts)
+
+
+def _blueprint_entries(start: int, end: int) -> str:
+    entries = []
+    for n in range(start, end + 1):
+        entries.append(
+            f"第{n}章 - 暗流第{n}幕\n"
+            f"本章定位：主角/线索/转折\n"
+            f"核心作用：推进主线\n"
+            f"悬念密度：渐进\n"
+            f"伏笔操作：埋设(A线索)→强化(B矛盾)\n"
+            f"认知颠覆：★★☆☆☆\n"
+            f"本章简述：主角追查第{n}条线索，发现幕后之人另有所图。\n"
+        )
+    return "\n".join(entries)
+
+
+def templated_response(prompt: str, default_length: int = 800) -> str:
+    """根据提示词特征生成格式合法的模拟输出"""
+    match = re.search(r"现在请设计第(\d+)章到第(\d+)", prompt)
+    if match:
+        return _blueprint_entries(int(match.group(1)), int(match.group(2)))
+    match = re.search(r"设计(\d+)章的节奏分布", prompt)
+    if match:
+        return _blueprint_entries(1, int(match.group(1)))
+    if "当前章节摘要" in prompt:
+        return "当前章节摘要: " + _filler_text(200)
+    if "检索词" in prompt and "·" in prompt:
+        return "旧案卷宗·神秘地名\n雨夜来信·家族旧怨\n钟楼·失踪案"
+    match = re.search(r"(\d{3,5})\s*字", prompt)
+    length = int(match.group(1)) if match else default_length
+    return _filler_text(length)
+
+
+class MockLLMServer:
+    """
+    :param host/port: 监听地址，port=0 表示自动分配
+    :param latency: 首字节前的延迟分布，见 parse_latency
+    :param stream_chunk_chars: 流式输出时每个分片的字符数
+    :param chars_per_second: 流式输出速率（字符/秒），None 表示不限
+    :param rate_limit_ratio: 随机返回 429 的概率
+    :param timeout_ratio: 随机挂起请求（模拟超时）的概率
+    :param hang_seconds: 模拟超时时挂起的秒数
+    :param retry_after: 429 响应的 Retry-After 头（秒）
+    :param responses: 脚本化响应列表，按请求顺序依次返回，用完后回退到模板响应
+    :param responder: 自定义响应函数 responder(prompt, model) -> str，优先级低于 responses
+    :param embedding_dim: 模拟 embedding 的维度
+    :param embedding_scale: 模拟 embedding 的模长（默认 1.0 即归一化；用于模拟旧版 Ollama /api/embeddings 的未归一化向量）
+    :param seed: 随机种子，便于复现
+    """
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency=None,
+        stream_chunk_chars: int = 20,
+        chars_per_second: float = None,
+        rate_limit_ratio: float = 0.0,
+        timeout_ratio: float = 0.0,
+        hang_seconds: float = 30.0,
+        retry_after: float = 1.0,
+        responses=None,
+        responder=None,
+        embedding_dim: int = 64,
+        embedding_scale: float = 1.0,
+        seed: int = None
+    ):
+        self.host = host
+        self.port = port
+        self.latency = parse_latency(latency)
+        self.stream_chunk_chars = max(1, int(stream_chunk_chars))
+        self.chars_per_second = chars_per_second
+        self.rate_limit_ratio = rate_limit_ratio
+        self.timeout_ratio = timeout_ratio
+        self.hang_seconds = hang_seconds
+        self.retry_after = retry_after
+        self.responder = responder
+        self.embedding_dim = embedding_dim
+        self.embedding_scale = embedding_scale
+        self._responses = list(responses or [])
+        self._faults = []
+        self._stream_faults = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._server = None
+        self._thread = None
+        self.reset_stats()
+
+    # ---------- 控制接口 ----------
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.url}/v1"
+
+    @property
+    def gemini_base_url(self) -> str:
+        return f"{self.url}/v1beta"
+
+    def start(self) -> "MockLLMServer":
+        server = ThreadingHTTPServer((self.host, self.port), _MockHandler)
+        server.daemon_threads = True
+        server.mock = self
+        self._server = server
+        self.port = server.server_address[1]
+        self._stopping.clear()
+        self._thread = threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        logging.info(f"[mock_llm_server] Listening on {self.url}")
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def add_responses(self, *responses: str):
+        with self._lock:
+            self._responses.extend(responses)
+
+    def fail_next(self, status: int = 429, count: int = 1):
+        """让接下来的 count 个请求返回指定状态码；status=None 表示挂起（模拟超时）"""
+        with self._lock:
+            self._faults.extend([status] * count)
+
+    def fail_stream_after(self, chunks: int, count: int = 1):
+        """让接下来的 count 个 OpenAI 流式响应在输出 chunks 个分片后发送错误事件并结束（模拟生成中途失败）"""
+        with self._lock:
+            self._stream_faults.extend([max(0, int(chunks))] * count)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {
+                "requests": 0,
+                "by_endpoint": {},
+                "rate_limited": 0,
+                "timeouts": 0,
+                "errors": 0,
+                "bytes_in": 0,
+                "bytes_out": 0,
+                "prompt_bytes": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0
+            }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return json.loads(json.dumps(self._stats))
+
+    # ---------- 内部逻辑 ----------
+
+    def _record(self, endpoint: str, **increments):
+        with self._lock:
+            if endpoint:
+                self._stats["requests"] += 1
+                self._stats["by_endpoint"][endpoint] = self._stats["by_endpoint"].get(endpoint, 0) + 1
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def _next_fault(self):
+        """返回本次请求应注入的故障：状态码、"hang" 或 None"""
+        with self._lock:
+            if self._faults:
+                status = self._faults.pop(0)
+                return "hang" if status is None else status
+            roll = self._random.random()
+        if roll < self.rate_limit_ratio:
+            return 429
+        if roll < self.rate_limit_ratio + self.timeout_ratio:
+            return "hang"
+        return None
+
+    def _next_stream_fault(self):
+        """返回本次流式响应应在第几个分片后中断，None 表示正常输出"""
+        with self._lock:
+            return self._stream_faults.pop(0) if self._stream_faults else None
+
+    def _completion_text(self, prompt: str, model: str) -> str:
+        with self._lock:
+            if self._responses:
+                return self._responses.pop(0)
+        if self.responder is not None:
+            return self.responder(prompt, model)
+        return templated_response(prompt)
+
+    def _chunks(self, text: str):
+        size = self.stream_chunk_chars
+        for i in range(0, len(text), size):
+            chunk = text[i:i + size]
+            if self.chars_per_second:
+                if self._stopping.wait(len(chunk) / self.chars_per_second):
+                    return
+            yield chunk
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持长连接，便于观察客户端连接复用
+
+    def log_message(self, format, *args):
+        logging.debug("[mock_llm_server] " + format % args)
+
+    @property
+    def mock(self) -> MockLLMServer:
+        return self.server.mock
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(data)
+        self.mock._record(None, bytes_out=len(data))
+
+    def _start_sse(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _send_event(self, payload) -> bool:
+        data = ("data: " + (payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)) + "\n\n").encode("utf-8")
+        try:
+            self.wfile.write(data)
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+        self.mock._record(None, bytes_out=len(data))
+        return True
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path.endswith("/stats"):
+            self._send_json(200, self.mock.stats())
+        elif path.endswith("/health") or path == "/":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        path = parts.path
+        query = parse_qs(parts.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw.decode("utf-8") or "{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+
+        routes = [
+            (path.endswith("/chat/completions"), "openai_chat", self._openai_chat),
+            (path.endswith(":streamGenerateContent"), "gemini_stream", self._gemini_generate),
+            (path.endswith(":generateContent"), "gemini_generate", self._gemini_generate),
+            (path.endswith(":batchEmbedContents"), "gemini_batch_embed", self._gemini_batch_embed),
+            (path.endswith(":embedContent"), "gemini_embed", self._gemini_embed),
+            (path.endswith("/api/embeddings"), "ollama_embeddings", self._ollama_embeddings),
+            (path.endswith("/api/embed"), "ollama_embed", self._ollama_embed),
+            (path.endswith("/embeddings"), "openai_embeddings", self._openai_embeddings),
+        ]
+        for matched, endpoint, handler in routes:
+            if matched:
+                break
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+            return
+
+        self.mock._record(endpoint, bytes_in=len(raw))
+        fault = self.mock._next_fault()
+        if fault == "hang":
+            self.mock._record(None, timeouts=1)
+            self.mock._stopping.wait(self.mock.hang_seconds)
+            self.close_connection = True
+            return
+        if isinstance(fault, int):
+            if fault == 429:
+                self.mock._record(None, rate_limited=1)
+            else:
+                self.mock._record(None, errors=1)
+            self._send_json(fault, {"error": {"code": fault, "message": "Injected fault"}},
+                            headers={"Retry-After": self.mock.retry_after} if fault == 429 else None)
+            return
+
+        delay = self.mock.latency()
+        if delay > 0 and self.mock._stopping.wait(delay):
+            return
+        handler(body, path, query)
+
+    # ---------- chat / generate ----------
+
+    def _openai_chat(self, body, path, query):
+        messages = body.get("messages") or []
+        prompt = "\n".join(str(m.get("content", "")) for m in messages if m.get("role") != "system")
+        model = body.get("model", "mock-model")
+        text = self.mock._completion_text(prompt, model)
+        prompt_tokens = count_tokens(prompt, model)
+        completion_tokens = count_tokens(text, model)
+        self.mock._record(None, prompt_bytes=len(prompt.encode("utf-8")), prompt_tokens=prompt_tokens,
+                          completion_tokens=completion_tokens)
+        created = int(time.time())
+        completion_id = f"chatcmpl-mock-{created}"
+        if body.get("stream"):
+            self._start_sse()
+            abort_after = self.mock._next_stream_fault()
+            first = True
+            for index, chunk in enumerate(self.mock._chunks(text)):
+                if index == abort_after:
+                    self.mock._record(None, errors=1)
+                    self._send_event({"error": {"code": 500, "message": "Injected stream fault"}})
+                    return
+                delta = {"content": chunk}
+                if first:
+                    delta["role"] = "assistant"
+                    first = False
+                event = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                if not self._send_event(event):
+                    return
+            self._send_event({"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                              "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            self._send_event("[DONE]")
+            return
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        })
+
+    def _gemini_generate(self, body, path, query):
+        prompt = "\n".join(
+            part.get("text", "")
+            for content in body.get("contents") or []
+            for part in content.get("parts") or []
+        )
+        model = path.rsplit("/", 1)[-1].split(":", 1)[0]
+        text = self.mock._completion_text(prompt, model)
+        prompt_tokens = count_tokens(prompt, model)
+        completion_tokens = count_tokens(text, model)
+        self.mock._record(None, prompt_bytes=len(prompt.encode("utf-8")), prompt_tokens=prompt_tokens,
+                          completion_tokens=completion_tokens)
+
+        def candidate(chunk_text, finished):
+            item = {"content": {"parts": [{"text": chunk_text}], "role": "model"}, "index": 0}
+            if finished:
+                item["finishReason"] = "STOP"
+            return {"candidates": [item]}
+
+        if path.endswith(":streamGenerateContent"):
+            self._start_sse()
+            chunks = list(self.mock._chunks(text)) or [""]
+            for i, chunk in enumerate(chunks):
+                if not self._send_event(candidate(chunk, i == len(chunks) - 1)):
+                    return
+            return
+        result = candidate(text, True)
+        result["usageMetadata"] = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens,
+                                   "totalTokenCount": prompt_tokens + completion_tokens}
+        self._send_json(200, result)
+
+    # ---------- embeddings ----------
+
+    def _embed(self, text) -> list:
+        if not isinstance(text, str):
+            text = json.dumps(text)  # OpenAI SDK 可能发送 token id 列表
+        vector = hashed_embedding(text, self.mock.embedding_dim)
+        scale = self.mock.embedding_scale
+        return vector if scale == 1.0 else [v * scale for v in vector]
+
+    def _openai_embeddings(self, body, path, query):
+        inputs = body.get("input")
+        if isinstance(inputs, str) or (isinstance(inputs, list) and inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        data = [{"object": "embedding", "index": i, "embedding": self._embed(t)} for i, t in enumerate(inputs or [])]
+        self._send_json(200, {"object": "list", "data": data, "model": body.get("model", "mock-embedding"),
+                              "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+    def _ollama_embeddings(self, body, path, query):
+        self._send_json(200, {"embedding": self._embed(body.get("prompt", ""))})
+
+    def _ollama_embed(self, body, path, query):
+        inputs = body.get("input")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        self._send_json(200, {"model": body.get("model", "mock-embedding"),
+                              "embeddings": [self._embed(t) for t in inputs or []]})
+
+    def _gemini_embed(self, body, path, query):
+        text = "".join(p.get("text", "") for p in (body.get("content") or {}).get("parts") or [])
+        self._send_json(200, {"embedding": {"values": self._embed(text)}})
+
+    def _gemini_batch_embed(self, body, path, query):
+        embeddings = []
+        for request in body.get("requests") or []:
+            text = "".join(p.get("text", "") for p in (request.get("content") or {}).get("parts") or [])
+            embeddings.append({"values": self._embed(text)})
+        self._send_json(200, {"embeddings": embeddings})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 LLM 服务（OpenAI / Gemini 线路格式）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default=None, help="如 fixed:0.2、uniform:0.1,0.5、lognormal:0.3,0.5")
+    parser.add_argument("--chars-per-second", type=float, default=None)
+    parser.add_argument("--stream-chunk-chars", type=int, default=20)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--timeout-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = MockLLMServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        chars_per_second=args.chars_per_second,
+        stream_chunk_chars=args.stream_chunk_chars,
+        rate_limit_ratio=args.rate_limit_ratio,
+        timeout_ratio=args.timeout_ratio,
+        seed=args.seed
+    ).start()
+    print(f"OpenAI base_url: {server.openai_base_url}")
+    print(f"Gemini base_url: {server.gemini_base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,18 +10,26 @@ from novel_generator.common import invoke_with_cleaning
 from llm_adapters import create_llm_adapter
 from prompt_definitions import chapter_blueprint_prompt, chunked_chapter_blueprint_prompt
 from utils import read_file, clear_file_content, save_string_to_txt
+from token_budget import count_tokens
 
-def compute_chunk_size(number_of_chapters: int, max_tokens: int) -> int:
+# 单章目录条目的典型样例，用于按模型估算每章目录消耗的输出 token
+_BLUEPRINT_ENTRY_SAMPLE = """第100章 - 雨夜来信
+本章定位：主角/神秘组织/身份之谜
+核心作用：推进主线，揭示组织与主角家族的旧怨
+悬念密度：渐进
+伏笔操作：埋设(A线索：信封上的火漆印)→强化(B矛盾：师徒之间的猜忌)
+认知颠覆：★★☆☆☆
+本章简述：主角在雨夜收到一封来自已故父亲的信，信中提及的地名与组织据点不谋而合，迫使他重新审视身边之人。
+"""
+
+def compute_chunk_size(number_of_chapters: int, max_tokens: int, model_name: str = None) -> int:
     """
-    基于“每章约100 tokens”的粗略估算，
-    再结合当前max_tokens，计算分块大小：
-      chunk_size = (floor(max_tokens/100/10)*10) - 10
+    用离线 token 估算得到“每章目录约消耗多少输出 token”，
+    在 max_tokens 中预留约15%余量后，计算单次可生成的章节数，
     并确保 chunk_size 不会小于1或大于实际章节数。
     """
-    tokens_per_chapter = 100.0
-    ratio = max_tokens / tokens_per_chapter
-    ratio_rounded_to_10 = int(ratio // 10) * 10
-    chunk_size = ratio_rounded_to_10 - 10
+    tokens_per_chapter = max(1, count_tokens(_BLUEPRINT_ENTRY_SAMPLE, model_name))
+    chunk_size = int(max_tokens * 0.85 // tokens_per_chapter)
     if chunk_size < 1:
         chunk_size = 1
     if chunk_size > number_of_chapters:
@@ -87,7 +95,7 @@ def Chapter_blueprint_generate(
         open(filename_dir, "w", encoding="utf-8").close()
 
     existing_blueprint = read_file(filename_dir).strip()
-    chunk_size = compute_chunk_size(number_of_chapters, max_tokens)
+    chunk_size = compute_chunk_size(number_of_chapters, max_tokens, llm_model)
     logging.info(f"Number of chapters = {number_of_chapters}, computed chunk_size = {chunk_size}.")
 
     if existing_blueprint:
@@ -111,7 +119,7 @@ def Chapter_blueprint_generate(
                 user_guidance=user_guidance  # 新增参数
             )
             logging.info(f"Generating chapters [{current_start}..{current_end}] in a chunk...")
-            chunk_result = invoke_with_cleaning(llm_adapter, chunk_prompt)
+            chunk_result = invoke_with_cleaning(llm_adapter, chunk_prompt, stage="blueprint_chunk")
             if not chunk_result.strip():
                 logging.warning(f"Chunk generation for chapters [{current_start}..{current_end}] is empty.")
                 clear_file_content(filename_dir)
@@ -131,7 +139,7 @@ def Chapter_blueprint_generate(
             number_of_chapters=number_of_chapters,
             user_guidance=user_guidance  # 新增参数
         )
-        blueprint_text = invoke_with_cleaning(llm_adapter, prompt)
+        blueprint_text = invoke_with_cleaning(llm_adapter, prompt, stage="blueprint")
         if not blueprint_text.strip():
             logging.warning("Chapter blueprint generation result is empty.")
             return
@@ -156,7 +164,7 @@ def Chapter_blueprint_generate(
             user_guidance=user_guidance  # 新增参数
         )
         logging.info(f"Generating chapters [{current_start}..{current_end}] in a chunk...")
-        chunk_result = invoke_with_cleaning(llm_adapter, chunk_prompt)
+        chunk_result = invoke_with_cleaning(llm_adapter, chunk_prompt, stage="blueprint_chunk")
         if not chunk_result.strip():
             logging.warning(f"Chunk generation for chapters [{current_start}..{current_end}] is empty.")
             clear_file_content(filename_dir)
@@ -16,12 +16,24 @@ from prompt_definitions import (
     knowledge_search_prompt
 )
 from chapter_directory_parser import get_chapter_info_from_blueprint
-from novel_generator.common import invoke_with_cleaning
-from utils import read_file, clear_file_content, save_string_to_txt
+from novel_generator.common import invoke_with_cleaning, stream_with_cleaning, clean_llm_output
+from utils import read_file, save_string_to_txt
+from novel_generator.embedding_cache import get_query_embedding_memo
 from novel_generator.vectorstore_utils import (
-    get_relevant_context_from_vector_store,
-    load_vector_store  # 添加导入
+    multi_query_similarity_search,
+    build_chunk_filter,
+    latest_chunk_chapter,
+    load_vector_store,  # 添加导入
+    get_vector_store_pool_stats,
+    VectorStoreMismatchError
 )
+from token_budget import PromptBudget, truncate_to_tokens
+
+# 各内容段的 token 上限（按所用模型的分词标定估算，而非字符数）
+RECENT_CHAPTERS_TOKEN_CAP = 4000    # 生成摘要时保留的前文
+SUMMARY_TOKEN_CAP = 2000            # 前文摘要
+KNOWLEDGE_SNIPPET_TOKEN_CAP = 600   # 知识过滤时每条检索文本
+RETRIEVAL_TOKEN_CAP = 2000          # 每组关键词的检索结果
 
 def get_last_n_chapters_text(chapters_dir: str, current_chapter_num: int, n: int = 3) -> list:
     """
@@ -60,11 +72,6 @@ def summarize_recent_chapters(
         if not combined_text:
             return ""
             
-        # 限制组合文本长度
-        max_combined_length = 4000
-        if len(combined_text) > max_combined_length:
-            combined_text = combined_text[-max_combined_length:]
-            
         llm_adapter = create_llm_adapter(
             interface_format=interface_format,
             base_url=base_url,
@@ -79,8 +86,7 @@ def summarize_recent_chapters(
         chapter_info = chapter_info or {}
         next_chapter_info = next_chapter_info or {}
         
-        prompt = summarize_recent_chapters_prompt.format(
-            combined_text=combined_text,
+        prompt_kwargs = dict(
             novel_number=novel_number,
             chapter_title=chapter_info.get("chapter_title", "未命名"),
             chapter_role=chapter_info.get("chapter_role", "常规章节"),
@@ -98,15 +104,25 @@ def summarize_recent_chapters(
             next_chapter_foreshadowing=next_chapter_info.get("foreshadowing", "无特殊伏笔"),
             next_chapter_plot_twist_level=next_chapter_info.get("plot_twist_level", "★☆☆☆☆")
         )
+
+        # 按 token 预算保留最近的前文内容（上限 RECENT_CHAPTERS_TOKEN_CAP，且不超出上下文窗口）
+        budget = PromptBudget(model_name, max_output_tokens=max_tokens)
+        combined_text = budget.fit(
+            combined_text,
+            cap=RECENT_CHAPTERS_TOKEN_CAP,
+            fixed_texts=(summarize_recent_chapters_prompt.format(combined_text="", **prompt_kwargs),),
+            keep="tail"
+        )
+        prompt = summarize_recent_chapters_prompt.format(combined_text=combined_text, **prompt_kwargs)
         
-        response_text = invoke_with_cleaning(llm_adapter, prompt)
+        response_text = invoke_with_cleaning(llm_adapter, prompt, stage="summarize_recent")
         summary = extract_summary_from_response(response_text)
         
         if not summary:
             logging.warning("Failed to extract summary, using full response")
-            return response_text[:2000]  # 限制长度
+            return truncate_to_tokens(response_text, SUMMARY_TOKEN_CAP, model_name)  # 限制长度
             
-        return summary[:2000]  # 限制摘要长度
+        return truncate_to_tokens(summary, SUMMARY_TOKEN_CAP, model_name)  # 限制摘要长度
         
     except Exception as e:
         logging.error(f"Error in summarize_recent_chapters: {str(e)}")
@@ -170,13 +186,22 @@ def parse_search_keywords(response_text: str) -> list:
         if '·' in line
     ][:5]  # 最多取5组
 
-def apply_content_rules(texts: list, novel_number: int) -> list:
-    """应用内容处理规则"""
+def _chapter_from_text(text: str) -> int:
+    """旧片段（无元数据）回退：从文本中解析出现的最大数字作为章节号"""
+    chap_nums = list(map(int, re.findall(r'\d+', text)))
+    return max(chap_nums) if chap_nums else 0
+
+def apply_content_rules(texts: list, novel_number: int, chapters: list = None) -> list:
+    """
+    应用内容处理规则。
+    chapters 与 texts 一一对应，为检索片段元数据中的最新章节号（0 表示知识库内容，None 表示无元数据需解析文本）。
+    """
     processed = []
-    for text in texts:
-        if re.search(r'第[\d]+章', text) or re.search(r'chapter_[\d]+', text):
-            chap_nums = list(map(int, re.findall(r'\d+', text)))
-            recent_chap = max(chap_nums) if chap_nums else 0
+    for i, text in enumerate(texts):
+        recent_chap = chapters[i] if chapters and i < len(chapters) else None
+        if recent_chap is None and (re.search(r'第[\d]+章', text) or re.search(r'chapter_[\d]+', text)):
+            recent_chap = _chapter_from_text(text)
+        if recent_chap:
             time_distance = novel_number - recent_chap
             
             if time_distance <= 2:
@@ -189,27 +214,32 @@ def apply_content_rules(texts: list, novel_number: int) -> list:
             processed.append(f"[PRIOR] {text}（优先使用）")
     return processed
 
-def apply_knowledge_rules(contexts: list, chapter_num: int) -> list:
-    """应用知识库使用规则"""
+def apply_knowledge_rules(contexts: list, chapter_num: int, chapters: list = None) -> list:
+    """应用知识库使用规则；chapters 含义同 apply_content_rules"""
     processed = []
-    for text in contexts:
-        # 检测历史章节内容
-        if "第" in text and "章" in text:
+    for i, text in enumerate(contexts):
+        recent_chap = chapters[i] if chapters and i < len(chapters) else None
+        # 无元数据时检测历史章节内容
+        if recent_chap is None and "第" in text and "章" in text:
             # 提取章节号判断时间远近
             chap_nums = [int(s) for s in text.split() if s.isdigit()]
             recent_chap = max(chap_nums) if chap_nums else 0
+            # 与旧逻辑一致：含“第…章”即视为历史章节
+            time_distance = chapter_num - recent_chap
+        elif recent_chap:
             time_distance = chapter_num - recent_chap
-            
-            # 相似度处理规则
-            if time_distance <= 3:  # 近三章内容
-                processed.append(f"[历史章节限制] 跳过近期内容: {text[:50]}...")
-                continue
-                
-            # 允许引用但需要转换
-            processed.append(f"[历史参考] {text} (需进行30%以上改写)")
         else:
             # 第三方知识优先处理
             processed.append(f"[外部知识] {text}")
+            continue
+
+        # 相似度处理规则
+        if time_distance <= 3:  # 近三章内容
+            processed.append(f"[历史章节限制] 跳过近期内容: {text[:50]}...")
+            continue
+
+        # 允许引用但需要转换
+        processed.append(f"[历史参考] {text} (需进行30%以上改写)")
     return processed
 
 def get_filtered_knowledge_context(
@@ -222,14 +252,17 @@ def get_filtered_knowledge_context(
     chapter_info: dict,
     retrieved_texts: list,
     max_tokens: int = 2048,
-    timeout: int = 600
+    timeout: int = 600,
+    retrieved_chapters: list = None
 ) -> str:
-    """优化后的知识过滤处理"""
+    """优化后的知识过滤处理；retrieved_chapters 为各检索文本元数据中的章节号（见 apply_content_rules）"""
     if not retrieved_texts:
         return "（无相关知识库内容）"
 
     try:
-        processed_texts = apply_knowledge_rules(retrieved_texts, chapter_info.get('chapter_number', 0))
+        processed_texts = apply_knowledge_rules(
+            retrieved_texts, chapter_info.get('chapter_number', 0), retrieved_chapters
+        )
         llm_adapter = create_llm_adapter(
             interface_format=interface_format,
             base_url=base_url,
@@ -240,12 +273,10 @@ def get_filtered_knowledge_context(
             timeout=timeout
         )
         
-        # 限制检索文本长度并格式化
+        # 按 token 限制检索文本长度并格式化
         formatted_texts = []
-        max_text_length = 600
         for i, text in enumerate(processed_texts, 1):
-            if len(text) > max_text_length:
-                text = text[:max_text_length] + "..."
+            text = truncate_to_tokens(text, KNOWLEDGE_SNIPPET_TOKEN_CAP, model_name, suffix="...")
             formatted_texts.append(f"[预处理结果{i}]\n{text}")
 
         # 使用格式化函数处理章节信息
@@ -262,7 +293,7 @@ def get_filtered_knowledge_context(
             retrieved_texts="\n\n".join(formatted_texts) if formatted_texts else "（无检索结果）"
         )
         
-        filtered_content = invoke_with_cleaning(llm_adapter, prompt)
+        filtered_content = invoke_with_cleaning(llm_adapter, prompt, stage="knowledge_filter")
         return filtered_content if filtered_content else "（知识内容过滤失败）"
         
     except Exception as e:
@@ -410,11 +441,12 @@ def build_chapter_prompt(
             time_constraint=time_constraint
         )
         
-        search_response = invoke_with_cleaning(llm_adapter, search_prompt)
+        search_response = invoke_with_cleaning(llm_adapter, search_prompt, stage="knowledge_search")
         keyword_groups = parse_search_keywords(search_response)
 
         # 执行向量检索
         all_contexts = []
+        retrieved_chapters = []
         from embedding_adapters import create_embedding_adapter
         embedding_adapter = create_embedding_adapter(
             embedding_interface_format,
@@ -428,23 +460,31 @@ def build_chapter_prompt(
             collection_size = store._collection.count()
             actual_k = min(embedding_retrieval_k, max(1, collection_size))
             
-            for group in keyword_groups:
-                context = get_relevant_context_from_vector_store(
-                    embedding_adapter=embedding_adapter,
-                    query=group,
-                    filepath=filepath,
-                    k=actual_k
-                )
-                if context:
+            # 所有关键词组一次批量向量化 + 一次向量查询，最近两章在索引内按元数据排除
+            group_hits = multi_query_similarity_search(
+                embedding_adapter,
+                keyword_groups,
+                filepath,
+                k=actual_k,
+                where=build_chunk_filter(before_chapter=novel_number - 2)
+            )
+            for group, hits in zip(keyword_groups, group_hits):
+                if hits:
+                    context = truncate_to_tokens(
+                        "\n".join(doc.page_content for doc, _ in hits), RETRIEVAL_TOKEN_CAP, model_name
+                    )
+                    retrieved_chapters.append(latest_chunk_chapter(hits))
                     if any(kw in group.lower() for kw in ["技法", "手法", "模板"]):
                         all_contexts.append(f"[TECHNIQUE] {context}")
                     elif any(kw in group.lower() for kw in ["设定", "技术", "世界观"]):
                         all_contexts.append(f"[SETTING] {context}")
                     else:
                         all_contexts.append(f"[GENERAL] {context}")
+            logging.info(f"[retrieval] Query embedding memo: {get_query_embedding_memo().stats()}")
+            logging.info(f"[retrieval] Vector store pool: {get_vector_store_pool_stats()}")
 
         # 应用内容规则
-        processed_contexts = apply_content_rules(all_contexts, novel_number)
+        processed_contexts = apply_content_rules(all_contexts, novel_number, retrieved_chapters)
         
         # 执行知识过滤
         chapter_info_for_filter = {
@@ -471,10 +511,13 @@ def build_chapter_prompt(
             filepath=filepath,
             chapter_info=chapter_info_for_filter,
             retrieved_texts=processed_contexts,
+            retrieved_chapters=retrieved_chapters,
             max_tokens=max_tokens,
             timeout=timeout
         )
         
+    except VectorStoreMismatchError:
+        raise  # 向量库与当前 embedding 配置不一致时交由界面提示，而不是无检索继续生成
     except Exception as e:
         logging.error(f"知识处理流程异常：{str(e)}")
         filtered_context = "（知识库处理失败）"
@@ -531,10 +574,13 @@ def generate_chapter_draft(
     interface_format: str = "openai",
     max_tokens: int = 2048,
     timeout: int = 600,
-    custom_prompt_text: str = None
+    custom_prompt_text: str = None,
+    on_chunk=None
 ) -> str:
     """
     生成章节草稿，支持自定义提示词
+    草稿以流式方式生成：每收到一段文本即回调 on_chunk(chunk)（若提供），便于界面逐步显示；
+    生成完整结束后才以清理后的全文替换 chapters/chapter_N.txt，失败时保留原有草稿。
     """
     if custom_prompt_text is None:
         prompt_text = build_chapter_prompt(
@@ -575,11 +621,21 @@ def generate_chapter_draft(
         timeout=timeout
     )
 
-    chapter_content = invoke_with_cleaning(llm_adapter, prompt_text)
-    if not chapter_content.strip():
-        logging.warning("Generated chapter draft is empty.")
     chapter_file = os.path.join(chapters_dir, f"chapter_{novel_number}.txt")
-    clear_file_content(chapter_file)
-    save_string_to_txt(chapter_content, chapter_file)
+    # 分片只在内存中累积并回调界面；流式生成完整结束后才替换章节文件，
+    # 中途失败（抛出异常）时保留原有草稿，不会留下被截断的章节
+    chunks = []
+    for chunk in stream_with_cleaning(llm_adapter, prompt_text, stage="draft"):
+        chunks.append(chunk)
+        if on_chunk:
+            on_chunk(chunk)
+
+    chapter_content = clean_llm_output("".join(chunks))
+    if not chapter_content.strip():
+        logging.warning("Generated chapter draft is empty, keeping the previous chapter file.")
+        return chapter_content
+    tmp_file = chapter_file + ".tmp"
+    save_string_to_txt(chapter_content, tmp_file)
+    os.replace(tmp_file, chapter_file)
     logging.info(f"[Draft] Chapter {novel_number} generated as a draft.")
     return chapter_content
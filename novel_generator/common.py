@@ -7,28 +7,30 @@ import logging
 import re
 import time
 import traceback
+from novel_generator.llm_cache import get_llm_cache
+from llm_telemetry import LLMCallTracker
+from llm_logging import log_llm_text, should_sample, PROMPT, RESPONSE
+from rate_limiter import is_rate_limit_error, get_retry_after
+from retry_policy import get_default_retry_policy
+from token_budget import count_tokens
 
 def call_with_retry(func, max_retries=3, sleep_time=2, fallback_return=None, **kwargs):
     """
-    通用的重试机制封装。
+    通用的重试机制封装，退避与错误分类遵循 retry_policy 中的统一策略。
     :param func: 要执行的函数
-    :param max_retries: 最大重试次数
-    :param sleep_time: 重试前的等待秒数
-    :param fallback_return: 如果多次重试仍失败时的返回值
+    :param max_retries: 最大尝试次数
+    :param sleep_time: 首次重试前的基础等待秒数（之后按指数退避并加抖动）
+    :param fallback_return: 如果多次重试仍失败（或遇到不可重试的错误）时的返回值
     :param kwargs: 传给func的命名参数
     :return: func的结果，若失败则返回 fallback_return
     """
-    for attempt in range(1, max_retries + 1):
-        try:
-            return func(**kwargs)
-        except Exception as e:
-            logging.warning(f"[call_with_retry] Attempt {attempt} failed with error: {e}")
-            traceback.print_exc()
-            if attempt < max_retries:
-                time.sleep(sleep_time)
-            else:
-                logging.error("Max retries reached, returning fallback_return.")
-                return fallback_return
+    policy = get_default_retry_policy().with_overrides(max_attempts=max_retries, base_delay=sleep_time)
+    try:
+        return policy.call(func, label="[call_with_retry]", **kwargs)
+    except Exception as e:
+        logging.error(f"[call_with_retry] Giving up after error: {e}")
+        traceback.print_exc()
+        return fallback_return
 
 def remove_think_tags(text: str) -> str:
     """移除 <think>...</think> 包裹的内容"""
@@ -42,36 +44,177 @@ def debug_log(prompt: str, response_content: str):
         f"\n[######################################### Response #########################################]\n{response_content}\n"
     )
 
-def invoke_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3) -> str:
-    """调用 LLM 并清理返回结果"""
-    print("\n" + "="*50)
-    print("发送到 LLM 的提示词:")
-    print("-"*50)
-    print(prompt)
-    print("="*50 + "\n")
-    
-    result = ""
-    retry_count = 0
-    
-    while retry_count < max_retries:
+def _estimate_request_tokens(llm_adapter, prompt: str) -> int:
+    """估算一次请求占用的 token 数（提示词 + 最大输出），用于 TPM 限流"""
+    prompt_tokens = count_tokens(prompt, getattr(llm_adapter, "model_name", None))
+    return prompt_tokens + int(getattr(llm_adapter, "max_tokens", 0) or 0)
+
+def _report_rate_limit_outcome(limiter, error: Exception = None, succeeded: bool = False):
+    if error is not None and is_rate_limit_error(error):
+        limiter.on_throttle(get_retry_after(error))
+    elif succeeded:
+        limiter.on_success()
+
+def _invoke_rate_limited(llm_adapter, prompt: str) -> str:
+    """在适配器的共享限流器（若有）控制下调用 invoke"""
+    limiter = getattr(llm_adapter, "rate_limiter", None)
+    if limiter is None:
+        return llm_adapter.invoke(prompt)
+    with limiter.slot(_estimate_request_tokens(llm_adapter, prompt)):
         try:
             result = llm_adapter.invoke(prompt)
-            print("\n" + "="*50)
-            print("LLM 返回的内容:")
-            print("-"*50)
-            print(result)
-            print("="*50 + "\n")
-            
-            # 清理结果中的特殊格式标记
-            result = result.replace("```", "").strip()
-            if result:
-                return result
-            retry_count += 1
         except Exception as e:
-            print(f"调用失败 ({retry_count + 1}/{max_retries}): {str(e)}")
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise e
-    
+            _report_rate_limit_outcome(limiter, error=e)
+            raise
+    _report_rate_limit_outcome(limiter, succeeded=bool(result))
+    return result
+
+async def _ainvoke_rate_limited(llm_adapter, prompt: str) -> str:
+    limiter = getattr(llm_adapter, "rate_limiter", None)
+    if limiter is None:
+        return await llm_adapter.ainvoke(prompt)
+    async with limiter.aslot(_estimate_request_tokens(llm_adapter, prompt)):
+        try:
+            result = await llm_adapter.ainvoke(prompt)
+        except Exception as e:
+            _report_rate_limit_outcome(limiter, error=e)
+            raise
+    _report_rate_limit_outcome(limiter, succeeded=bool(result))
+    return result
+
+def _stream_rate_limited(llm_adapter, prompt: str):
+    limiter = getattr(llm_adapter, "rate_limiter", None)
+    if limiter is None:
+        yield from llm_adapter.stream(prompt)
+        return
+    produced = False
+    with limiter.slot(_estimate_request_tokens(llm_adapter, prompt)):
+        try:
+            for chunk in llm_adapter.stream(prompt):
+                produced = produced or bool(chunk)
+                yield chunk
+        except Exception as e:
+            _report_rate_limit_outcome(limiter, error=e)
+            raise
+    _report_rate_limit_outcome(limiter, succeeded=produced)
+
+def invoke_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3, stage: str = None) -> str:
+    """
+    调用 LLM 并清理返回结果
+    stage 为调用所属的生成阶段（如 core_seed、blueprint_chunk），用于按阶段启用响应缓存。
+    """
+    tracker = LLMCallTracker(llm_adapter, prompt, stage, mode="invoke")
+    cache = get_llm_cache()
+    if cache:
+        cached = cache.get(llm_adapter, prompt, stage)
+        if cached is not None:
+            tracker.finish(cached, outcome="cache_hit")
+            return cached
+
+    sampled = should_sample()
+    log_llm_text(PROMPT, prompt, stage, source="invoke_with_cleaning", sampled=sampled)
+
+    def _attempt():
+        tracker.attempts += 1
+        result = _invoke_rate_limited(llm_adapter, prompt)
+        log_llm_text(RESPONSE, result, stage, source="invoke_with_cleaning", sampled=sampled)
+        return clean_llm_output(result)
+
+    policy = get_default_retry_policy().with_overrides(max_attempts=max_retries)
+    try:
+        result = policy.call(_attempt, retry_on_result=lambda r: not r, label=f"[{stage or 'llm'}]")
+    except Exception as e:
+        tracker.finish(error=e)
+        raise
+    tracker.finish(result)
+    if result and cache:
+        cache.put(llm_adapter, prompt, result, stage)
     return result
 
+def stream_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3, stage: str = None):
+    """
+    流式调用 LLM，逐段产出原始文本片段。
+    仅在尚未产出任何内容时重试；调用方拼接全部片段后再做与 invoke_with_cleaning 相同的清理。
+    命中响应缓存时一次性产出缓存内容。
+    """
+    tracker = LLMCallTracker(llm_adapter, prompt, stage, mode="stream")
+    cache = get_llm_cache()
+    if cache:
+        cached = cache.get(llm_adapter, prompt, stage)
+        if cached is not None:
+            tracker.finish(cached, outcome="cache_hit")
+            yield cached
+            return
+
+    sampled = should_sample()
+    log_llm_text(PROMPT, prompt, stage, source="stream_with_cleaning", sampled=sampled)
+
+    policy = get_default_retry_policy().with_overrides(max_attempts=max_retries)
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        tracker.attempts = attempt
+        produced = []
+        try:
+            for chunk in _stream_rate_limited(llm_adapter, prompt):
+                if chunk:
+                    tracker.mark_first_chunk()
+                    produced.append(chunk)
+                    yield chunk
+        except Exception as e:
+            # 已经产出的片段无法撤回，只在什么都没产出时重试
+            delay = None if produced else policy.next_delay(attempt, started, e)
+            if delay is None:
+                if produced:
+                    log_llm_text(RESPONSE, "".join(produced), stage, source="stream_with_cleaning", sampled=sampled)
+                tracker.finish("".join(produced), error=e)
+                raise
+            logging.warning(f"[stream_with_cleaning] attempt {attempt}/{policy.max_attempts} failed: {e}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        if produced:
+            log_llm_text(RESPONSE, "".join(produced), stage, source="stream_with_cleaning", sampled=sampled)
+            tracker.finish("".join(produced))
+            if cache:
+                cache.put(llm_adapter, prompt, clean_llm_output("".join(produced)), stage)
+            return
+        delay = policy.next_delay(attempt, started)
+        if delay is None:
+            tracker.finish("")
+            return
+        time.sleep(delay)
+
+def clean_llm_output(text: str) -> str:
+    """清理结果中的特殊格式标记"""
+    return (text or "").replace("```", "").strip()
+
+async def ainvoke_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3, stage: str = None) -> str:
+    """invoke_with_cleaning 的异步版本，可在同一事件循环上并发执行多个 LLM 调用"""
+    tracker = LLMCallTracker(llm_adapter, prompt, stage, mode="ainvoke")
+    cache = get_llm_cache()
+    if cache:
+        cached = cache.get(llm_adapter, prompt, stage)
+        if cached is not None:
+            tracker.finish(cached, outcome="cache_hit")
+            return cached
+
+    sampled = should_sample()
+    log_llm_text(PROMPT, prompt, stage, source="ainvoke_with_cleaning", sampled=sampled)
+
+    async def _attempt():
+        tracker.attempts += 1
+        result = await _ainvoke_rate_limited(llm_adapter, prompt)
+        log_llm_text(RESPONSE, result, stage, source="ainvoke_with_cleaning", sampled=sampled)
+        return clean_llm_output(result)
+
+    policy = get_default_retry_policy().with_overrides(max_attempts=max_retries)
+    try:
+        result = await policy.acall(_attempt, retry_on_result=lambda r: not r, label=f"[{stage or 'llm'}]")
+    except Exception as e:
+        tracker.finish(error=e)
+        raise
+    tracker.finish(result)
+    if result and cache:
+        cache.put(llm_adapter, prompt, result, stage)
+    return result
@@ -0,0 +1,297 @@
+#novel_generator/embedding_cache.py
+# -*- coding: utf-8 -*-
+"""
+Embedding 向量的持久化缓存（SQLite），按 embedding 模型 + 文本 sha256 寻址，每个项目一个库文件。
+重新定稿章节、重建向量库或重复导入知识库时，未变化的文本段直接复用历史向量，只有新文本需要请求接口。
+缓存文件位于向量库目录之外，清空向量库不会清空缓存。
+检索用的查询向量另由 QueryEmbeddingMemo 在内存中做 LRU，并落盘到同一缓存库。
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+EMBEDDING_CACHE_FILENAME = "embedding_cache.sqlite"
+
+# 向量的存储精度：float16 体积减半且对余弦相似度几乎无影响；int8 为逐向量缩放的对称量化，体积约为 1/4
+VECTOR_DTYPES = ("float32", "float16", "int8")
+DEFAULT_VECTOR_DTYPE = "float16"
+
+
+def encode_vector(vector, dtype: str = DEFAULT_VECTOR_DTYPE) -> bytes:
+    """按 dtype 将向量编码为二进制；int8 在数据前附带 float32 缩放系数"""
+    import numpy as np
+    values = np.asarray(vector, dtype=np.float32)
+    if dtype == "float32":
+        return values.tobytes()
+    if dtype == "float16":
+        return values.astype(np.float16).tobytes()
+    if dtype == "int8":
+        peak = float(np.max(np.abs(values))) if values.size else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        quantized = np.clip(np.rint(values / scale), -127, 127).astype(np.int8)
+        return np.float32(scale).tobytes() + quantized.tobytes()
+    raise ValueError(f"Unknown vector dtype: {dtype}")
+
+
+def decode_vector(blob: bytes, dtype: str = DEFAULT_VECTOR_DTYPE) -> list:
+    """encode_vector 的逆过程，返回 float 列表"""
+    import numpy as np
+    if dtype == "float32":
+        return np.frombuffer(blob, dtype=np.float32).tolist()
+    if dtype == "float16":
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32).tolist()
+    if dtype == "int8":
+        scale = float(np.frombuffer(blob[:4], dtype=np.float32)[0])
+        return (np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale).tolist()
+    raise ValueError(f"Unknown vector dtype: {dtype}")
+
+
+def get_embedding_model_id(embedding_adapter) -> str:
+    """
+    缓存与向量库头信息中区分模型的标识：适配器类型 + 模型名（不同 provider 的同名模型向量不可混用）。
+    适配器的 model_id_tag 标记向量分布的变化（如 Ollama 改用 /api/embed 后返回归一化向量），
+    使旧向量库校验不通过、旧缓存条目不再命中。
+    """
+    name = type(embedding_adapter).__name__
+    model_name = getattr(embedding_adapter, 'model_name', '')
+    tag = getattr(embedding_adapter, 'model_id_tag', '')
+    return f"{name}:{tag}:{model_name}" if tag else f"{name}:{model_name}"
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    基于 SQLite 的 embedding 缓存，向量按 dtype（float32/float16/int8）量化后以二进制存储，
+    每条记录自带 dtype，修改精度后旧条目仍可读取；支持条目数/字节数上限，超出时按最近访问时间 LRU 淘汰。
+    """
+    def __init__(self, db_path: str, max_entries: int = 100000, max_bytes: int = 512 * 1024 * 1024,
+                 dtype: str = DEFAULT_VECTOR_DTYPE):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype}")
+        self.db_path = db_path
+        self.dtype = dtype
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " accessed REAL NOT NULL,"
+            " dtype TEXT NOT NULL DEFAULT 'float32',"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(embedding_cache)")]
+        if "dtype" not in columns:  # 早期版本的缓存库只存 float32
+            self._conn.execute("ALTER TABLE embedding_cache ADD COLUMN dtype TEXT NOT NULL DEFAULT 'float32'")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_accessed ON embedding_cache(accessed)")
+        self._conn.commit()
+
+    def get_many(self, model: str, texts) -> dict:
+        """返回 {texts 中的下标: 向量}，只包含命中的条目"""
+        hashes = [_text_hash(t) for t in texts]
+        found = {}
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            # SQLite 单条语句的参数个数有限，分段查询
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector, dtype FROM embedding_cache WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                    [model, *part]
+                ).fetchall()
+                found.update((h, (blob, dtype)) for h, blob, dtype in rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embedding_cache SET accessed = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found]
+                )
+                self._conn.commit()
+            result = {}
+            for index, h in enumerate(hashes):
+                if h in found:
+                    result[index] = decode_vector(*found[h])
+            self.hits += len(result)
+            self.misses += len(hashes) - len(result)
+        return result
+
+    def put_many(self, model: str, texts, vectors):
+        """写入缓存（空向量不缓存），并按上限淘汰最久未访问的条目"""
+        now = time.time()
+        rows = []
+        for text, vec in zip(texts, vectors):
+            if not vec:
+                continue
+            blob = encode_vector(vec, self.dtype)
+            rows.append((model, _text_hash(text), blob, len(blob), now, self.dtype))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (model, text_hash, vector, size, accessed, dtype) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embedding_cache"
+        ).fetchone()
+        excess = 0
+        if self.max_entries and count > self.max_entries:
+            excess = count - self.max_entries
+        if self.max_bytes and total > self.max_bytes and count > 0:
+            # 条目大小基本一致（同一模型维度相同），按平均大小估算需淘汰的条数
+            excess = max(excess, -(-(total - self.max_bytes) * count // total))
+        if excess:
+            self._conn.execute(
+                "DELETE FROM embedding_cache WHERE rowid IN "
+                "(SELECT rowid FROM embedding_cache ORDER BY accessed ASC LIMIT ?)",
+                (excess,)
+            )
+            logging.info(f"[embedding_cache] Evicted {excess} least recently used vectors.")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embedding_cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embedding_cache"
+            ).fetchone()
+        return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_caches = {}
+_settings = {"enabled": os.environ.get("NOVEL_EMBEDDING_CACHE", "1").strip() != "0"}
+_caches_lock = threading.Lock()
+
+
+def configure_embedding_cache(enabled: bool = True, **kwargs):
+    """
+    启用或关闭项目级 embedding 缓存（默认启用，也可设置环境变量 NOVEL_EMBEDDING_CACHE=0 关闭）。
+    其余参数透传给 EmbeddingCache，如 max_entries、max_bytes、dtype；已打开的缓存会被关闭并按新参数重新打开。
+    """
+    with _caches_lock:
+        _settings.clear()
+        _settings["enabled"] = bool(enabled)
+        _settings.update(kwargs)
+        for cache in _caches.values():
+            cache.close()
+        _caches.clear()
+
+
+def get_embedding_cache(filepath: str):
+    """返回 filepath（项目目录）对应的缓存实例；未启用时返回 None"""
+    if not _settings.get("enabled") or not filepath:
+        return None
+    db_path = os.path.abspath(os.path.join(filepath, EMBEDDING_CACHE_FILENAME))
+    with _caches_lock:
+        cache = _caches.get(db_path)
+        if cache is None:
+            options = {k: v for k, v in _settings.items() if k != "enabled"}
+            cache = EmbeddingCache(db_path, **options)
+            _caches[db_path] = cache
+        return cache
+
+
+def _query_namespace(model_id: str) -> str:
+    # 查询向量与文档向量分开存放，避免不同 provider 对两者采用不同接口/任务类型时混用
+    return f"query|{model_id}"
+
+
+class QueryEmbeddingMemo:
+    """
+    检索查询向量的两级记忆：进程内 LRU（跨章节共享）+ 项目 embedding 缓存（跨会话共享）。
+    人名、地名等关键词组会逐章重复出现，命中后检索只剩向量搜索本身的耗时。
+    """
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key, vector):
+        compact = array("f", vector)  # 每维 4 字节，远小于 Python float 列表
+        with self._lock:
+            self._entries[key] = compact
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, model_id: str, query: str, disk_cache: EmbeddingCache = None):
+        """命中时返回向量，否则返回 None"""
+        key = (model_id, query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return vector.tolist()
+        if disk_cache is not None:
+            vector = disk_cache.get_many(_query_namespace(model_id), [query]).get(0)
+            if vector:
+                self._remember(key, vector)
+                with self._lock:
+                    self.disk_hits += 1
+                return vector
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, model_id: str, query: str, vector, disk_cache: EmbeddingCache = None):
+        """记录查询向量（空向量不记录）"""
+        if not vector:
+            return
+        self._remember((model_id, query), vector)
+        if disk_cache is not None:
+            disk_cache.put_many(_query_namespace(model_id), [query], [vector])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / total if total else 0.0
+            }
+
+
+_query_memo = QueryEmbeddingMemo()
+
+
+def get_query_embedding_memo() -> QueryEmbeddingMemo:
+    """返回进程级共享的查询向量记忆"""
+    return _query_memo
@@ -4,12 +4,13 @@
 定稿章节和扩写章节（finalize_chapter、enrich_chapter_text）
 """
 import os
+import asyncio
 import logging
 from llm_adapters import create_llm_adapter
 from embedding_adapters import create_embedding_adapter
 from prompt_definitions import summary_prompt, update_character_state_prompt
-from novel_generator.common import invoke_with_cleaning
-from utils import read_file, clear_file_content, save_string_to_txt
+from novel_generator.common import invoke_with_cleaning, ainvoke_with_cleaning
+from utils import read_file, clear_file_content, save_string_to_txt, run_coroutine_sync
 from novel_generator.vectorstore_utils import update_vector_store
 
 def finalize_chapter(
@@ -58,15 +59,21 @@ def finalize_chapter(
         chapter_text=chapter_text,
         global_summary=old_global_summary
     )
-    new_global_summary = invoke_with_cleaning(llm_adapter, prompt_summary)
-    if not new_global_summary.strip():
-        new_global_summary = old_global_summary
-
     prompt_char_state = update_character_state_prompt.format(
         chapter_text=chapter_text,
         old_state=old_character_state
     )
-    new_char_state = invoke_with_cleaning(llm_adapter, prompt_char_state)
+
+    # 前文摘要与角色状态互不依赖，在同一事件循环上并发生成
+    async def _generate_updates():
+        return await asyncio.gather(
+            ainvoke_with_cleaning(llm_adapter, prompt_summary, stage="global_summary"),
+            ainvoke_with_cleaning(llm_adapter, prompt_char_state, stage="character_state")
+        )
+    new_global_summary, new_char_state = run_coroutine_sync(_generate_updates())
+
+    if not new_global_summary.strip():
+        new_global_summary = old_global_summary
     if not new_char_state.strip():
         new_char_state = old_character_state
 
@@ -83,7 +90,8 @@ def finalize_chapter(
             embedding_model_name
         ),
         new_chapter=chapter_text,
-        filepath=filepath
+        filepath=filepath,
+        chapter_number=novel_number
     )
 
     logging.info(f"Chapter {novel_number} has been finalized.")
@@ -115,5 +123,5 @@ def enrich_chapter_text(
 原内容：
 {chapter_text}
 """
-    enriched_text = invoke_with_cleaning(llm_adapter, prompt)
+    enriched_text = invoke_with_cleaning(llm_adapter, prompt, stage="enrich")
     return enriched_text if enriched_text else chapter_text
@@ -0,0 +1,437 @@
+#novel_generator/flat_vectorstore.py
+# -*- coding: utf-8 -*-
+"""
+纯 NumPy 的内存映射平面向量索引，作为单写者项目的 Chroma 替代后端：
+- 向量：flat_vectors.npy（写入时 L2 归一化，按容量倍增，open_memmap 映射），启动时不读入内存；
+  行可按 float32 / float16 / int8 存储，int8 为逐行对称量化，缩放系数存于 flat_scales.npy，打分时反量化；
+- 元数据：flat_meta.jsonl 追加写日志（add / update / delete），日志写入成功后才更新内存，启动时回放；
+- 检索：矩阵点积 + argpartition 取 top-k，多条查询一次完成。
+对外提供 langchain_chroma.Chroma 中本项目用到的接口子集（add_documents / delete / similarity_search* / _collection）。
+只支持单进程写入；同一进程内由锁保证线程安全。
+"""
+import os
+import json
+import uuid
+import shutil
+import logging
+import threading
+
+import numpy as np
+
+from .embedding_cache import VECTOR_DTYPES
+
+FLAT_VECTORS_FILENAME = "flat_vectors.npy"
+FLAT_SCALES_FILENAME = "flat_scales.npy"
+FLAT_META_FILENAME = "flat_meta.jsonl"
+
+_INITIAL_CAPACITY = 1024
+# 已删除行超过该数量且多于存活行时自动压缩
+_COMPACT_MIN_DEAD = 1024
+# 压缩时新文件的临时目录（位于向量库目录内）
+_COMPACT_DIRNAME = "compact.tmp"
+# 量化存储时分块反量化打分，避免一次性复制整个矩阵
+_SCORE_BLOCK_ROWS = 65536
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def _release(matrix):
+    """刷盘并立即关闭内存映射：Windows 下文件仍被映射时无法替换或删除，不能等垃圾回收"""
+    if matrix is None:
+        return
+    matrix.flush()
+    mapping = getattr(matrix, "_mmap", None)
+    if mapping is not None:
+        try:
+            mapping.close()
+        except BufferError:
+            pass  # 仍有视图引用该映射时只能交给垃圾回收
+
+
+def _quantize(vectors: np.ndarray, dtype: str):
+    """按存储精度编码行向量，返回 (存储矩阵, 逐行缩放系数)；仅 int8 有缩放系数"""
+    if dtype == "int8":
+        peak = np.max(np.abs(vectors), axis=1)
+        scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+        return np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8), scales
+    return vectors.astype(dtype), None
+
+
+def _compare(op: str, value, operand) -> bool:
+    try:
+        if op == "$eq":
+            return value == operand
+        if op == "$ne":
+            return value != operand
+        if op == "$lt":
+            return value < operand
+        if op == "$lte":
+            return value <= operand
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$in":
+            return value in operand
+        if op == "$nin":
+            return value not in operand
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported where operator: {op}")
+
+
+def match_where(metadata: dict, where: dict) -> bool:
+    """按 Chroma where 语义匹配元数据（支持 $and/$or 与 $eq/$ne/$lt/$lte/$gt/$gte/$in/$nin；缺失的键不匹配）"""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(match_where(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(match_where(metadata, c) for c in condition):
+                return False
+        elif key not in metadata:
+            return False
+        elif isinstance(condition, dict):
+            if not all(_compare(op, metadata[key], operand) for op, operand in condition.items()):
+                return False
+        elif metadata[key] != condition:
+            return False
+    return True
+
+
+class FlatCollection:
+    """
+    平面索引的存储层，返回结构与 chromadb Collection 的 get/query 一致（ids/documents/metadatas/distances）。
+    distances 为归一化向量间的平方 L2 距离（2 - 2·cos），越小越相关。
+    """
+
+    def __init__(self, directory: str, dtype: str = "float32"):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype}")
+        self.directory = directory
+        self.dtype = dtype  # 已有向量文件时以文件中的精度为准
+        self.vectors_path = os.path.join(directory, FLAT_VECTORS_FILENAME)
+        self.scales_path = os.path.join(directory, FLAT_SCALES_FILENAME)
+        self.meta_path = os.path.join(directory, FLAT_META_FILENAME)
+        self._lock = threading.RLock()
+        self._log = None
+        self._reset_state()
+        self._load()
+
+    def _reset_state(self):
+        self._matrix = None
+        self._scales = None
+        self._dim = None
+        self._rows = 0
+        self._ids = []
+        self._documents = []
+        self._metadatas = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_of = {}
+        self._mask_cache = {}
+
+    # ---------- 持久化 ----------
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.vectors_path):
+            self._matrix = np.lib.format.open_memmap(self.vectors_path, mode="r+")
+            self.dtype = self._matrix.dtype.name
+            if self.dtype == "int8":
+                self._scales = np.lib.format.open_memmap(self.scales_path, mode="r+")
+            self._dim = self._matrix.shape[1]
+            self._alive = np.zeros(self._matrix.shape[0], dtype=bool)
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logging.warning(f"[flat_index] Skipping unreadable log line {line_no} in {self.meta_path}")
+                    continue
+                self._replay(entry)
+
+    def _replay(self, entry: dict):
+        op = entry.get("op")
+        if op == "add":
+            row = entry["row"]
+            if self._matrix is None or row >= self._matrix.shape[0]:
+                return  # 向量未落盘的残缺记录
+            while len(self._ids) <= row:
+                self._ids.append(None)
+                self._documents.append(None)
+                self._metadatas.append(None)
+            self._drop(entry["id"])
+            self._ids[row] = entry["id"]
+            self._documents[row] = entry.get("text", "")
+            self._metadatas[row] = entry.get("meta") or {}
+            self._alive[row] = True
+            self._row_of[entry["id"]] = row
+            self._rows = max(self._rows, row + 1)
+        elif op == "update":
+            row = self._row_of.get(entry["id"])
+            if row is not None:
+                self._metadatas[row] = entry.get("meta") or {}
+        elif op == "delete":
+            self._drop(entry["id"])
+
+    def _drop(self, doc_id: str) -> bool:
+        row = self._row_of.pop(doc_id, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        return True
+
+    def _append_log(self, entries: list):
+        if self._log is None:
+            self._log = open(self.meta_path, "a", encoding="utf-8")
+        self._log.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries))
+        self._log.flush()
+        self._mask_cache.clear()
+
+    def _grow_file(self, path: str, current, shape: tuple, dtype: str) -> str:
+        """把现有行复制到更大的临时文件，返回临时文件路径"""
+        tmp_path = path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=shape)
+        if current is not None and self._rows:
+            grown[:self._rows] = current[:self._rows]
+        _release(grown)
+        return tmp_path
+
+    def _ensure_capacity(self, needed: int, dim: int):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(_INITIAL_CAPACITY, capacity * 2, needed)
+        tmp_vectors = self._grow_file(self.vectors_path, self._matrix, (new_capacity, dim), self.dtype)
+        tmp_scales = None
+        if self.dtype == "int8":
+            tmp_scales = self._grow_file(self.scales_path, self._scales, (new_capacity,), "float32")
+        self._release_matrices()
+        if tmp_scales:
+            os.replace(tmp_scales, self.scales_path)
+            self._scales = np.lib.format.open_memmap(self.scales_path, mode="r+")
+        os.replace(tmp_vectors, self.vectors_path)
+        self._matrix = np.lib.format.open_memmap(self.vectors_path, mode="r+")
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+
+    def _release_matrices(self):
+        _release(self._matrix)
+        _release(self._scales)
+        self._matrix = self._scales = None
+
+    def compact(self):
+        """重写向量文件与日志，只保留存活的行；新文件先写到临时目录，关闭映射后再替换原文件"""
+        with self._lock:
+            live = np.flatnonzero(self._alive[:self._rows])
+            staging_dir = os.path.join(self.directory, _COMPACT_DIRNAME)
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            staging = FlatCollection(staging_dir, self.dtype)
+            staging._dim = self._dim
+            if len(live):
+                staging._write_rows(
+                    [self._ids[r] for r in live], self._dequantize(live),
+                    [self._documents[r] for r in live], [self._metadatas[r] for r in live]
+                )
+            staging.close()
+            self.close()
+            for name in (FLAT_SCALES_FILENAME, FLAT_VECTORS_FILENAME, FLAT_META_FILENAME):
+                source, target = os.path.join(staging_dir, name), os.path.join(self.directory, name)
+                if os.path.exists(source):
+                    os.replace(source, target)
+                elif os.path.exists(target):
+                    os.remove(target)
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            self._reset_state()
+            self._load()
+            logging.info(f"[flat_index] Compacted {self.directory} to {len(live)} rows.")
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            self._release_matrices()
+
+    # ---------- Collection 接口 ----------
+    def count(self) -> int:
+        with self._lock:
+            return len(self._row_of)
+
+    def _mask(self, where: dict = None) -> np.ndarray:
+        alive = self._alive[:self._rows]
+        if not where:
+            return alive
+        key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            matches = np.fromiter(
+                (bool(m) and match_where(m, where) for m in self._metadatas[:self._rows]),
+                dtype=bool, count=self._rows
+            )
+            mask = self._mask_cache[key] = alive & matches
+        return mask
+
+    def _dequantize(self, rows) -> np.ndarray:
+        """把指定行还原为 float32"""
+        vectors = np.asarray(self._matrix[rows], dtype=np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """所有行与查询的余弦相似度 (rows × m)；量化存储时分块反量化后再做点积"""
+        if self.dtype == "float32":
+            return self._matrix[:self._rows] @ queries.T
+        sims = np.empty((self._rows, len(queries)), dtype=np.float32)
+        for start in range(0, self._rows, _SCORE_BLOCK_ROWS):
+            block = slice(start, min(start + _SCORE_BLOCK_ROWS, self._rows))
+            sims[block] = self._matrix[block].astype(np.float32) @ queries.T
+            if self._scales is not None:
+                sims[block] *= self._scales[block, None]
+        return sims
+
+    def _write_rows(self, ids, vectors: np.ndarray, documents, metadatas):
+        start = self._rows
+        self._ensure_capacity(start + len(ids), vectors.shape[1])
+        stored, scales = _quantize(vectors, self.dtype)
+        self._matrix[start:start + len(ids)] = stored
+        if scales is not None:
+            self._scales[start:start + len(ids)] = scales
+            self._scales.flush()
+        self._matrix.flush()  # 向量先落盘，再写日志
+        entries = [
+            {"op": "add", "row": start + offset, "id": doc_id, "text": text, "meta": meta or {}}
+            for offset, (doc_id, text, meta) in enumerate(zip(ids, documents, metadatas))
+        ]
+        self._append_log(entries)  # 日志写入成功后才更新内存状态，失败时内存与磁盘保持一致
+        for entry in entries:
+            self._replay(entry)
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        """写入（同 ID 覆盖）；向量会被 L2 归一化"""
+        if not ids:
+            return
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self._dim}")
+            documents = documents or [""] * len(ids)
+            metadatas = metadatas or [None] * len(ids)
+            self._write_rows(list(ids), vectors, list(documents), list(metadatas))
+
+    def update(self, ids, metadatas):
+        with self._lock:
+            entries = [{"op": "update", "id": i, "meta": m or {}} for i, m in zip(ids, metadatas) if i in self._row_of]
+            if entries:
+                self._append_log(entries)
+            for entry in entries:
+                self._replay(entry)
+
+    def delete(self, ids=None, where: dict = None):
+        with self._lock:
+            targets = list(ids or [])
+            if where:
+                targets += [self._ids[r] for r in np.flatnonzero(self._mask(where))]
+            entries = [{"op": "delete", "id": i} for i in dict.fromkeys(targets) if i in self._row_of]
+            if entries:
+                self._append_log(entries)
+            for entry in entries:
+                self._replay(entry)
+            dead = self._rows - len(self._row_of)
+            if dead >= _COMPACT_MIN_DEAD and dead > len(self._row_of):
+                self.compact()
+
+    def get(self, ids=None, where: dict = None, limit: int = None, include=None) -> dict:
+        with self._lock:
+            if ids is not None:
+                rows = [self._row_of[i] for i in ids if i in self._row_of]
+                if where:
+                    rows = [r for r in rows if match_where(self._metadatas[r], where)]
+            else:
+                rows = np.flatnonzero(self._mask(where)).tolist()
+            rows = rows[:limit] if limit else rows
+            return {
+                "ids": [self._ids[r] for r in rows],
+                "documents": [self._documents[r] for r in rows],
+                "metadatas": [self._metadatas[r] for r in rows]
+            }
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict = None, include=None) -> dict:
+        """多查询一次完成：(rows × dim) @ (dim × m) 的相似度矩阵上按列 argpartition 取 top-k"""
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._lock:
+            mask = self._mask(where)
+            k = min(n_results, int(mask.sum()))
+            if k <= 0:
+                for key in result:
+                    result[key] = [[] for _ in range(len(queries))]
+                return result
+            if queries.shape[1] != self._dim:
+                raise ValueError(f"Query dimension {queries.shape[1]} does not match index dimension {self._dim}")
+            sims = self._scores(queries)
+            sims[~mask] = -np.inf
+            if k < self._rows:
+                top = np.argpartition(-sims, k - 1, axis=0)[:k]
+            else:
+                top = np.repeat(np.arange(self._rows)[:, None], len(queries), axis=1)
+            for column in range(len(queries)):
+                candidates = top[:, column]
+                rows = candidates[np.argsort(-sims[candidates, column], kind="stable")][:k]
+                result["ids"].append([self._ids[r] for r in rows])
+                result["documents"].append([self._documents[r] for r in rows])
+                result["metadatas"].append([self._metadatas[r] for r in rows])
+                result["distances"].append(np.maximum(2.0 - 2.0 * sims[rows, column], 0.0).tolist())
+        return result
+
+
+class FlatVectorStore:
+    """与 langchain_chroma.Chroma 接口兼容的平面索引向量库"""
+    backend_name = "flat"
+
+    def __init__(self, persist_directory: str, embedding_function, dtype: str = "float32"):
+        self._embedding_function = embedding_function
+        self._collection = FlatCollection(persist_directory, dtype)
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def add_texts(self, texts, metadatas=None, ids=None) -> list:
+        texts = [str(t) for t in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = self._embedding_function.embed_documents(texts)
+        self._collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+        return ids
+
+    def add_documents(self, documents, ids=None) -> list:
+        return self.add_texts(
+            [d.page_content for d in documents], [dict(d.metadata or {}) for d in documents], ids
+        )
+
+    def delete(self, ids=None):
+        self._collection.delete(ids=ids)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None) -> list:
+        from langchain.docstore.document import Document
+        response = self._collection.query(
+            query_embeddings=[self._embedding_function.embed_query(query)], n_results=k, where=filter
+        )
+        return [
+            (Document(page_content=doc, metadata=meta or {}), distance)
+            for doc, meta, distance in zip(response["documents"][0], response["metadatas"][0], response["distances"][0])
+        ]
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None) -> list:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def close(self):
+        self._collection.close()
@@ -7,11 +7,13 @@ import os
 import logging
 import re
 import traceback
-import nltk
 import warnings
 from utils import read_file
-from novel_generator.vectorstore_utils import load_vector_store, init_vector_store
-from langchain.docstore.document import Document
+from novel_generator.vectorstore_utils import (
+    load_vector_store, init_vector_store, split_sentences, record_vector_store_meta,
+    make_chunk_metadatas, make_chunk_ids, replace_knowledge_segments, SOURCE_KNOWLEDGE,
+    VectorStoreMismatchError
+)
 
 # 禁用特定的Torch警告
 warnings.filterwarnings('ignore', message='.*Torch was not compiled with flash attention.*')
@@ -19,9 +21,7 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 def advanced_split_content(content: str, similarity_threshold: float = 0.7, max_length: int = 500) -> list:
     """使用基本分段策略"""
-    nltk.download('punkt', quiet=True)
-    nltk.download('punkt_tab', quiet=True)
-    sentences = nltk.sent_tokenize(content)
+    sentences = split_sentences(content)
     if not sentences:
         return []
 
@@ -62,6 +62,9 @@ def import_knowledge_file(
         logging.warning("知识库文件内容为空。")
         return
     paragraphs = advanced_split_content(content)
+    file_name = os.path.basename(file_path)
+    metadatas = make_chunk_metadatas(content, paragraphs, SOURCE_KNOWLEDGE, file=file_name)
+    ids = make_chunk_ids(paragraphs, metadatas)
     from embedding_adapters import create_embedding_adapter
     embedding_adapter = create_embedding_adapter(
         embedding_interface_format,
@@ -72,16 +75,21 @@ def import_knowledge_file(
     store = load_vector_store(embedding_adapter, filepath)
     if not store:
         logging.info("Vector store does not exist or load failed. Initializing a new one for knowledge import...")
-        store = init_vector_store(embedding_adapter, paragraphs, filepath)
+        store = init_vector_store(embedding_adapter, paragraphs, filepath, metadatas, ids)
         if store:
             logging.info("知识库文件已成功导入至向量库(新初始化)。")
         else:
             logging.warning("知识库导入失败，跳过。")
     else:
         try:
-            docs = [Document(page_content=str(p)) for p in paragraphs]
-            store.add_documents(docs)
-            logging.info("知识库文件已成功导入至向量库(追加模式)。")
+            # 重复导入同一文件时替换该文件的旧片段，而非追加
+            result = replace_knowledge_segments(store, file_name, paragraphs, metadatas)
+            record_vector_store_meta(store, filepath)
+            logging.info(
+                f"知识库文件已成功导入至向量库(新增 {result['added']}，删除 {result['removed']}，保留 {result['kept']})。"
+            )
+        except VectorStoreMismatchError:
+            raise
         except Exception as e:
             logging.warning(f"知识库导入失败: {e}")
             traceback.print_exc()
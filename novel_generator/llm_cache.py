@@ -0,0 +1,197 @@
+#novel_generator/llm_cache.py
+# -*- coding: utf-8 -*-
+"""
+LLM 响应的持久化缓存（SQLite），按 服务商 + 接口地址 + 模型 + temperature + 提示词哈希 寻址。
+默认关闭，通过 config.json 的 "llm_cache" 配置段、configure_llm_cache() 或环境变量 NOVEL_LLM_CACHE_PATH 启用；
+用于生成中断后的恢复与确定性重跑，相同提示词直接回放历史输出。
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# 默认不缓存的阶段：用户重新生成草稿时期望得到新的内容
+DEFAULT_EXCLUDED_STAGES = ("draft",)
+
+
+class LLMResponseCache:
+    """
+    基于 SQLite 的 LLM 响应缓存，支持条目数/字节数上限（按最近访问时间 LRU 淘汰）、TTL 以及按阶段启用。
+    """
+    def __init__(
+        self,
+        db_path: str,
+        max_entries: int = 5000,
+        max_bytes: int = 200 * 1024 * 1024,
+        ttl_seconds: float = 30 * 24 * 3600,
+        stages=None,
+        exclude_stages=DEFAULT_EXCLUDED_STAGES
+    ):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stages = set(stages) if stages else None
+        self.exclude_stages = set(exclude_stages or ())
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " stage TEXT,"
+            " model TEXT,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(llm_adapter, prompt: str) -> str:
+        """
+        缓存键：适配器类型 + 各服务商的 interface_format / 接口地址 / 模型 + temperature + max_tokens + 提示词 sha256。
+        同一模型名挂在不同服务商或不同 base_url 下时输出不同，不能互相回放；
+        多服务商路由适配器按其持有的全部服务商计算。
+        """
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        parts = [type(llm_adapter).__name__]
+        for provider in getattr(llm_adapter, "adapters", None) or [llm_adapter]:
+            parts += [
+                str(getattr(provider, "interface_format", "")).strip().lower(),
+                str(getattr(provider, "base_url", None) or getattr(provider, "azure_endpoint", "")),
+                str(getattr(provider, "model_name", ""))
+            ]
+        parts += [
+            str(getattr(llm_adapter, "temperature", "")),
+            str(getattr(llm_adapter, "max_tokens", "")),
+            prompt_hash
+        ]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    def is_enabled_for(self, stage: str) -> bool:
+        if stage in self.exclude_stages:
+            return False
+        return self.stages is None or stage in self.stages
+
+    def get(self, llm_adapter, prompt: str, stage: str = None):
+        """命中时返回缓存文本，否则返回 None"""
+        if not self.is_enabled_for(stage):
+            return None
+        key = self.make_key(llm_adapter, prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response, created = row
+            if self.ttl_seconds and now - created > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        logging.info(f"[llm_cache] Cache hit for stage '{stage}' ({len(response)} chars).")
+        return response
+
+    def put(self, llm_adapter, prompt: str, response: str, stage: str = None):
+        """写入缓存（空结果不缓存），并按上限淘汰最久未访问的条目"""
+        if not response or not self.is_enabled_for(stage):
+            return
+        key = self.make_key(llm_adapter, prompt)
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, stage, model, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, response, stage, str(getattr(llm_adapter, "model_name", "")), size, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (time.time() - self.ttl_seconds,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if self.max_entries and count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        while self.max_bytes and total > self.max_bytes and count > 0:
+            key, size = self._conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY accessed ASC LIMIT 1"
+            ).fetchone()
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            count -= 1
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_settings = None
+_cache_lock = threading.Lock()
+_env_checked = False
+
+
+def configure_llm_cache(db_path: str = None, **kwargs):
+    """
+    启用（db_path 非空）或关闭（db_path 为 None）LLM 响应缓存。
+    其余参数透传给 LLMResponseCache，如 max_entries、ttl_seconds、stages、exclude_stages。
+    参数与当前缓存一致时直接返回现有实例（保存配置时重复调用不会重新打开数据库、清零命中统计）。
+    """
+    global _cache, _cache_settings, _env_checked
+    settings = (os.path.abspath(db_path), sorted(kwargs.items())) if db_path else None
+    with _cache_lock:
+        _env_checked = True
+        if settings is not None and settings == _cache_settings and _cache is not None:
+            return _cache
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+        _cache_settings = settings
+        if db_path:
+            _cache = LLMResponseCache(db_path, **kwargs)
+            logging.info(f"[llm_cache] LLM response cache enabled at {db_path}")
+    return _cache
+
+
+def get_llm_cache():
+    """返回当前启用的缓存实例；未启用时返回 None"""
+    global _cache, _env_checked
+    if not _env_checked:
+        with _cache_lock:
+            if not _env_checked:
+                _env_checked = True
+                env_path = os.environ.get("NOVEL_LLM_CACHE_PATH", "").strip()
+                if env_path:
+                    _cache = LLMResponseCache(env_path)
+    return _cache
@@ -4,33 +4,326 @@
 向量库相关操作（初始化、更新、检索、清空、文本切分等）
 """
 import os
+import json
+import hashlib
 import logging
 import traceback
-import nltk
-import numpy as np
 import re
 import ssl
-import requests
+import threading
 import warnings
-from langchain_chroma import Chroma
 
 # 禁用特定的Torch警告
 warnings.filterwarnings('ignore', message='.*Torch was not compiled with flash attention.*')
 os.environ["TOKENIZERS_PARALLELISM"] = "false"  # 禁用tokenizer并行警告
 
-from chromadb.config import Settings
-from langchain.docstore.document import Document
-from sklearn.metrics.pairwise import cosine_similarity
 from .common import call_with_retry
+from .embedding_cache import get_embedding_cache, get_embedding_model_id, get_query_embedding_memo, VECTOR_DTYPES
+from token_budget import truncate_to_tokens
+
+# 向量库目录下记录 embedding 模型与维度的头文件
+VECTORSTORE_META_FILENAME = "embedding_meta.json"
+
+# 片段元数据：source 为来源类型，chapter 为章节号（知识库片段为 0），offset 为片段在原文中的字符偏移
+SOURCE_CHAPTER = "chapter"
+SOURCE_KNOWLEDGE = "knowledge"
+SOURCE_LEGACY = "legacy"  # 旧版本写入、无元数据的片段（打开时补标），章节号需从文本解析
+
+# 向量库后端：chroma（默认）或 flat（纯 NumPy 内存映射平面索引，适合单写者项目，启动更快）
+VECTORSTORE_BACKENDS = ("chroma", "flat")
+# flat 后端的向量存储精度（float32 / float16 / int8），Chroma 始终按 float32 存储
+_backend_settings = {
+    "default": os.environ.get("NOVEL_VECTORSTORE_BACKEND", "chroma").strip().lower() or "chroma",
+    "dtype": os.environ.get("NOVEL_VECTORSTORE_DTYPE", "float32").strip().lower() or "float32",
+    "projects": {}
+}
+
+class VectorStoreMismatchError(ValueError):
+    """向量库记录的 embedding 模型/维度与当前配置不一致"""
 
 def get_vectorstore_dir(filepath: str) -> str:
     """获取 vectorstore 路径"""
     return os.path.join(filepath, "vectorstore")
 
+def read_vector_store_meta(filepath: str):
+    """读取向量库头信息 {"model": ..., "dim": ...}；不存在（如旧版本创建的向量库）时返回 None"""
+    meta_path = os.path.join(get_vectorstore_dir(filepath), VECTORSTORE_META_FILENAME)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Failed to read vector store meta {meta_path}: {e}")
+        return None
+
+def _write_vector_store_meta(filepath: str, meta: dict):
+    meta_path = os.path.join(get_vectorstore_dir(filepath), VECTORSTORE_META_FILENAME)
+    try:
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+    except OSError as e:
+        logging.warning(f"Failed to write vector store meta {meta_path}: {e}")
+
+def record_vector_store_meta(store, filepath: str):
+    """首次成功写入向量后记录模型、维度与后端，此后加载时据此快速校验"""
+    embedding = getattr(store, "embeddings", None)
+    model_id, dim = getattr(embedding, "model_id", None), getattr(embedding, "dimension", None)
+    meta = read_vector_store_meta(filepath) or {}
+    if not model_id or not dim or meta.get("model"):
+        return
+    meta.update(model=model_id, dim=dim, backend=getattr(store, "backend_name", "chroma"))
+    _write_vector_store_meta(filepath, meta)
+
+def _detect_vector_store_backend(filepath: str):
+    """根据头信息或目录中已有的文件判断已有向量库的后端；尚无数据时返回 None"""
+    from .flat_vectorstore import FLAT_VECTORS_FILENAME
+    store_dir = get_vectorstore_dir(filepath)
+    backend = (read_vector_store_meta(filepath) or {}).get("backend")
+    if backend:
+        return backend
+    if os.path.exists(os.path.join(store_dir, FLAT_VECTORS_FILENAME)):
+        return "flat"
+    if os.path.exists(os.path.join(store_dir, "chroma.sqlite3")):
+        return "chroma"
+    return None
+
+def _project_config_option(filepath: str, key: str, allowed: tuple):
+    """读取项目目录下 novel_config.json 的配置项，不在 allowed 中时返回 None"""
+    config_path = os.path.join(filepath, "novel_config.json")
+    if not os.path.exists(config_path):
+        return None
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            value = str(json.load(f).get(key, "")).strip().lower()
+    except (OSError, ValueError, AttributeError):
+        return None
+    return value if value in allowed else None
+
+def _project_config_backend(filepath: str):
+    """读取项目目录下 novel_config.json 的 "vectorstore_backend" 配置项"""
+    return _project_config_option(filepath, "vectorstore_backend", VECTORSTORE_BACKENDS)
+
+def get_vector_store_dtype(filepath: str) -> str:
+    """
+    返回新建 flat 向量库的存储精度：项目 novel_config.json 的 "vectorstore_dtype"，
+    否则为全局默认（环境变量 NOVEL_VECTORSTORE_DTYPE，默认 float32）。已有向量文件沿用其精度。
+    """
+    dtype = _project_config_option(filepath, "vectorstore_dtype", VECTOR_DTYPES) or _backend_settings["dtype"]
+    return dtype if dtype in VECTOR_DTYPES else "float32"
+
+def get_vector_store_backend(filepath: str) -> str:
+    """
+    返回项目使用的向量库后端：已有向量库沿用其后端（记录在头信息中）；
+    否则依次使用 configure_vector_store_backend 为该项目设置的后端、
+    项目 novel_config.json 中的 "vectorstore_backend"、全局默认（环境变量 NOVEL_VECTORSTORE_BACKEND）。
+    """
+    return (
+        _detect_vector_store_backend(filepath)
+        or _backend_settings["projects"].get(os.path.abspath(filepath))
+        or _project_config_backend(filepath)
+        or _backend_settings["default"]
+    )
+
+def configure_vector_store_backend(backend: str, filepath: str = None) -> bool:
+    """
+    选择向量库后端（"chroma" / "flat"）。不传 filepath 时设置全局默认；
+    传入 filepath 时为该项目设置，并写入项目向量库头信息，之后每次打开该项目都使用此后端。
+    项目已有其他后端的数据时不切换（需先清空向量库），返回 False。
+    """
+    backend = (backend or "").strip().lower()
+    if backend not in VECTORSTORE_BACKENDS:
+        raise ValueError(f"Unknown vector store backend: {backend}")
+    if filepath is None:
+        _backend_settings["default"] = backend
+        return True
+    existing = _detect_vector_store_backend(filepath)
+    meta = read_vector_store_meta(filepath) or {}
+    if existing and existing != backend and (meta.get("model") or not meta.get("backend")):
+        logging.warning(f"Vector store in {filepath} already uses backend '{existing}'; clear it before switching.")
+        return False
+    _backend_settings["projects"][os.path.abspath(filepath)] = backend
+    meta["backend"] = backend
+    _write_vector_store_meta(filepath, meta)
+    invalidate_vector_store_handle(filepath)
+    return True
+
+def check_vector_store_compat(embedding_adapter, filepath: str):
+    """
+    校验向量库头信息记录的 embedding 模型与当前适配器一致，不一致时抛出 VectorStoreMismatchError。
+    在加载/初始化阶段调用，避免维度不符的错误在 Chroma 内部才暴露并被吞掉。
+    """
+    meta = read_vector_store_meta(filepath)
+    model_id = get_embedding_model_id(embedding_adapter)
+    if meta and meta.get("model") and meta.get("model") != model_id:
+        raise VectorStoreMismatchError(
+            f"向量库使用的 embedding 模型为 {meta.get('model')}（{meta.get('dim')} 维），"
+            f"与当前配置 {model_id} 不一致，请先清空向量库后重新导入/定稿。"
+        )
+    return meta
+
+# 进程级向量库句柄池：按 (向量库目录, embedding 模型) 复用同一个向量库句柄，
+# 避免每组检索关键词、每次定稿/导入都重新打开 Chroma 客户端或重新映射平面索引
+_store_pool = {}
+_store_pool_lock = threading.Lock()
+_store_pool_stats = {"opens": 0, "reuses": 0, "invalidations": 0, "opens_by_dir": {}}
+
+def _store_pool_key(store_dir: str, model_id: str):
+    return (os.path.abspath(store_dir), model_id)
+
+def _open_pooled_store(embedding_adapter, filepath: str):
+    """
+    返回该项目向量库的共享句柄（Chroma 或 FlatVectorStore，见 get_vector_store_backend），首次调用时打开。
+    复用已有句柄时把其 embedding 包装重新绑定到本次传入的适配器（使 API Key 等配置变更即时生效）。
+    """
+    store_dir = get_vectorstore_dir(filepath)
+    key = _store_pool_key(store_dir, get_embedding_model_id(embedding_adapter))
+    with _store_pool_lock:
+        store = _store_pool.get(key)
+        if store is not None:
+            store.embeddings.bind(embedding_adapter)
+            _store_pool_stats["reuses"] += 1
+            return store
+        chroma_embedding = _make_chroma_embedding(embedding_adapter, filepath)
+        backend = get_vector_store_backend(filepath)
+        if backend == "flat":
+            from .flat_vectorstore import FlatVectorStore
+            store = FlatVectorStore(store_dir, chroma_embedding, get_vector_store_dtype(filepath))
+        else:
+            from langchain_chroma import Chroma
+            from chromadb.config import Settings
+            store = Chroma(
+                persist_directory=store_dir,
+                embedding_function=chroma_embedding,
+                client_settings=Settings(anonymized_telemetry=False),
+                collection_name="novel_collection"
+            )
+        try:
+            _verify_legacy_dimension(store, filepath)
+        except VectorStoreMismatchError:
+            if callable(getattr(store, "close", None)):
+                store.close()
+            else:
+                _release_chroma_system(store_dir)
+            raise
+        if backend != "flat":
+            _backfill_legacy_metadata(store)
+            _migrate_legacy_store(store, filepath)
+        _store_pool[key] = store
+        _store_pool_stats["opens"] += 1
+        by_dir = _store_pool_stats["opens_by_dir"]
+        by_dir[key[0]] = by_dir.get(key[0], 0) + 1
+        logging.info(f"[vectorstore] Opened {backend} vector store handle for {store_dir} ({key[1]}).")
+        return store
+
+def _stored_dimension(store):
+    """读取向量库中一条已存储向量的维度；为空库或读取失败时返回 None"""
+    collection = store._collection
+    dim = getattr(collection, "_dim", None)  # 平面索引直接记录维度
+    if dim:
+        return dim
+    try:
+        embeddings = collection.get(limit=1, include=["embeddings"]).get("embeddings")
+    except Exception as e:
+        logging.warning(f"Failed to probe stored embedding dimension: {e}")
+        return None
+    if embeddings is None or len(embeddings) == 0:
+        return None
+    return len(embeddings[0])
+
+def _verify_legacy_dimension(store, filepath: str):
+    """
+    头信息没有记录维度的向量库（旧版本创建）：以一条已存储向量的维度为准，与当前适配器的向量维度比较，
+    不一致时抛出 VectorStoreMismatchError。适配器未声明维度时向量化一条探测文本（经查询缓存，只请求一次）。
+    """
+    if (read_vector_store_meta(filepath) or {}).get("dim"):
+        return
+    stored = _stored_dimension(store)
+    if not stored:
+        return
+    embedding = store.embeddings
+    embedding.dimension = stored  # 之后每次向量化都按已存储的维度校验
+    adapter_dim = getattr(embedding.adapter, "dim", None)
+    if adapter_dim and adapter_dim != stored:
+        raise VectorStoreMismatchError(
+            f"向量库中已存储的向量为 {stored} 维，与当前 embedding 配置 {embedding.model_id}（{adapter_dim} 维）不一致，"
+            f"请先清空向量库后重新导入/定稿。"
+        )
+    if not adapter_dim:
+        embedding.embed_query("向量维度校验")  # 维度不符时由 _check_dimension 抛出
+
+def _backfill_legacy_metadata(store):
+    """为旧版本写入的无元数据片段补标 source=legacy（只更新元数据，不重新向量化），使其能参与带过滤条件的检索"""
+    try:
+        existing = store._collection.get(include=["metadatas"])
+        legacy_ids = [
+            doc_id for doc_id, meta in zip(existing["ids"], existing["metadatas"])
+            if not (meta or {}).get("source")
+        ]
+        if legacy_ids:
+            store._collection.update(
+                ids=legacy_ids,
+                metadatas=[{"source": SOURCE_LEGACY, "chapter": 0, "offset": 0} for _ in legacy_ids]
+            )
+            logging.info(f"[vectorstore] Tagged {len(legacy_ids)} legacy chunks without metadata.")
+    except Exception as e:
+        logging.warning(f"Failed to backfill legacy chunk metadata: {e}")
+
+def _migrate_legacy_store(store, filepath: str):
+    """
+    旧版本创建的向量库（没有头信息）首次打开时清理一次重复片段（旧版本重复定稿/导入产生的副本），
+    随后写入头信息，之后再打开不再重复扫描。
+    """
+    if (read_vector_store_meta(filepath) or {}).get("model"):
+        return
+    removed = _dedupe_store(store)
+    if removed:
+        logging.info(f"[vectorstore] Removed {removed} duplicate chunks from legacy vector store.")
+    record_vector_store_meta(store, filepath)
+
+def _release_chroma_system(store_dir: str):
+    """停止并移除 chromadb 为该目录缓存的共享 System，释放 SQLite 句柄，之后可在同一进程内重新创建该目录"""
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+    except ImportError:
+        return
+    target = os.path.abspath(store_dir)
+    systems = SharedSystemClient._identifier_to_system
+    for identifier in [i for i in systems if i and os.path.abspath(i) == target]:
+        try:
+            systems.pop(identifier).stop()
+        except Exception as e:
+            logging.warning(f"Failed to stop chroma system for {store_dir}: {e}")
+
+def invalidate_vector_store_handle(filepath: str):
+    """丢弃该项目的共享向量库句柄（清空向量库时调用），下次访问时重新打开"""
+    store_dir = os.path.abspath(get_vectorstore_dir(filepath))
+    with _store_pool_lock:
+        keys = [key for key in _store_pool if key[0] == store_dir]
+        for key in keys:
+            store = _store_pool.pop(key)
+            if callable(getattr(store, "close", None)):
+                store.close()  # 平面索引：关闭日志文件并解除内存映射
+        _store_pool_stats["invalidations"] += len(keys)
+        _release_chroma_system(store_dir)
+
+def get_vector_store_pool_stats() -> dict:
+    """返回句柄池统计：打开次数（总计及按目录）、复用次数、失效次数与当前句柄数，用于确认每个会话只打开一次"""
+    with _store_pool_lock:
+        return {
+            "opens": _store_pool_stats["opens"],
+            "reuses": _store_pool_stats["reuses"],
+            "invalidations": _store_pool_stats["invalidations"],
+            "handles": len(_store_pool),
+            "opens_by_dir": dict(_store_pool_stats["opens_by_dir"])
+        }
+
 def clear_vector_store(filepath: str) -> bool:
     """清空 清空向量库"""
     import shutil
     store_dir = get_vectorstore_dir(filepath)
+    invalidate_vector_store_handle(filepath)
     if not os.path.exists(store_dir):
         logging.info("No vector store found to clear.")
         return False
@@ -43,44 +336,119 @@ def clear_vector_store(filepath: str) -> bool:
         traceback.print_exc()
         return False
 
-def init_vector_store(embedding_adapter, texts, filepath: str):
+def _embed_documents_cached(executor, cache, model_id: str, texts) -> list:
+    """先查项目 embedding 缓存，只对未命中（且去重后）的文本请求接口，结果写回缓存"""
+    texts = [str(t) for t in texts]
+    vectors = cache.get_many(model_id, texts) if cache else {}
+    missing = list(dict.fromkeys(t for i, t in enumerate(texts) if i not in vectors))
+    if missing:
+        embedded = dict(zip(missing, executor.embed_documents(missing)))
+        if cache:
+            cache.put_many(model_id, missing, [embedded[t] for t in missing])
+        for i, t in enumerate(texts):
+            if i not in vectors:
+                vectors[i] = embedded[t]
+    if cache and len(missing) < len(texts):
+        logging.info(f"[embedding_cache] Reused {len(texts) - len(missing)}/{len(texts)} cached embeddings.")
+    return [vectors[i] for i in range(len(texts))]
+
+def _make_chroma_embedding(embedding_adapter, filepath: str = None):
     """
-    在 filepath 下创建/加载一个 Chroma 向量库并插入 texts。
-    如果Embedding失败，则返回 None，不中断任务。
+    将 embedding 适配器包装为 LangChain Embeddings：
+    文档向量化先查项目级 embedding 缓存，未命中的部分经 ConcurrentEmbeddingAdapter 分块并发执行（含限流与逐条重试）；
+    查询向量化先查 QueryEmbeddingMemo（内存 LRU + 项目缓存），未命中时经 call_with_retry 请求。
+    包装对象可通过 bind() 换用同一模型的新适配器实例，供句柄池复用。
     """
     from langchain.embeddings.base import Embeddings as LCEmbeddings
+    from embedding_executor import ConcurrentEmbeddingAdapter
+
+    cache = get_embedding_cache(filepath)
+    model_id = get_embedding_model_id(embedding_adapter)
+    query_memo = get_query_embedding_memo()
+    meta = read_vector_store_meta(filepath) if filepath else None
+
+    class LCEmbeddingWrapper(LCEmbeddings):
+        def __init__(self):
+            self.model_id = model_id
+            self.dimension = (meta or {}).get("dim")
+            self.bind(embedding_adapter)
+
+        def bind(self, adapter):
+            if getattr(self, "adapter", None) is adapter:
+                return
+            self.adapter = adapter
+            self.executor = ConcurrentEmbeddingAdapter(adapter)
+
+        def _check_dimension(self, vectors):
+            for vec in vectors:
+                if not vec:
+                    continue
+                if self.dimension is None:
+                    self.dimension = len(vec)
+                elif len(vec) != self.dimension:
+                    raise VectorStoreMismatchError(
+                        f"embedding 维度 {len(vec)} 与向量库记录的 {self.dimension} 维不一致（模型 {model_id}），"
+                        f"请先清空向量库后重新导入/定稿。"
+                    )
+            return vectors
+
+        def embed_documents(self, texts):
+            return self._check_dimension(_embed_documents_cached(self.executor, cache, model_id, texts))
+        def embed_query(self, query: str):
+            res = query_memo.get(model_id, query, cache)
+            if res is not None:
+                return self._check_dimension([res])[0]
+            res = call_with_retry(
+                func=self.adapter.embed_query,
+                max_retries=3,
+                fallback_return=[],
+                query=query
+            )
+            query_memo.put(model_id, query, res, cache)
+            return self._check_dimension([res])[0]
+
+        def embed_queries(self, queries):
+            """
+            批量向量化多条查询：先查 memo，未命中的（去重后）按查询语义请求（embed_queries，而非 embed_documents），
+            结果与逐条 embed_query 一致，可安全写入查询 memo；空向量表示失败
+            """
+            queries = [str(q) for q in queries]
+            vectors = {i: query_memo.get(model_id, q, cache) for i, q in enumerate(queries)}
+            missing = list(dict.fromkeys(q for i, q in enumerate(queries) if vectors[i] is None))
+            if missing:
+                embedded = dict(zip(missing, self.executor.embed_queries(missing)))
+                for q in missing:
+                    query_memo.put(model_id, q, embedded[q], cache)
+                for i, q in enumerate(queries):
+                    if vectors[i] is None:
+                        vectors[i] = embedded[q]
+            return self._check_dimension([vectors[i] or [] for i in range(len(queries))])
+
+    return LCEmbeddingWrapper()
+
+def init_vector_store(embedding_adapter, texts, filepath: str, metadatas: list = None, ids: list = None):
+    """
+    在 filepath 下创建/加载一个 Chroma 向量库并插入 texts（使用共享句柄），
+    metadatas / ids 与 texts 一一对应（可选，ids 相同的片段覆盖写入）。
+    如果Embedding失败，则返回 None，不中断任务；
+    embedding 模型/维度与向量库不一致时抛出 VectorStoreMismatchError，由界面提示用户清空向量库。
+    """
+    from langchain.docstore.document import Document
+
+    check_vector_store_compat(embedding_adapter, filepath)
 
     store_dir = get_vectorstore_dir(filepath)
     os.makedirs(store_dir, exist_ok=True)
-    documents = [Document(page_content=str(t)) for t in texts]
+    metadatas = metadatas or [None] * len(texts)
+    documents = [Document(page_content=str(t), metadata=m or {}) for t, m in zip(texts, metadatas)]
 
     try:
-        class LCEmbeddingWrapper(LCEmbeddings):
-            def embed_documents(self, texts):
-                return call_with_retry(
-                    func=embedding_adapter.embed_documents,
-                    max_retries=3,
-                    fallback_return=[],
-                    texts=texts
-                )
-            def embed_query(self, query: str):
-                res = call_with_retry(
-                    func=embedding_adapter.embed_query,
-                    max_retries=3,
-                    fallback_return=[],
-                    query=query
-                )
-                return res
-
-        chroma_embedding = LCEmbeddingWrapper()
-        vectorstore = Chroma.from_documents(
-            documents,
-            embedding=chroma_embedding,
-            persist_directory=store_dir,
-            client_settings=Settings(anonymized_telemetry=False),
-            collection_name="novel_collection"
-        )
+        vectorstore = _open_pooled_store(embedding_adapter, filepath)
+        vectorstore.add_documents(documents, ids=ids)
+        record_vector_store_meta(vectorstore, filepath)
         return vectorstore
+    except VectorStoreMismatchError:
+        raise
     except Exception as e:
         logging.warning(f"Init vector store failed: {e}")
         traceback.print_exc()
@@ -89,39 +457,21 @@ def init_vector_store(embedding_adapter, texts, filepath: str):
 def load_vector_store(embedding_adapter, filepath: str):
     """
     读取已存在的 Chroma 向量库。若不存在则返回 None。
-    如果加载失败（embedding 或IO问题），则返回 None。
+    同一进程内返回该项目的共享句柄，只在首次访问（或清空后）真正打开。
+    如果加载失败（embedding 或IO问题），则返回 None；
+    embedding 模型/维度与向量库不一致时抛出 VectorStoreMismatchError（不能静默退化为无检索继续生成）。
     """
-    from langchain.embeddings.base import Embeddings as LCEmbeddings
     store_dir = get_vectorstore_dir(filepath)
     if not os.path.exists(store_dir):
         logging.info("Vector store not found. Will return None.")
+        invalidate_vector_store_handle(filepath)
         return None
+    check_vector_store_compat(embedding_adapter, filepath)
 
     try:
-        class LCEmbeddingWrapper(LCEmbeddings):
-            def embed_documents(self, texts):
-                return call_with_retry(
-                    func=embedding_adapter.embed_documents,
-                    max_retries=3,
-                    fallback_return=[],
-                    texts=texts
-                )
-            def embed_query(self, query: str):
-                res = call_with_retry(
-                    func=embedding_adapter.embed_query,
-                    max_retries=3,
-                    fallback_return=[],
-                    query=query
-                )
-                return res
-
-        chroma_embedding = LCEmbeddingWrapper()
-        return Chroma(
-            persist_directory=store_dir,
-            embedding_function=chroma_embedding,
-            client_settings=Settings(anonymized_telemetry=False),
-            collection_name="novel_collection"
-        )
+        return _open_pooled_store(embedding_adapter, filepath)
+    except VectorStoreMismatchError:
+        raise
     except Exception as e:
         logging.warning(f"Failed to load vector store: {e}")
         traceback.print_exc()
@@ -138,6 +488,174 @@ def split_by_length(text: str, max_length: int = 500):
         start_idx = end_idx
     return segments
 
+_punkt_available = None
+
+def split_sentences(text: str) -> list:
+    """
+    句子切分：优先使用 nltk punkt（每个进程只检查/下载一次，而非每章都访问网络），
+    不可用时（如离线环境）回退到按中英文句末标点切分。
+    """
+    global _punkt_available
+    if _punkt_available is None:
+        try:
+            import nltk
+            nltk.download('punkt', quiet=True)
+            nltk.download('punkt_tab', quiet=True)
+            nltk.sent_tokenize("test.")
+            _punkt_available = True
+        except Exception as e:
+            logging.warning(f"nltk punkt unavailable, falling back to punctuation-based sentence splitting: {e}")
+            _punkt_available = False
+    if _punkt_available:
+        import nltk
+        return nltk.sent_tokenize(text)
+    return [s.strip() for s in re.findall(r'[^。！？!?\n]+[。！？!?…」』”]*', text) if s.strip()]
+
+def locate_chunk_offsets(source_text: str, chunks: list) -> list:
+    """
+    计算各片段在原文中的起始字符偏移。片段由句子以空格拼接而成，
+    因此按片段首个词在原文中从上一片段位置起向后查找；找不到时沿用当前位置。
+    """
+    offsets, cursor = [], 0
+    for chunk in chunks:
+        probe = (chunk.split() or [""])[0]
+        pos = source_text.find(probe, cursor) if probe else -1
+        if pos >= 0:
+            cursor = pos
+        offsets.append(cursor)
+        cursor += len(probe)
+    return offsets
+
+def make_chunk_metadatas(source_text: str, chunks: list, source: str, chapter: int = 0, **extra) -> list:
+    """为每个片段生成元数据 {"source", "chapter", "offset", ...extra}"""
+    return [
+        dict(extra, source=source, chapter=int(chapter or 0), offset=offset)
+        for offset in locate_chunk_offsets(source_text, chunks)
+    ]
+
+def build_chunk_filter(source: str = None, before_chapter: int = None):
+    """
+    构造 Chroma where 过滤条件，在索引内按元数据过滤：
+    - source: 只检索指定来源（SOURCE_CHAPTER / SOURCE_KNOWLEDGE）；
+    - before_chapter: 章节片段只保留章节号 < before_chapter 的（知识库片段不受影响）。
+      例如写第 N 章时排除最近两章：before_chapter=N-2；只看第 N 章之前：before_chapter=N。
+    均为 None 时返回 None（不过滤）。旧片段（source=legacy）只在不限定来源时保留。
+    """
+    if before_chapter is None:
+        return {"source": source} if source else None
+    chapter_clause = {"$and": [{"source": SOURCE_CHAPTER}, {"chapter": {"$lt": int(before_chapter)}}]}
+    if source == SOURCE_CHAPTER:
+        return chapter_clause
+    if source:
+        return {"source": source}
+    return {"$or": [{"source": {"$ne": SOURCE_CHAPTER}}, chapter_clause]}
+
+def latest_chunk_chapter(hits: list):
+    """
+    根据检索结果的元数据返回其中最新的章节号：全部为知识库片段时返回 0，
+    存在旧片段（无元数据，需回退到文本解析）时返回 None。
+    """
+    chapters = []
+    for doc, _ in hits:
+        source = (doc.metadata or {}).get("source")
+        if source in (None, SOURCE_LEGACY):
+            return None
+        if source == SOURCE_CHAPTER:
+            chapters.append(int(doc.metadata.get("chapter", 0)))
+    return max(chapters) if chapters else 0
+
+def make_chunk_ids(texts: list, metadatas: list) -> list:
+    """
+    确定性片段 ID：由 (来源, 章节号/知识库文件, 片段序号, 内容哈希) 生成。
+    同一内容重复写入时覆盖（Chroma upsert）而非追加副本。
+    """
+    ids = []
+    for index, (text, meta) in enumerate(zip(texts, metadatas)):
+        scope = meta.get("file") or meta.get("chapter", 0)
+        digest = hashlib.sha1(str(text).encode("utf-8")).hexdigest()[:16]
+        ids.append(f"{meta.get('source')}-{scope}-{index}-{digest}")
+    return ids
+
+_DETERMINISTIC_ID_RE = re.compile(r'^\w+-.+-\d+-[0-9a-f]{16}$')
+
+def _chapter_where(chapter_number: int) -> dict:
+    return {"$and": [{"source": SOURCE_CHAPTER}, {"chapter": int(chapter_number)}]}
+
+def _knowledge_where(file_name: str) -> dict:
+    return {"$and": [{"source": SOURCE_KNOWLEDGE}, {"file": file_name}]}
+
+def _replace_segments(store, where: dict, texts: list, metadatas: list) -> dict:
+    """先删除 where 范围内已有但不在本次切分结果中的旧片段，再只插入尚不存在的片段"""
+    from langchain.docstore.document import Document
+    ids = make_chunk_ids(texts, metadatas)
+    existing = set(store._collection.get(where=where, include=[])["ids"])
+    stale = sorted(existing - set(ids))
+    if stale:
+        store.delete(ids=stale)
+    new = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+    if new:
+        store.add_documents(
+            [Document(page_content=str(texts[i]), metadata=metadatas[i]) for i in new],
+            ids=[ids[i] for i in new]
+        )
+    return {"added": len(new), "removed": len(stale), "kept": len(ids) - len(new)}
+
+def replace_chapter_segments(store, chapter_number: int, texts: list, metadatas: list) -> dict:
+    """
+    幂等写入某章片段：先删除该章已有但不在本次切分结果中的旧片段，再只插入尚不存在的片段（未变化的片段不重新向量化）。
+    返回 {"added": ..., "removed": ..., "kept": ...}。
+    """
+    return _replace_segments(store, _chapter_where(chapter_number), texts, metadatas)
+
+def replace_knowledge_segments(store, file_name: str, texts: list, metadatas: list) -> dict:
+    """
+    幂等导入某个知识库文件（按文件名区分）：文件修改后重新导入时删除该文件已不存在的旧片段，
+    未变化的片段保留不重新向量化。返回值同 replace_chapter_segments。
+    """
+    return _replace_segments(store, _knowledge_where(file_name), texts, metadatas)
+
+def dedupe_vector_store(embedding_adapter, filepath: str) -> int:
+    """
+    清理已有向量库中的重复片段（如旧版本重复定稿同一章产生的副本），返回删除的片段数。
+    同一 (来源, 章节/文件, 内容) 只保留一份，优先保留确定性 ID 的片段；
+    旧片段（source=legacy）与任一保留片段内容相同时删除。
+    """
+    store = load_vector_store(embedding_adapter, filepath)
+    if not store:
+        return 0
+    return _dedupe_store(store)
+
+def _dedupe_store(store) -> int:
+    """dedupe_vector_store 的实现，直接作用于已打开的向量库句柄（打开旧向量库时也会调用）"""
+    try:
+        data = store._collection.get(include=["documents", "metadatas"])
+        ids, documents = data["ids"], data["documents"]
+        metadatas = [m or {} for m in data["metadatas"]]
+        order = sorted(range(len(ids)), key=lambda i: (
+            metadatas[i].get("source") == SOURCE_LEGACY, not _DETERMINISTIC_ID_RE.match(ids[i])
+        ))
+        seen_keys, seen_texts, remove = set(), set(), []
+        for i in order:
+            meta = metadatas[i]
+            if meta.get("source") == SOURCE_LEGACY:
+                key = documents[i]
+                duplicate = key in seen_texts
+            else:
+                key = (meta.get("source"), meta.get("chapter", 0), meta.get("file"), documents[i])
+                duplicate = key in seen_keys
+                seen_keys.add(key)
+            if duplicate:
+                remove.append(ids[i])
+            seen_texts.add(documents[i])
+        if remove:
+            store.delete(ids=remove)
+        logging.info(f"[vectorstore] Dedupe removed {len(remove)}/{len(ids)} duplicate chunks.")
+        return len(remove)
+    except Exception as e:
+        logging.warning(f"Failed to dedupe vector store: {e}")
+        traceback.print_exc()
+        return 0
+
 def split_text_for_vectorstore(chapter_text: str, max_length: int = 500, similarity_threshold: float = 0.7):
     """
     对新的章节文本进行分段后,再用于存入向量库。
@@ -146,9 +664,7 @@ def split_text_for_vectorstore(chapter_text: str, max_length: int = 500, similar
     if not chapter_text.strip():
         return []
     
-    nltk.download('punkt', quiet=True)
-    nltk.download('punkt_tab', quiet=True)
-    sentences = nltk.sent_tokenize(chapter_text)
+    sentences = split_sentences(chapter_text)
     if not sentences:
         return []
     
@@ -173,21 +689,24 @@ def split_text_for_vectorstore(chapter_text: str, max_length: int = 500, similar
     
     return final_segments
 
-def update_vector_store(embedding_adapter, new_chapter: str, filepath: str):
+def update_vector_store(embedding_adapter, new_chapter: str, filepath: str, chapter_number: int = 0):
     """
-    将最新章节文本插入到向量库中。
+    将最新章节文本插入到向量库中，每个片段带 {"source": "chapter", "chapter": chapter_number, "offset": ...} 元数据
+    与确定性 ID。给出 chapter_number 时替换该章已有片段（重复定稿同一章不会追加副本）。
     若库不存在则初始化；若初始化/更新失败，则跳过。
     """
-    from utils import read_file, clear_file_content, save_string_to_txt
+    from langchain.docstore.document import Document
     splitted_texts = split_text_for_vectorstore(new_chapter)
     if not splitted_texts:
         logging.warning("No valid text to insert into vector store. Skipping.")
         return
+    metadatas = make_chunk_metadatas(new_chapter, splitted_texts, SOURCE_CHAPTER, chapter_number)
+    ids = make_chunk_ids(splitted_texts, metadatas)
 
     store = load_vector_store(embedding_adapter, filepath)
     if not store:
         logging.info("Vector store does not exist or failed to load. Initializing a new one for new chapter...")
-        store = init_vector_store(embedding_adapter, splitted_texts, filepath)
+        store = init_vector_store(embedding_adapter, splitted_texts, filepath, metadatas, ids)
         if not store:
             logging.warning("Init vector store failed, skip embedding.")
         else:
@@ -195,37 +714,95 @@ def update_vector_store(embedding_adapter, new_chapter: str, filepath: str):
         return
 
     try:
-        docs = [Document(page_content=str(t)) for t in splitted_texts]
-        store.add_documents(docs)
-        logging.info("Vector store updated with the new chapter splitted segments.")
+        if chapter_number:
+            result = replace_chapter_segments(store, chapter_number, splitted_texts, metadatas)
+            logging.info(f"Vector store updated for chapter {chapter_number}: {result}")
+        else:
+            docs = [Document(page_content=str(t), metadata=m) for t, m in zip(splitted_texts, metadatas)]
+            store.add_documents(docs, ids=ids)
+            logging.info("Vector store updated with the new chapter splitted segments.")
+        record_vector_store_meta(store, filepath)
+    except VectorStoreMismatchError:
+        raise
     except Exception as e:
         logging.warning(f"Failed to update vector store: {e}")
         traceback.print_exc()
 
-def get_relevant_context_from_vector_store(embedding_adapter, query: str, filepath: str, k: int = 2) -> str:
+def multi_query_similarity_search(embedding_adapter, queries, filepath: str, k: int = 2, where: dict = None) -> list:
     """
-    从向量库中检索与 query 最相关的 k 条文本，拼接后返回。
-    如果向量库加载/检索失败，则返回空字符串。
-    最终只返回最多2000字符的检索片段。
+    多查询批量检索：所有查询一次批量向量化，再以查询矩阵做一次 k-NN 查询。
+    where 为元数据过滤条件（见 build_chunk_filter），在索引内过滤。
+    返回与 queries 一一对应的列表，每项为按距离升序的 [(Document, score), ...]，
+    score 为 Chroma 的距离（越小越相关，与 similarity_search_with_score 一致）。
+    向量库不存在、查询向量化失败或检索失败时对应项为空列表。
     """
+    from langchain.docstore.document import Document
+    queries = [str(q) for q in queries]
+    results = [[] for _ in queries]
+    if not queries:
+        return results
     store = load_vector_store(embedding_adapter, filepath)
     if not store:
-        logging.info("No vector store found or load failed. Returning empty context.")
-        return ""
+        logging.info("No vector store found or load failed. Returning empty results.")
+        return results
 
     try:
-        docs = store.similarity_search(query, k=k)
-        if not docs:
-            logging.info(f"No relevant documents found for query '{query}'. Returning empty context.")
-            return ""
-        combined = "\n".join([d.page_content for d in docs])
-        if len(combined) > 2000:
-            combined = combined[:2000]
-        return combined
+        n_results = min(k, store._collection.count())
+        if n_results <= 0:
+            return results
+        vectors = store.embeddings.embed_queries(queries)
+        valid = [i for i, vec in enumerate(vectors) if vec]
+        if len(valid) < len(queries):
+            logging.warning(f"{len(queries) - len(valid)}/{len(queries)} retrieval queries failed to embed.")
+        if not valid:
+            return results
+        response = store._collection.query(
+            query_embeddings=[vectors[i] for i in valid],
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances"]
+        )
+        for row, i in enumerate(valid):
+            results[i] = [
+                (Document(page_content=doc, metadata=meta or {}), float(distance))
+                for doc, meta, distance in zip(
+                    response["documents"][row], response["metadatas"][row], response["distances"][row]
+                )
+            ]
+        return results
+    except VectorStoreMismatchError:
+        raise
     except Exception as e:
-        logging.warning(f"Similarity search failed: {e}")
+        logging.warning(f"Multi-query similarity search failed: {e}")
         traceback.print_exc()
-        return ""
+        return [[] for _ in queries]
+
+def get_relevant_contexts_from_vector_store(embedding_adapter, queries, filepath: str, k: int = 2,
+                                            max_tokens: int = 2000, model_name: str = None, where: dict = None) -> list:
+    """
+    批量版本的 get_relevant_context_from_vector_store：为每条 query 返回拼接后的检索片段（失败或无结果为空字符串），
+    每条不超过 max_tokens。整章的关键词组只需一次向量化请求与一次向量查询。
+    """
+    contexts = []
+    for query, hits in zip(queries, multi_query_similarity_search(embedding_adapter, queries, filepath, k, where)):
+        if not hits:
+            logging.info(f"No relevant documents found for query '{query}'.")
+            contexts.append("")
+            continue
+        combined = "\n".join(doc.page_content for doc, _ in hits)
+        contexts.append(truncate_to_tokens(combined, max_tokens, model_name))
+    return contexts
+
+def get_relevant_context_from_vector_store(embedding_adapter, query: str, filepath: str, k: int = 2,
+                                           max_tokens: int = 2000, model_name: str = None, where: dict = None) -> str:
+    """
+    从向量库中检索与 query 最相关的 k 条文本，拼接后返回。
+    如果向量库加载/检索失败，则返回空字符串。
+    最终只返回不超过 max_tokens（按 model_name 的分词标定估算）的检索片段。
+    """
+    return get_relevant_contexts_from_vector_store(
+        embedding_adapter, [query], filepath, k=k, max_tokens=max_tokens, model_name=model_name, where=where
+    )[0]
 
 def _get_sentence_transformer(model_name: str = 'paraphrase-MiniLM-L6-v2'):
     """获取sentence transformer模型，处理SSL问题"""
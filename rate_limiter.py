@@ -0,0 +1,235 @@
+# rate_limiter.py
+# -*- coding: utf-8 -*-
+"""
+客户端自适应限流：按 (provider, api_key) 维护 RPM/TPM 令牌桶与并发上限，
+遇到 429/503 时并发减半（乘性减），成功时缓慢恢复（加性增），类似 TCP AIMD。
+"""
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+from adapter_registry import fingerprint_secret
+
+
+class _TokenBucket:
+    """每分钟补充 rate_per_minute 个令牌的令牌桶"""
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.tokens = float(rate_per_minute)
+        self.refill_per_second = float(rate_per_minute) / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # 单次请求超过桶容量时，等桶满即可放行，避免永久阻塞
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+class AdaptiveRateLimiter:
+    """
+    令牌桶 + AIMD 并发控制。
+    :param rpm: 每分钟请求数上限，None 表示不限
+    :param tpm: 每分钟 token 数上限，None 表示不限
+    :param max_concurrency: 并发上限（也是初始并发）
+    :param min_concurrency: 收缩后的最小并发
+    """
+    def __init__(self, rpm: float = None, tpm: float = None, max_concurrency: int = 8, min_concurrency: int = 1):
+        self._request_bucket = None
+        self._token_bucket = None
+        self._in_flight = 0
+        self._cooldown_until = 0.0
+        self._cond = threading.Condition()
+        self.successes = 0
+        self.throttles = 0
+        self.reconfigure(rpm, tpm, max_concurrency, min_concurrency)
+
+    @staticmethod
+    def _rebucket(old: "_TokenBucket", rate_per_minute: float):
+        """按新速率重建令牌桶，保留已消耗的额度，避免调整参数后瞬间放行一整桶请求"""
+        if not rate_per_minute:
+            return None
+        bucket = _TokenBucket(rate_per_minute)
+        if old is not None:
+            old.refill(time.monotonic())
+            bucket.tokens = min(bucket.capacity, old.tokens)
+        return bucket
+
+    def reconfigure(self, rpm: float = None, tpm: float = None, max_concurrency: int = 8, min_concurrency: int = 1):
+        """
+        原地更新限流参数。适配器缓存中的实例持有的是同一个限流器对象，因此新参数对它们立即生效；
+        并发上限重置为新的 max_concurrency，冷却期保持不变。
+        """
+        with self._cond:
+            self.max_concurrency = max(1, int(max_concurrency))
+            self.min_concurrency = max(1, min(int(min_concurrency), self.max_concurrency))
+            self._limit = float(self.max_concurrency)
+            self._request_bucket = self._rebucket(self._request_bucket, rpm)
+            self._token_bucket = self._rebucket(self._token_bucket, tpm)
+            self._cond.notify_all()
+
+    @property
+    def concurrency_limit(self) -> int:
+        return max(self.min_concurrency, int(self._limit))
+
+    def _try_acquire(self, tokens: float):
+        """尝试占用一个并发槽位，成功返回 None，否则返回建议等待秒数"""
+        now = time.monotonic()
+        if now < self._cooldown_until:
+            return self._cooldown_until - now
+        if self._in_flight >= self.concurrency_limit:
+            return 0.05
+        wait = 0.0
+        for bucket, amount in ((self._request_bucket, 1), (self._token_bucket, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(amount))
+        if wait > 0:
+            return wait
+        if self._request_bucket is not None:
+            self._request_bucket.consume(1)
+        if self._token_bucket is not None:
+            self._token_bucket.consume(tokens)
+        self._in_flight += 1
+        return None
+
+    def acquire(self, tokens: float = 0):
+        with self._cond:
+            while True:
+                wait = self._try_acquire(tokens)
+                if wait is None:
+                    return
+                self._cond.wait(timeout=wait)
+
+    async def aacquire(self, tokens: float = 0):
+        while True:
+            with self._cond:
+                wait = self._try_acquire(tokens)
+            if wait is None:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self):
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._cond.notify_all()
+
+    def on_success(self):
+        """加性增：每个成功请求使并发上限增加 1/当前上限"""
+        with self._cond:
+            self.successes += 1
+            self._limit = min(float(self.max_concurrency), self._limit + 1.0 / max(self._limit, 1.0))
+            self._cond.notify_all()
+
+    def on_throttle(self, retry_after: float = None):
+        """乘性减：并发上限减半，并在 retry_after（默认1秒）内暂停发出新请求"""
+        with self._cond:
+            self.throttles += 1
+            self._limit = max(float(self.min_concurrency), self._limit / 2.0)
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + (retry_after or 1.0))
+        logging.warning(f"[rate_limiter] Throttled by provider, concurrency limit -> {self.concurrency_limit}")
+
+    @contextmanager
+    def slot(self, tokens: float = 0):
+        self.acquire(tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, tokens: float = 0):
+        await self.aacquire(tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "concurrency_limit": self.concurrency_limit,
+                "in_flight": self._in_flight,
+                "successes": self.successes,
+                "throttles": self.throttles
+            }
+
+
+def is_rate_limit_error(exc: Exception) -> bool:
+    """判断异常是否为服务端限流/过载（429/503）"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status in (429, 503):
+        return True
+    message = str(exc).lower()
+    return "429" in message or "rate limit" in message or "too many requests" in message
+
+
+def get_retry_after(exc: Exception):
+    """从异常附带的 retry_after 属性或响应头中读取 Retry-After 秒数"""
+    retry_after = getattr(exc, "retry_after", None)
+    if isinstance(retry_after, (int, float)):
+        return float(retry_after)
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        return float(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+_limiters = {}
+_limit_settings = {}
+_lock = threading.Lock()
+
+
+def configure_rate_limit(provider: str, rpm: float = None, tpm: float = None, max_concurrency: int = 8, min_concurrency: int = 1) -> bool:
+    """
+    为某个 provider（interface_format）设置限流参数，返回参数是否有变化。
+    该 provider 已创建的限流器（已被缓存的适配器持有）原地更新，之后获取的限流器也使用新参数；
+    参数未变化时不做任何事，避免保存配置时重置限流器当前的并发上限。
+    """
+    fmt = provider.strip().lower()
+    settings = {
+        "rpm": rpm,
+        "tpm": tpm,
+        "max_concurrency": max_concurrency,
+        "min_concurrency": min_concurrency
+    }
+    with _lock:
+        if _limit_settings.get(fmt) == settings:
+            return False
+        _limit_settings[fmt] = settings
+        existing = [limiter for key, limiter in _limiters.items() if key[0] == fmt]
+    for limiter in existing:
+        limiter.reconfigure(**settings)
+    return True
+
+
+def get_rate_limiter(provider: str, api_key: str) -> AdaptiveRateLimiter:
+    """获取 (provider, api_key) 共享的限流器"""
+    fmt = provider.strip().lower()
+    key = (fmt, fingerprint_secret(api_key))
+    with _lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = AdaptiveRateLimiter(**_limit_settings.get(fmt, {}))
+            _limiters[key] = limiter
+        return limiter
+
+
+def get_rate_limiter_stats() -> dict:
+    with _lock:
+        items = list(_limiters.items())
+    return {f"{fmt}:{fp}": limiter.stats() for (fmt, fp), limiter in items}
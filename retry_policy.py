@@ -0,0 +1,180 @@
+# retry_policy.py
+# -*- coding: utf-8 -*-
+"""
+统一的重试策略：带抖动的指数退避、整体截止时间预算、错误分类
+（认证/参数错误立即失败，429/5xx/网络错误重试）。
+重试只在 novel_generator.common 这一层发生，适配器本身只做单次请求。
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+
+FATAL = "fatal"
+RETRYABLE = "retryable"
+
+# 客户端错误中仍值得重试的状态码（请求超时、冲突、限流）
+_RETRYABLE_4XX = {408, 409, 425, 429}
+# 响应体解析失败（截断的 JSON、编码损坏、LLM 输出不符合解析器格式）；它们多为 ValueError 子类，但属于瞬时错误
+_RESPONSE_PARSE_ERRORS = (json.JSONDecodeError, UnicodeDecodeError)
+_RESPONSE_PARSE_ERROR_NAMES = {"JSONDecodeError", "OutputParserException"}
+
+
+class ProviderHTTPError(Exception):
+    """适配器收到非 2xx 响应时抛出，携带状态码供重试策略分类"""
+    def __init__(self, status_code: int, message: str = "", retry_after: float = None):
+        super().__init__(f"HTTP {status_code}: {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def get_status_code(exc: Exception):
+    """从各 SDK 的异常对象中提取 HTTP 状态码"""
+    for attr in ("status_code", "status", "http_status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def classify_error(exc: Exception) -> str:
+    """
+    将异常分为 FATAL（不重试）与 RETRYABLE（可重试）。
+    无状态码的异常（网络中断、超时、响应解析失败等）视为可重试；
+    其余 ValueError / TypeError / KeyError 视为配置或编程错误，不重试。
+    """
+    status = get_status_code(exc)
+    if status is not None:
+        if status in _RETRYABLE_4XX or status >= 500:
+            return RETRYABLE
+        if 400 <= status < 500:
+            return FATAL
+        return RETRYABLE
+    if isinstance(exc, _RESPONSE_PARSE_ERRORS) or any(
+            cls.__name__ in _RESPONSE_PARSE_ERROR_NAMES for cls in type(exc).__mro__):
+        return RETRYABLE
+    if isinstance(exc, (ValueError, TypeError, KeyError)) and "timeout" not in str(exc).lower():
+        # 配置/编程错误（如 base_url 格式错误）重试无意义
+        return FATAL
+    return RETRYABLE
+
+
+class RetryPolicy:
+    """
+    :param max_attempts: 最大尝试次数（含第一次）
+    :param base_delay: 首次重试前的基础等待秒数
+    :param multiplier: 指数退避倍数
+    :param max_delay: 单次等待上限
+    :param jitter: 抖动比例，实际等待在 [delay*(1-jitter), delay] 之间均匀分布
+    :param deadline: 整体时间预算（秒），None 表示不限；预算不足以完成下一次等待时不再重试
+    """
+    def __init__(self, max_attempts: int = 3, base_delay: float = 1.0, multiplier: float = 2.0,
+                 max_delay: float = 30.0, jitter: float = 0.5, deadline: float = None):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+
+    def with_overrides(self, **kwargs) -> "RetryPolicy":
+        params = {
+            "max_attempts": self.max_attempts,
+            "base_delay": self.base_delay,
+            "multiplier": self.multiplier,
+            "max_delay": self.max_delay,
+            "jitter": self.jitter,
+            "deadline": self.deadline
+        }
+        params.update({k: v for k, v in kwargs.items() if v is not None})
+        return RetryPolicy(**params)
+
+    def compute_delay(self, attempt: int, exc: Exception = None) -> float:
+        """第 attempt 次失败后的等待时间；服务端给出 Retry-After 时以其为下限"""
+        delay = min(self.max_delay, self.base_delay * (self.multiplier ** (attempt - 1)))
+        delay = random.uniform(delay * (1 - self.jitter), delay)
+        retry_after = getattr(exc, "retry_after", None) if exc is not None else None
+        if isinstance(retry_after, (int, float)) and retry_after > delay:
+            delay = min(float(retry_after), self.max_delay)
+        return delay
+
+    def next_delay(self, attempt: int, started: float, exc: Exception = None):
+        """
+        判断是否继续重试：返回等待秒数，或 None 表示应停止。
+        """
+        if exc is not None and classify_error(exc) == FATAL:
+            return None
+        if attempt >= self.max_attempts:
+            return None
+        delay = self.compute_delay(attempt, exc)
+        if self.deadline is not None and (time.monotonic() - started) + delay > self.deadline:
+            return None
+        return delay
+
+    def call(self, func, *args, retry_on_result=None, label: str = "", **kwargs):
+        """
+        按策略执行 func(*args, **kwargs)。
+        retry_on_result(result) 为真时（如返回空字符串）也会重试，重试耗尽后返回最后一次结果。
+        异常在不可重试或重试耗尽时原样抛出。
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self.next_delay(attempt, started, e)
+                if delay is None:
+                    raise
+                logging.warning(f"[retry]{label} attempt {attempt}/{self.max_attempts} failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            if retry_on_result is not None and retry_on_result(result):
+                delay = self.next_delay(attempt, started)
+                if delay is None:
+                    return result
+                logging.warning(f"[retry]{label} attempt {attempt}/{self.max_attempts} returned empty result, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            return result
+
+    async def acall(self, func, *args, retry_on_result=None, label: str = "", **kwargs):
+        """call 的异步版本，func 为协程函数"""
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                delay = self.next_delay(attempt, started, e)
+                if delay is None:
+                    raise
+                logging.warning(f"[retry]{label} attempt {attempt}/{self.max_attempts} failed ({type(e).__name__}: {e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            if retry_on_result is not None and retry_on_result(result):
+                delay = self.next_delay(attempt, started)
+                if delay is None:
+                    return result
+                logging.warning(f"[retry]{label} attempt {attempt}/{self.max_attempts} returned empty result, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            return result
+
+
+# 全局默认策略，可通过 set_default_retry_policy 调整
+_default_policy = RetryPolicy()
+
+
+def get_default_retry_policy() -> RetryPolicy:
+    return _default_policy
+
+
+def set_default_retry_policy(policy: RetryPolicy):
+    global _default_policy
+    _default_policy = policy
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试适配器 LRU 缓存（命中复用、任一配置字段变化即未命中、容量淘汰、清空）
+"""
+
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BASE_CONFIG = {
+    "interface_format": "OpenAI",
+    "base_url": "http://127.0.0.1:9/v1",
+    "model_name": "mock-model",
+    "api_key": "sk-test",
+    "temperature": 0.7,
+    "max_tokens": 1024,
+    "timeout": 30
+}
+
+
+def test_llm_adapter_hit_and_miss():
+    """相同配置返回同一实例；base_url / 模型 / 温度 / max_tokens / 超时 / api_key 任一变化都构造新实例"""
+    from llm_adapters import create_llm_adapter, llm_adapter_registry
+
+    llm_adapter_registry.clear()
+    first = create_llm_adapter(**BASE_CONFIG)
+    assert create_llm_adapter(**BASE_CONFIG) is first
+    assert create_llm_adapter(**dict(BASE_CONFIG, interface_format=" openai ")) is first
+
+    variants = {
+        "base_url": "http://127.0.0.1:10/v1",
+        "model_name": "mock-model-2",
+        "temperature": 0.2,
+        "max_tokens": 2048,
+        "timeout": 60,
+        "api_key": "sk-other"
+    }
+    created = {}
+    for field, value in variants.items():
+        adapter = create_llm_adapter(**dict(BASE_CONFIG, **{field: value}))
+        assert adapter is not first, f"{field} 变化应构造新适配器"
+        created[field] = adapter
+    assert created["api_key"].api_key == "sk-other" and created["timeout"].timeout == 60
+
+    stats = llm_adapter_registry.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 + len(variants) and stats["size"] == 1 + len(variants)
+    assert all("sk-" not in str(key) for key in llm_adapter_registry._items)
+    llm_adapter_registry.clear()
+    print("✅ 命中与未命中正常")
+
+
+def test_eviction_and_clear():
+    """超过容量时淘汰最久未使用的实例；clear 后重新构造"""
+    from adapter_registry import AdapterRegistry
+
+    registry = AdapterRegistry("test_registry", max_size=2)
+    built = []
+
+    def factory(name):
+        def build():
+            built.append(name)
+            return object()
+        return build
+
+    a = registry.get_or_create(("a",), factory("a"))
+    b = registry.get_or_create(("b",), factory("b"))
+    assert registry.get_or_create(("a",), factory("a")) is a  # a 变为最近使用
+    registry.get_or_create(("c",), factory("c"))
+    assert registry.stats()["evictions"] == 1 and registry.stats()["size"] == 2
+    assert registry.get_or_create(("a",), factory("a")) is a
+    assert registry.get_or_create(("b",), factory("b")) is not b  # b 已被淘汰
+    assert built == ["a", "b", "c", "b"]
+
+    registry.clear()
+    assert registry.stats()["size"] == 0
+    assert registry.get_or_create(("a",), factory("a")) is not a
+    assert built[-1] == "a"
+
+    try:
+        registry.get_or_create(("bad",), lambda: (_ for _ in ()).throw(ValueError("构造失败")))
+        assert False, "构造失败应抛出异常"
+    except ValueError:
+        pass
+    assert ("bad",) not in registry._items
+    print("✅ 容量淘汰与清空正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试适配器缓存")
+    print("=" * 50)
+    try:
+        test_llm_adapter_hit_and_miss()
+        test_eviction_and_clear()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试适配器原生异步调用（并发 ainvoke 复用异步客户端与连接池、在运行中的事件循环里调用 run_coroutine_sync）
+"""
+
+import sys
+import os
+import time
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_concurrent_ainvoke_reuses_clients():
+    """ChatOpenAI 与 OpenAI SDK 两类适配器并发 ainvoke：请求并行完成，异步客户端只构造一次，连接被复用"""
+    from mock_llm_server import MockLLMServer
+    from llm_adapters import OpenAIAdapter, SiliconFlowAdapter
+    from http_transport import get_http_pool_stats, close_all_http_clients
+    from utils import run_coroutine_sync
+
+    async def fan_out(adapter, n):
+        return await asyncio.gather(*(adapter.ainvoke(f"第{i}次请求") for i in range(n)))
+
+    close_all_http_clients()
+    with MockLLMServer(latency=0.2, responder=lambda prompt, model: f"回复：{prompt}") as server:
+        for adapter in (OpenAIAdapter("k", server.openai_base_url, "mock-model", 256, timeout=10),
+                        SiliconFlowAdapter("k", server.openai_base_url, "mock-model", 256, timeout=10)):
+            started = time.perf_counter()
+            results = run_coroutine_sync(fan_out(adapter, 8))
+            elapsed = time.perf_counter() - started
+            assert results == [f"回复：第{i}次请求" for i in range(8)]
+            assert elapsed < 1.0, f"8 个并发请求耗时 {elapsed:.2f}s，未并行执行"
+
+            client = next(iter(adapter._async_clients.values()))
+            run_coroutine_sync(fan_out(adapter, 8))
+            assert len(adapter._async_clients) == 1 and next(iter(adapter._async_clients.values())) is client
+
+        stats = get_http_pool_stats()[server.url]
+        assert stats["requests"] == 32 and stats["connections"] <= 8 and stats["reused"] >= 24, stats
+        assert server.stats()["by_endpoint"]["openai_chat"] == 32
+    close_all_http_clients()
+    print("✅ 并发 ainvoke 复用客户端正常")
+
+
+def test_run_coroutine_sync_inside_running_loop():
+    """已有运行中事件循环的线程（如 Web 服务）可直接调用 run_coroutine_sync；在后台循环自身中调用会报错"""
+    from mock_llm_server import MockLLMServer
+    from llm_adapters import OpenAIAdapter
+    from utils import run_coroutine_sync
+
+    with MockLLMServer(responses=["来自后台循环的回复"]) as server:
+        adapter = OpenAIAdapter("k", server.openai_base_url, "mock-model", 256, timeout=10)
+
+        async def handler():
+            return run_coroutine_sync(adapter.ainvoke("你好"))
+
+        assert asyncio.run(handler()) == "来自后台循环的回复"
+
+    async def nested():
+        return run_coroutine_sync(asyncio.sleep(0))
+
+    try:
+        run_coroutine_sync(nested())
+        assert False, "在后台循环内调用应抛出 RuntimeError"
+    except RuntimeError:
+        pass
+    print("✅ 运行中的事件循环内同步调用正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试适配器异步调用")
+    print("=" * 50)
+    try:
+        test_concurrent_ainvoke_reuses_clients()
+        test_run_coroutine_sync_inside_running_loop()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试端到端基准测试（在模拟服务上跑通完整流程、基线退化判断）
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_run_benchmark_on_mock_server():
+    """两章的完整流程可在模拟服务上跑通，并统计到各阶段的调用与文件读写"""
+    from benchmark_pipeline import run_benchmark, STAGES
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = run_benchmark(chapters=2, word_number=300, workdir=tmp_dir)
+        assert os.path.exists(os.path.join(tmp_dir, "Novel_architecture.txt"))
+        assert os.path.exists(os.path.join(tmp_dir, "chapters", "chapter_2.txt"))
+
+    stages = results["stages"]
+    assert set(stages) == set(STAGES)
+    assert all(stages[s]["errors"] == 0 for s in STAGES)
+    assert stages["architecture"]["llm_calls"] == 5
+    assert stages["blueprint"]["llm_calls"] == 1
+    assert stages["draft"]["runs"] == 2 and stages["finalize"]["runs"] == 2
+    assert stages["finalize"]["embedding_calls"] > 0
+    assert stages["draft"]["prompt_bytes"] > 0
+    assert stages["finalize"]["file_write_bytes"] > 0
+    print("✅ 模拟服务上的完整流程基准正常")
+
+
+def test_compare_to_baseline():
+    """超过阈值的退化被报告，极短阶段的耗时抖动被忽略"""
+    from benchmark_pipeline import compare_to_baseline
+
+    baseline = {"stages": {
+        "draft": {"wall_seconds": 1.0, "llm_calls": 10, "prompt_bytes": 1000},
+        "blueprint": {"wall_seconds": 0.01, "llm_calls": 1}
+    }}
+    results = {"stages": {
+        "draft": {"wall_seconds": 1.5, "llm_calls": 10, "prompt_bytes": 1100},
+        "blueprint": {"wall_seconds": 0.03, "llm_calls": 1}
+    }}
+    regressions = compare_to_baseline(results, baseline, threshold=0.2)
+    assert len(regressions) == 1 and regressions[0].startswith("draft.wall_seconds")
+
+    results["stages"]["draft"]["llm_calls"] = 13
+    assert len(compare_to_baseline(results, baseline, threshold=0.2)) == 2
+    print("✅ 基线退化判断正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试端到端基准测试")
+    print("=" * 50)
+    try:
+        test_run_benchmark_on_mock_server()
+        test_compare_to_baseline()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
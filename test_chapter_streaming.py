@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试章节草稿流式生成（on_chunk 按顺序收到分片、章节文件写入清理后的全文、已有输出后中途失败不重试且保留原有草稿）
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+RAW_DRAFT = "```\n  夜色沉沉，城外的钟声隔着雨幕传来。他握紧手中的信。```  \n"
+CHUNK_CHARS = 4
+
+
+def _draft(server, tmp_dir, on_chunk):
+    from novel_generator.chapter import generate_chapter_draft
+    return generate_chapter_draft(
+        api_key="k", base_url=server.openai_base_url, model_name="mock-model", filepath=tmp_dir,
+        novel_number=1, word_number=100, temperature=0.7, user_guidance="", characters_involved="",
+        key_items="", scene_location="", time_constraint="", embedding_api_key="", embedding_url="",
+        embedding_interface_format="local", embedding_model_name="local-ngram-64",
+        interface_format="OpenAI", max_tokens=512, timeout=10, custom_prompt_text="请写第一章正文",
+        on_chunk=on_chunk
+    )
+
+
+def _fast_retries():
+    from retry_policy import RetryPolicy, set_default_retry_policy, get_default_retry_policy
+    original = get_default_retry_policy()
+    set_default_retry_policy(RetryPolicy(base_delay=0.01, max_delay=0.02))
+    return original
+
+
+def test_stream_chunks_in_order():
+    """on_chunk 按服务端顺序收到每个分片，章节文件最终为清理后的全文；产出前的失败会重试"""
+    from mock_llm_server import MockLLMServer
+    from retry_policy import set_default_retry_policy
+
+    original = _fast_retries()
+    try:
+        with MockLLMServer(responses=[RAW_DRAFT], stream_chunk_chars=CHUNK_CHARS) as server, \
+                tempfile.TemporaryDirectory() as tmp_dir:
+            server.fail_next(500)
+            received = []
+            content = _draft(server, tmp_dir, received.append)
+
+            expected_chunks = [RAW_DRAFT[i:i + CHUNK_CHARS] for i in range(0, len(RAW_DRAFT), CHUNK_CHARS)]
+            assert received == expected_chunks
+            assert content == "夜色沉沉，城外的钟声隔着雨幕传来。他握紧手中的信。"
+            with open(os.path.join(tmp_dir, "chapters", "chapter_1.txt"), encoding="utf-8") as f:
+                assert f.read() == content
+            assert server.stats()["by_endpoint"]["openai_chat"] == 2
+    finally:
+        set_default_retry_policy(original)
+    print("✅ 流式分片顺序与清理正常")
+
+
+def test_mid_stream_failure_not_retried():
+    """已经产出部分内容后失败时直接抛出，不会重新请求导致界面重复输出；原有草稿文件保持不变"""
+    from mock_llm_server import MockLLMServer
+    from retry_policy import set_default_retry_policy
+
+    original = _fast_retries()
+    try:
+        with MockLLMServer(responses=[RAW_DRAFT, "不应被请求的第二次回复"], stream_chunk_chars=CHUNK_CHARS) as server, \
+                tempfile.TemporaryDirectory() as tmp_dir:
+            chapter_file = os.path.join(tmp_dir, "chapters", "chapter_1.txt")
+            os.makedirs(os.path.dirname(chapter_file))
+            with open(chapter_file, "w", encoding="utf-8") as f:
+                f.write("上一版草稿")
+            server.fail_stream_after(3)
+            received = []
+            try:
+                _draft(server, tmp_dir, received.append)
+                assert False, "中途失败应抛出异常"
+            except AssertionError:
+                raise
+            except Exception:
+                pass
+            assert received == [RAW_DRAFT[i:i + CHUNK_CHARS] for i in range(0, 3 * CHUNK_CHARS, CHUNK_CHARS)]
+            stats = server.stats()
+            assert stats["by_endpoint"]["openai_chat"] == 1 and stats["errors"] == 1
+            with open(chapter_file, encoding="utf-8") as f:
+                assert f.read() == "上一版草稿", "流式生成失败时应保留原有草稿"
+            assert os.listdir(os.path.dirname(chapter_file)) == ["chapter_1.txt"]
+    finally:
+        set_default_retry_policy(original)
+    print("✅ 中途失败不重试正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试章节草稿流式生成")
+    print("=" * 50)
+    try:
+        test_stream_chunks_in_order()
+        test_mid_stream_failure_not_retried()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试章节片段幂等写入（确定性 ID、替换旧片段）与已有向量库去重
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_adapters import LocalEmbeddingAdapter
+
+
+class CountingAdapter(LocalEmbeddingAdapter):
+    """记录被向量化文本的本地适配器"""
+    def __init__(self, model_name):
+        super().__init__(model_name)
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def _chapter_docs(store, chapter):
+    from novel_generator.vectorstore_utils import SOURCE_CHAPTER
+    data = store._collection.get(where={"$and": [{"source": SOURCE_CHAPTER}, {"chapter": chapter}]})
+    return sorted(data["documents"])
+
+
+def test_refinalize_is_idempotent():
+    """重复定稿同一章不追加副本；修改后只替换变化的片段"""
+    from novel_generator.embedding_cache import configure_embedding_cache
+    from novel_generator.vectorstore_utils import update_vector_store, load_vector_store, split_text_for_vectorstore
+
+    first = "。".join(f"第{i}段：灯塔守夜人记录潮汐与风向，并在日志里写下当天的见闻" for i in range(60)) + "。"
+    edited = first.replace("第59段：灯塔守夜人", "第59段：新来的学徒")
+    assert len(split_text_for_vectorstore(first)) >= 3
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        adapter = CountingAdapter("local-ngram-64")
+        configure_embedding_cache(enabled=False)
+        try:
+            update_vector_store(adapter, first, tmp_dir, chapter_number=3)
+            update_vector_store(adapter, "第四章的内容。", tmp_dir, chapter_number=4)
+            store = load_vector_store(adapter, tmp_dir)
+            original = _chapter_docs(store, 3)
+            total = store._collection.count()
+
+            adapter.embedded.clear()
+            update_vector_store(adapter, first, tmp_dir, chapter_number=3)
+            assert store._collection.count() == total and adapter.embedded == []
+
+            update_vector_store(adapter, edited, tmp_dir, chapter_number=3)
+            replaced = _chapter_docs(store, 3)
+            assert store._collection.count() == total and len(replaced) == len(original)
+            assert sorted(split_text_for_vectorstore(edited)) == replaced
+            assert adapter.embedded == [t for t in split_text_for_vectorstore(edited) if t not in original]
+            assert _chapter_docs(store, 4) == ["第四章的内容。"]
+        finally:
+            configure_embedding_cache(enabled=True)
+    print("✅ 章节幂等写入正常")
+
+
+def test_knowledge_reimport_and_dedupe():
+    """重复导入同一知识库文件不追加，文件修改后重新导入替换旧片段；去重清理旧版本产生的重复片段"""
+    from langchain.docstore.document import Document
+    from novel_generator.knowledge import import_knowledge_file
+    from novel_generator import dedupe_vector_store
+    from novel_generator.vectorstore_utils import load_vector_store, SOURCE_CHAPTER, SOURCE_LEGACY
+
+    adapter = LocalEmbeddingAdapter("local-ngram-64")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        knowledge_path = os.path.join(tmp_dir, "lore.txt")
+        with open(knowledge_path, "w", encoding="utf-8") as f:
+            f.write("港口在每年冬天封冻。渔民改为凿冰捕鱼。")
+        for _ in range(2):
+            import_knowledge_file("", "", "local", "local-ngram-64", knowledge_path, tmp_dir)
+        store = load_vector_store(adapter, tmp_dir)
+        assert store._collection.count() == 1
+
+        # 修改后重新导入：该文件的旧片段被替换，其他知识库文件的片段不受影响
+        other_path = os.path.join(tmp_dir, "other.txt")
+        with open(other_path, "w", encoding="utf-8") as f:
+            f.write("灯塔守夜人姓周。")
+        import_knowledge_file("", "", "local", "local-ngram-64", other_path, tmp_dir)
+        with open(knowledge_path, "w", encoding="utf-8") as f:
+            f.write("港口终年不冻。渔民夜里出海。")
+        import_knowledge_file("", "", "local", "local-ngram-64", knowledge_path, tmp_dir)
+        lore = store._collection.get(where={"file": "lore.txt"})["documents"]
+        assert lore == ["港口终年不冻。 渔民夜里出海。"], lore
+        assert store._collection.get(where={"file": "other.txt"})["documents"] == ["灯塔守夜人姓周。"]
+        store.delete(ids=store._collection.get(where={"file": "other.txt"})["ids"])
+        with open(knowledge_path, "w", encoding="utf-8") as f:
+            f.write("港口在每年冬天封冻。渔民改为凿冰捕鱼。")
+        import_knowledge_file("", "", "local", "local-ngram-64", knowledge_path, tmp_dir)
+        assert store._collection.count() == 1
+
+        # 模拟旧版本：同一章重复定稿（随机 ID）与无元数据的旧片段
+        chapter_meta = {"source": SOURCE_CHAPTER, "chapter": 2, "offset": 0}
+        store.add_documents([Document(page_content="第二章：雾中来客。", metadata=chapter_meta)] * 2)
+        store.add_documents([
+            Document(page_content="第二章：雾中来客。", metadata={"source": SOURCE_LEGACY, "chapter": 0, "offset": 0}),
+            Document(page_content="只存在于旧片段的内容。", metadata={"source": SOURCE_LEGACY, "chapter": 0, "offset": 0})
+        ])
+        assert store._collection.count() == 5
+        assert dedupe_vector_store(adapter, tmp_dir) == 2
+        assert sorted(store._collection.get()["documents"]) == sorted(
+            ["港口在每年冬天封冻。 渔民改为凿冰捕鱼。", "第二章：雾中来客。", "只存在于旧片段的内容。"]
+        )
+        assert dedupe_vector_store(adapter, tmp_dir) == 0
+    print("✅ 知识库重复导入与去重正常")
+
+
+def test_legacy_store_deduped_on_open():
+    """旧版本创建的向量库（无头信息）首次打开时补标元数据并清理一次重复片段，随后写入头信息"""
+    from novel_generator.vectorstore_utils import (
+        init_vector_store, load_vector_store, invalidate_vector_store_handle, read_vector_store_meta,
+        get_vectorstore_dir, VECTORSTORE_META_FILENAME, SOURCE_LEGACY
+    )
+
+    adapter = LocalEmbeddingAdapter("local-ngram-64")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = init_vector_store(adapter, ["林默推开旧宅的门。"], tmp_dir)
+        texts = ["林默推开旧宅的门。", "苏晴在码头清点货物。", "苏晴在码头清点货物。"]
+        store._collection.add(ids=["old-1", "old-2", "old-3"], documents=texts,
+                              embeddings=adapter.embed_documents(texts))  # 旧版本：随机 ID、无元数据
+        invalidate_vector_store_handle(tmp_dir)
+        os.remove(os.path.join(get_vectorstore_dir(tmp_dir), VECTORSTORE_META_FILENAME))
+
+        store = load_vector_store(adapter, tmp_dir)
+        data = store._collection.get(include=["documents", "metadatas"])
+        assert sorted(data["documents"]) == ["林默推开旧宅的门。", "苏晴在码头清点货物。"], data["documents"]
+        assert any(meta.get("source") == SOURCE_LEGACY for meta in data["metadatas"])
+        assert read_vector_store_meta(tmp_dir)["dim"] == 64, "清理后应写入头信息，之后不再重复扫描"
+        invalidate_vector_store_handle(tmp_dir)
+    print("✅ 旧向量库打开时去重正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试章节幂等写入与去重")
+    print("=" * 50)
+    try:
+        test_refinalize_is_idempotent()
+        test_knowledge_reimport_and_dedupe()
+        test_legacy_store_deduped_on_open()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
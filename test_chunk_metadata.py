@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试向量片段元数据（章节号、来源、字符偏移）与索引内按元数据过滤检索
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _all_chunks(store):
+    data = store._collection.get(include=["documents", "metadatas"])
+    return list(zip(data["documents"], data["metadatas"]))
+
+
+def test_chunks_carry_metadata_and_filter():
+    """定稿章节与知识库导入的片段带元数据，检索可在索引内排除最近章节或只检索知识库"""
+    from embedding_adapters import LocalEmbeddingAdapter
+    from novel_generator.knowledge import import_knowledge_file
+    from novel_generator.vectorstore_utils import (
+        update_vector_store, load_vector_store, multi_query_similarity_search, build_chunk_filter,
+        latest_chunk_chapter, SOURCE_CHAPTER, SOURCE_KNOWLEDGE
+    )
+
+    adapter = LocalEmbeddingAdapter("local-ngram-128")
+    chapters = {n: f"第{n}章的灯塔守夜人点亮灯塔。雾里传来第{n}声汽笛。" for n in range(1, 6)}
+    knowledge = "灯塔的透镜由黄铜框架固定。守夜人每晚检查燃油。"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for number, text in chapters.items():
+            update_vector_store(adapter, text, tmp_dir, chapter_number=number)
+        knowledge_path = os.path.join(tmp_dir, "lighthouse.txt")
+        with open(knowledge_path, "w", encoding="utf-8") as f:
+            f.write(knowledge)
+        import_knowledge_file("", "", "local", "local-ngram-128", knowledge_path, tmp_dir)
+
+        store = load_vector_store(adapter, tmp_dir)
+        chunks = _all_chunks(store)
+        assert len(chunks) == 6
+        for doc, meta in chunks:
+            source_text = knowledge if meta["source"] == SOURCE_KNOWLEDGE else chapters[meta["chapter"]]
+            assert source_text[meta["offset"]:].startswith(doc.split()[0])
+        knowledge_meta = [m for _, m in chunks if m["source"] == SOURCE_KNOWLEDGE][0]
+        assert knowledge_meta == {"source": SOURCE_KNOWLEDGE, "chapter": 0, "offset": 0, "file": "lighthouse.txt"}
+
+        query = ["灯塔 守夜人"]
+        hits = multi_query_similarity_search(adapter, query, tmp_dir, k=10, where=build_chunk_filter(before_chapter=4))[0]
+        found = sorted((d.metadata["source"], d.metadata["chapter"]) for d, _ in hits)
+        assert found == [(SOURCE_CHAPTER, 1), (SOURCE_CHAPTER, 2), (SOURCE_CHAPTER, 3), (SOURCE_KNOWLEDGE, 0)]
+        assert latest_chunk_chapter(hits) == 3
+
+        hits = multi_query_similarity_search(adapter, query, tmp_dir, k=10, where=build_chunk_filter(SOURCE_KNOWLEDGE))[0]
+        assert [d.metadata["source"] for d, _ in hits] == [SOURCE_KNOWLEDGE] and latest_chunk_chapter(hits) == 0
+
+        where = build_chunk_filter(SOURCE_CHAPTER, before_chapter=3)
+        hits = multi_query_similarity_search(adapter, query, tmp_dir, k=10, where=where)[0]
+        assert sorted(d.metadata["chapter"] for d, _ in hits) == [1, 2]
+    print("✅ 片段元数据与过滤检索正常")
+
+
+def test_legacy_chunks_backfilled():
+    """旧版本写入的无元数据片段在打开时补标 legacy，仍可被不限来源的过滤检索命中"""
+    from embedding_adapters import LocalEmbeddingAdapter
+    from novel_generator.vectorstore_utils import (
+        init_vector_store, load_vector_store, invalidate_vector_store_handle, multi_query_similarity_search,
+        build_chunk_filter, latest_chunk_chapter, SOURCE_LEGACY
+    )
+
+    adapter = LocalEmbeddingAdapter("local-ngram-128")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        assert init_vector_store(adapter, ["第3章 旧宅里的钟停在午夜。"], tmp_dir) is not None
+        invalidate_vector_store_handle(tmp_dir)
+        store = load_vector_store(adapter, tmp_dir)
+        assert [m["source"] for _, m in _all_chunks(store)] == [SOURCE_LEGACY]
+        hits = multi_query_similarity_search(adapter, ["旧宅 钟"], tmp_dir, k=2, where=build_chunk_filter(before_chapter=8))[0]
+        assert len(hits) == 1 and latest_chunk_chapter(hits) is None
+        invalidate_vector_store_handle(tmp_dir)
+    print("✅ 旧片段补标正常")
+
+
+def test_rules_use_metadata():
+    """内容规则优先使用元数据中的章节号，不再从正文数字猜测"""
+    from novel_generator.chapter import apply_content_rules, apply_knowledge_rules
+
+    texts = ["[GENERAL] 1999年第9章出版的灯塔志", "[GENERAL] 守夜人回忆第7章的风暴", "[GENERAL] 第9章 旧片段"]
+    assert [t.split()[0] for t in apply_content_rules(texts, 10, [0, 7, None])] == ["[PRIOR]", "[MOD40%]", "[SKIP]"]
+    assert [t.split()[0] for t in apply_content_rules(texts[:1], 10)] == ["[SKIP]"]
+    processed = apply_knowledge_rules(texts, 10, [0, 7, None])
+    assert processed[0].startswith("[外部知识]") and processed[1].startswith("[历史章节限制]")
+    print("✅ 内容规则使用元数据正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试向量片段元数据与过滤检索")
+    print("=" * 50)
+    try:
+        test_chunks_carry_metadata_and_filter()
+        test_legacy_chunks_backfilled()
+        test_rules_use_metadata()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
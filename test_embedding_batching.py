@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 Embedding 批量请求（Ollama /api/embed、Gemini batchEmbedContents、SiliconFlow 列表 input、超限自动拆分）
+"""
+
+import sys
+import os
+import asyncio
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+TEXTS = [f"第{i}段：雨夜来信，灯下无人。" for i in range(10)]
+
+
+def test_split_into_batches():
+    """按条数与总字符数分批，超长单条独占一批"""
+    from embedding_adapters import split_into_batches
+
+    assert [len(b) for b in split_into_batches(TEXTS, 4, 10000)] == [4, 4, 2]
+    assert [len(b) for b in split_into_batches(["a" * 5, "b" * 5, "c" * 20, "d"], 10, 10)] == [2, 1, 1]
+    assert split_into_batches([], 4, 100) == []
+    print("✅ 分批规则正常")
+
+
+def test_batch_endpoints():
+    """三个适配器均使用批量接口，结果顺序与逐条请求一致"""
+    from mock_llm_server import MockLLMServer, hashed_embedding
+    from embedding_adapters import OllamaEmbeddingAdapter, GeminiEmbeddingAdapter, SiliconFlowEmbeddingAdapter
+
+    expected = [hashed_embedding(t, 16) for t in TEXTS]
+    with MockLLMServer(embedding_dim=16) as server:
+        ollama = OllamaEmbeddingAdapter("mock-embedding", f"{server.url}/api", batch_size=4)
+        assert ollama.embed_documents(TEXTS) == expected
+        assert ollama.embed_query(TEXTS[0]) == expected[0]
+
+        gemini = GeminiEmbeddingAdapter("k", "text-embedding-004", f"{server.gemini_base_url}/models")
+        assert gemini.embed_documents(TEXTS) == expected
+
+        siliconflow = SiliconFlowEmbeddingAdapter("k", f"{server.url}/v1/embeddings", "mock-embedding", batch_size=3)
+        assert siliconflow.embed_documents(TEXTS) == expected
+        assert asyncio.run(siliconflow.aembed_documents(TEXTS)) == expected
+
+        by_endpoint = server.stats()["by_endpoint"]
+        assert by_endpoint["ollama_embed"] == 3 + 1
+        assert by_endpoint["gemini_batch_embed"] == 1
+        assert by_endpoint["openai_embeddings"] == 4 + 4
+        assert "ollama_embeddings" not in by_endpoint and "gemini_embed" not in by_endpoint
+    print("✅ 批量接口正常")
+
+
+def test_split_on_payload_limit():
+    """服务端返回 413 时对半拆分重发，其他错误该批返回空向量"""
+    from mock_llm_server import MockLLMServer, hashed_embedding
+    from embedding_adapters import OllamaEmbeddingAdapter
+
+    expected = [hashed_embedding(t, 16) for t in TEXTS[:4]]
+    with MockLLMServer(embedding_dim=16) as server:
+        adapter = OllamaEmbeddingAdapter("mock-embedding", f"{server.url}/api", batch_size=4)
+        server.fail_next(413)
+        assert adapter.embed_documents(TEXTS[:4]) == expected
+        assert server.stats()["by_endpoint"]["ollama_embed"] == 1 + 2
+
+        server.fail_next(500)
+        assert adapter.embed_documents(TEXTS[:4]) == [[], [], [], []]
+    print("✅ 超限自动拆分正常")
+
+
+def test_ollama_legacy_fallback():
+    """旧版 Ollama 没有 /api/embed 时回退到逐条 /api/embeddings，结果同样归一化"""
+    import math
+    from mock_llm_server import MockLLMServer, hashed_embedding
+    from embedding_adapters import OllamaEmbeddingAdapter
+
+    with MockLLMServer(embedding_dim=16, embedding_scale=3.0) as server:
+        adapter = OllamaEmbeddingAdapter("mock-embedding", f"{server.url}/api")
+        server.fail_next(404)
+        vectors = adapter.embed_documents(TEXTS[:3])
+        for vector, text in zip(vectors, TEXTS[:3]):
+            assert all(abs(a - b) < 1e-9 for a, b in zip(vector, hashed_embedding(text, 16)))
+            assert abs(math.sqrt(sum(v * v for v in vector)) - 1.0) < 1e-9
+        assert server.stats()["by_endpoint"]["ollama_embeddings"] == 3
+    print("✅ 旧版 Ollama 回退正常")
+
+
+def test_ollama_model_id_tracks_endpoint():
+    """Ollama 改用归一化的 /api/embed 后模型标识变化：旧向量库校验不通过，旧缓存条目不再命中"""
+    import tempfile
+    from embedding_adapters import OllamaEmbeddingAdapter
+    from novel_generator.embedding_cache import get_embedding_model_id
+    from novel_generator.vectorstore_utils import (
+        check_vector_store_compat, get_vectorstore_dir, VECTORSTORE_META_FILENAME, VectorStoreMismatchError
+    )
+
+    adapter = OllamaEmbeddingAdapter("nomic-embed-text", "http://localhost:11434/api")
+    assert get_embedding_model_id(adapter) == "OllamaEmbeddingAdapter:embed:nomic-embed-text"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.makedirs(get_vectorstore_dir(tmp_dir))
+        with open(os.path.join(get_vectorstore_dir(tmp_dir), VECTORSTORE_META_FILENAME), "w", encoding="utf-8") as f:
+            f.write('{"model": "OllamaEmbeddingAdapter:nomic-embed-text", "dim": 768, "backend": "chroma"}')
+        try:
+            check_vector_store_compat(adapter, tmp_dir)
+            assert False, "旧接口构建的向量库应校验不通过"
+        except VectorStoreMismatchError:
+            pass
+    print("✅ Ollama 模型标识正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试 Embedding 批量请求")
+    print("=" * 50)
+    try:
+        test_split_into_batches()
+        test_batch_endpoints()
+        test_split_on_payload_limit()
+        test_ollama_legacy_fallback()
+        test_ollama_model_id_tracks_endpoint()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
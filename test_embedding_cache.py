@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试项目级 embedding 缓存（按模型 + 文本哈希寻址、LRU 淘汰、重建向量库时复用向量）
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_adapters import BaseEmbeddingAdapter
+
+
+class CountingAdapter(BaseEmbeddingAdapter):
+    """记录被请求向量化的文本的假适配器"""
+    supports_batch = True
+
+    def __init__(self, model_name="fake-embedding"):
+        self.model_name = model_name
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(t)), 0.5, 0.25] for t in texts]
+
+    def embed_query(self, query):
+        return [float(len(query)), 0.5, 0.25]
+
+
+def test_cache_roundtrip_and_eviction():
+    """向量按模型区分，超过条目上限时淘汰最久未访问的条目"""
+    from novel_generator.embedding_cache import EmbeddingCache
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = EmbeddingCache(os.path.join(tmp_dir, "cache.sqlite"), max_entries=3)
+        cache.put_many("m1", ["甲", "乙", "空"], [[1.0, 2.0], [3.0, 4.0], []])
+        assert cache.get_many("m1", ["乙", "丙", "甲", "乙"]) == {0: [3.0, 4.0], 2: [1.0, 2.0], 3: [3.0, 4.0]}
+        assert cache.get_many("m2", ["甲"]) == {}
+
+        cache.put_many("m1", ["丙", "丁"], [[5.0], [6.0]])
+        stats = cache.stats()
+        assert stats["entries"] == 3
+        assert cache.get_many("m1", ["甲"]) == {}, "最久未访问的条目应被淘汰"
+        cache.close()
+    print("✅ 缓存读写与淘汰正常")
+
+
+def test_repeat_embedding_reuses_cache():
+    """重复导入相同文本、追加重复文本时只对新文本请求接口"""
+    from novel_generator.vectorstore_utils import init_vector_store, _make_chroma_embedding
+    from novel_generator.embedding_cache import configure_embedding_cache
+
+    configure_embedding_cache(True)
+    adapter = CountingAdapter()
+    texts = ["第一段：雨夜来信。", "第二段：灯下无人。", "第三段：旧友重逢。"]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        assert init_vector_store(adapter, texts, tmp_dir) is not None
+        assert adapter.embedded == texts
+
+        adapter.embedded.clear()
+        assert init_vector_store(adapter, texts, tmp_dir) is not None
+        assert adapter.embedded == []
+
+        wrapper = _make_chroma_embedding(adapter, tmp_dir)
+        vectors = wrapper.embed_documents([texts[0], "第四段：新的线索。", "第四段：新的线索。"])
+        assert adapter.embedded == ["第四段：新的线索。"]
+        assert vectors[1] == vectors[2] and len(vectors) == 3
+
+        other_model = CountingAdapter("other-embedding")
+        _make_chroma_embedding(other_model, tmp_dir).embed_documents(texts)
+        assert other_model.embedded == texts
+        configure_embedding_cache(True)  # 关闭已打开的缓存文件
+    print("✅ 重复向量化时复用缓存正常")
+
+
+def test_query_embedding_memo():
+    """重复的检索查询在内存命中；新会话（新的内存 LRU）从磁盘命中"""
+    from novel_generator.vectorstore_utils import _make_chroma_embedding
+    from novel_generator.embedding_cache import QueryEmbeddingMemo, configure_embedding_cache, get_embedding_cache
+    import novel_generator.embedding_cache as embedding_cache
+
+    configure_embedding_cache(True)
+    adapter = CountingAdapter()
+    queries = []
+    adapter.embed_query = lambda query: queries.append(query) or [float(len(query)), 1.0]
+    original_memo = embedding_cache._query_memo
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            embedding_cache._query_memo = QueryEmbeddingMemo(max_entries=2)
+            wrapper = _make_chroma_embedding(adapter, tmp_dir)
+            for group in ["林默 旧宅", "雨夜 来信", "林默 旧宅"]:
+                wrapper.embed_query(group)
+            assert queries == ["林默 旧宅", "雨夜 来信"]
+            stats = embedding_cache._query_memo.stats()
+            assert (stats["memory_hits"], stats["misses"]) == (1, 2)
+            assert abs(stats["hit_rate"] - 1 / 3) < 1e-9
+
+            embedding_cache._query_memo = QueryEmbeddingMemo()
+            assert _make_chroma_embedding(adapter, tmp_dir).embed_query("雨夜 来信") == [5.0, 1.0]
+            assert len(queries) == 2 and embedding_cache._query_memo.stats()["disk_hits"] == 1
+            # 查询向量与文档向量分开存放
+            assert get_embedding_cache(tmp_dir).get_many("CountingAdapter:fake-embedding", ["雨夜 来信"]) == {}
+            configure_embedding_cache(True)
+    finally:
+        embedding_cache._query_memo = original_memo
+    print("✅ 查询向量记忆正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试 embedding 缓存")
+    print("=" * 50)
+    try:
+        test_cache_roundtrip_and_eviction()
+        test_repeat_embedding_reuses_cache()
+        test_query_embedding_memo()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
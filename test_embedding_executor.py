@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试并发 Embedding 执行层（有界并发、结果保序、逐条重试、共享限流、吞掉错误的分类）
+"""
+
+import sys
+import os
+import time
+import asyncio
+import threading
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_adapters import BaseEmbeddingAdapter
+
+
+class SlowPerTextAdapter(BaseEmbeddingAdapter):
+    """逐条请求、每条耗时 delay 秒的假适配器；fail_once 中的文本第一次返回空向量"""
+    def __init__(self, delay=0.05, fail_once=()):
+        self.delay = delay
+        self.fail_once = set(fail_once)
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+            result = []
+            for text in texts:
+                if text in self.fail_once:
+                    self.fail_once.discard(text)
+                    result.append([])
+                else:
+                    result.append([float(len(text)), float(ord(text[0]))])
+            return result
+
+    def embed_query(self, query):
+        return self.embed_documents([query])[0]
+
+
+TEXTS = [chr(ord("a") + i) * (i + 1) for i in range(8)]
+EXPECTED = [[float(len(t)), float(ord(t[0]))] for t in TEXTS]
+
+
+def test_concurrent_and_ordered():
+    """逐条接口的适配器按 max_workers 并发执行，结果顺序不变"""
+    from embedding_executor import ConcurrentEmbeddingAdapter
+
+    adapter = SlowPerTextAdapter(delay=0.1)
+    executor = ConcurrentEmbeddingAdapter(adapter, max_workers=4)
+    start = time.perf_counter()
+    assert executor.embed_documents(TEXTS) == EXPECTED
+    elapsed = time.perf_counter() - start
+    assert all(len(call) == 1 for call in adapter.calls)
+    assert adapter.max_in_flight == 4
+    assert elapsed < 0.6, f"并发执行耗时 {elapsed:.2f}s，接近串行"
+    assert asyncio.run(executor.aembed_documents(TEXTS)) == EXPECTED
+    print(f"✅ 并发执行且保序（{elapsed:.2f}s）")
+
+
+def test_per_item_retry():
+    """仅对返回空向量的条目重试"""
+    from embedding_executor import ConcurrentEmbeddingAdapter
+    from retry_policy import RetryPolicy
+
+    adapter = SlowPerTextAdapter(delay=0, fail_once={TEXTS[2], TEXTS[5]})
+    adapter.supports_batch = True
+    executor = ConcurrentEmbeddingAdapter(adapter, max_workers=2, chunk_size=4,
+                                          retry_policy=RetryPolicy(base_delay=0.01, max_delay=0.02))
+    assert executor.embed_documents(TEXTS) == EXPECTED
+    retried = sorted(call for call in adapter.calls if len(call) == 1)
+    assert retried == [[TEXTS[2]], [TEXTS[5]]]
+    print("✅ 逐条重试正常")
+
+
+def test_rate_limiter_bounds_concurrency():
+    """适配器的共享限流器进一步限制并发"""
+    from embedding_executor import ConcurrentEmbeddingAdapter
+    from rate_limiter import AdaptiveRateLimiter
+
+    adapter = SlowPerTextAdapter(delay=0.05)
+    adapter.rate_limiter = AdaptiveRateLimiter(max_concurrency=2)
+    executor = ConcurrentEmbeddingAdapter(adapter, max_workers=8)
+    assert executor.embed_documents(TEXTS) == EXPECTED
+    assert adapter.max_in_flight <= 2
+    assert adapter.rate_limiter.stats()["successes"] == len(TEXTS)
+    print("✅ 限流器约束并发正常")
+
+
+def test_swallowed_errors_are_classified():
+    """适配器吞掉的 401 不再重试；吞掉的 429 反馈给限流器并重试成功"""
+    from mock_llm_server import MockLLMServer
+    from embedding_adapters import SiliconFlowEmbeddingAdapter
+    from embedding_executor import ConcurrentEmbeddingAdapter
+    from rate_limiter import AdaptiveRateLimiter
+    from retry_policy import RetryPolicy
+
+    with MockLLMServer(embedding_dim=16, retry_after=0.01) as server:
+        adapter = SiliconFlowEmbeddingAdapter("k", f"{server.openai_base_url}/embeddings", "mock-embedding")
+        adapter.rate_limiter = AdaptiveRateLimiter(max_concurrency=4)
+        executor = ConcurrentEmbeddingAdapter(adapter, retry_policy=RetryPolicy(max_attempts=5, base_delay=0.01, max_delay=0.02))
+
+        server.fail_next(401)
+        assert executor.embed_documents(TEXTS[:3]) == [[], [], []]
+        assert server.stats()["by_endpoint"]["openai_embeddings"] == 1, "鉴权失败不应重试"
+
+        server.fail_next(429)
+        vectors = executor.embed_documents(TEXTS[:3])
+        assert all(len(vec) == 16 for vec in vectors)
+        assert server.stats()["by_endpoint"]["openai_embeddings"] == 3
+        assert adapter.rate_limiter.stats()["throttles"] == 1
+    print("✅ 吞掉的错误按类别处理正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试并发 Embedding 执行层")
+    print("=" * 50)
+    try:
+        test_concurrent_and_ordered()
+        test_per_item_retry()
+        test_rate_limiter_bounds_concurrency()
+        test_swallowed_errors_are_classified()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
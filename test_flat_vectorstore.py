@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试纯 NumPy 内存映射平面向量索引后端（按项目选择、持久化重开、过滤、删除压缩、量化存储，与 Chroma 排序一致）
+"""
+
+import sys
+import os
+import json
+import time
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_adapters import LocalEmbeddingAdapter
+
+CHAPTERS = {
+    1: "林默推开旧宅的门，灰尘扑面。祖父留下的怀表停在午夜。",
+    2: "苏晴在码头清点货物，发现一箱没有登记的黄铜零件。",
+    3: "港口起雾，汽笛声远。林默在灯塔下等来了苏晴。",
+    4: "旧宅地下室藏着一封信，信里提到黄铜零件的来历。"
+}
+
+
+def _ranked(hits):
+    return [doc.page_content for doc, _ in hits]
+
+
+def test_flat_backend_end_to_end():
+    """项目配置选择 flat 后端；定稿、导入、批量过滤检索与 Chroma 结果一致；重开后数据完整"""
+    from novel_generator.flat_vectorstore import FLAT_VECTORS_FILENAME, FLAT_META_FILENAME, FlatVectorStore
+    from novel_generator.vectorstore_utils import (
+        update_vector_store, load_vector_store, multi_query_similarity_search, build_chunk_filter,
+        invalidate_vector_store_handle, get_vector_store_backend, get_vectorstore_dir, read_vector_store_meta,
+        dedupe_vector_store
+    )
+
+    adapter = LocalEmbeddingAdapter("local-ngram-256")
+    queries = ["黄铜零件", "旧宅 怀表", "灯塔 雾"]
+    with tempfile.TemporaryDirectory() as flat_dir, tempfile.TemporaryDirectory() as chroma_dir:
+        with open(os.path.join(flat_dir, "novel_config.json"), "w", encoding="utf-8") as f:
+            json.dump({"vectorstore_backend": "flat"}, f)
+        assert get_vector_store_backend(flat_dir) == "flat" and get_vector_store_backend(chroma_dir) == "chroma"
+
+        for project in (flat_dir, chroma_dir):
+            for number, text in CHAPTERS.items():
+                update_vector_store(adapter, text, project, chapter_number=number)
+            update_vector_store(adapter, CHAPTERS[2], project, chapter_number=2)
+
+        store = load_vector_store(adapter, flat_dir)
+        assert isinstance(store, FlatVectorStore) and store._collection.count() == 4
+        assert read_vector_store_meta(flat_dir)["backend"] == "flat"
+        store_dir = get_vectorstore_dir(flat_dir)
+        assert os.path.exists(os.path.join(store_dir, FLAT_VECTORS_FILENAME))
+        assert os.path.exists(os.path.join(store_dir, FLAT_META_FILENAME))
+        assert not os.path.exists(os.path.join(store_dir, "chroma.sqlite3"))
+
+        for where in (None, build_chunk_filter(before_chapter=3)):
+            flat = multi_query_similarity_search(adapter, queries, flat_dir, k=3, where=where)
+            chroma = multi_query_similarity_search(adapter, queries, chroma_dir, k=3, where=where)
+            assert [_ranked(h) for h in flat] == [_ranked(h) for h in chroma]
+            for flat_hits, chroma_hits in zip(flat, chroma):
+                assert all(abs(a[1] - b[1]) < 1e-3 for a, b in zip(flat_hits, chroma_hits))
+        assert flat[0][0][0].metadata["source"] == "chapter" and flat[0][0][0].metadata["offset"] == 0
+        before_reopen = [_ranked(h) for h in multi_query_similarity_search(adapter, queries, flat_dir, k=4)]
+
+        invalidate_vector_store_handle(flat_dir)
+        started = time.perf_counter()
+        reopened = load_vector_store(adapter, flat_dir)
+        open_seconds = time.perf_counter() - started
+        assert reopened is not store and reopened._collection.count() == 4
+        assert [_ranked(h) for h in multi_query_similarity_search(adapter, queries, flat_dir, k=4)] == before_reopen
+        assert open_seconds < 1.0, f"平面索引打开耗时 {open_seconds:.3f}s"
+        assert dedupe_vector_store(adapter, flat_dir) == 0
+        invalidate_vector_store_handle(flat_dir)
+    print("✅ 平面索引后端端到端正常")
+
+
+def test_collection_delete_compact_and_reload():
+    """删除为追加日志中的墓碑，压缩后文件只保留存活行，重开后状态一致"""
+    import numpy as np
+    from novel_generator import flat_vectorstore
+    from novel_generator.flat_vectorstore import FlatCollection
+
+    rng = np.random.default_rng(7)
+    vectors = rng.normal(size=(50, 16)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collection = FlatCollection(tmp_dir)
+        ids = [f"doc-{i}" for i in range(50)]
+        collection.upsert(ids, vectors, [f"文本{i}" for i in range(50)], [{"group": i % 5} for i in range(50)])
+        collection.upsert(["doc-0"], vectors[1:2], ["文本0-新"], [{"group": 9}])
+        assert collection.count() == 50
+
+        result = collection.query(vectors[7:9], n_results=3)
+        assert [ids[0] for ids in result["ids"]] == ["doc-7", "doc-8"]
+        assert result["distances"][0][0] < 1e-5 and result["distances"][0] == sorted(result["distances"][0])
+        filtered = collection.query(vectors[7:8], n_results=20, where={"group": {"$in": [1, 2]}})
+        assert len(filtered["ids"][0]) == 20 and all(m["group"] in (1, 2) for m in filtered["metadatas"][0])
+
+        original_min_dead = flat_vectorstore._COMPACT_MIN_DEAD
+        flat_vectorstore._COMPACT_MIN_DEAD = 10
+        try:
+            collection.delete(ids=[f"doc-{i}" for i in range(10, 40)])
+        finally:
+            flat_vectorstore._COMPACT_MIN_DEAD = original_min_dead
+        assert collection.count() == 20 and collection._rows == 20
+        collection.delete(where={"group": 9})
+        collection.update(["doc-1"], [{"group": 7}])
+        collection.close()
+
+        reloaded = FlatCollection(tmp_dir)
+        assert reloaded.count() == 19
+        assert reloaded.get(ids=["doc-1"])["metadatas"] == [{"group": 7}]
+        assert reloaded.get(ids=["doc-0"])["ids"] == []
+        assert reloaded.query(vectors[45:46], n_results=1)["ids"] == [["doc-45"]]
+        reloaded.close()
+    print("✅ 删除、压缩与重开正常")
+
+
+def test_log_failure_and_compact_release():
+    """日志写入失败时内存状态不变（与磁盘一致）；压缩前关闭旧内存映射，压缩中途的临时目录不残留"""
+    import numpy as np
+    from novel_generator import flat_vectorstore
+    from novel_generator.flat_vectorstore import FlatCollection
+
+    rng = np.random.default_rng(3)
+    vectors = rng.normal(size=(40, 8)).astype(np.float32)
+    ids = [f"doc-{i}" for i in range(40)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collection = FlatCollection(tmp_dir, "int8")
+        collection.upsert(ids[:20], vectors[:20])
+
+        def broken_log(entries):
+            raise OSError("disk full")
+
+        collection._append_log = broken_log
+        for action in (lambda: collection.upsert(ids[20:], vectors[20:]),
+                       lambda: collection.upsert(["doc-0"], vectors[39:40]),
+                       lambda: collection.update(["doc-1"], [{"group": 1}]),
+                       lambda: collection.delete(ids=["doc-2"])):
+            try:
+                action()
+                assert False, "日志写入失败应抛出"
+            except OSError:
+                pass
+        assert collection.count() == 20 and collection._rows == 20
+        assert collection.get(ids=["doc-1", "doc-2"])["metadatas"] == [{}, {}]
+        assert collection.query(vectors[:1], n_results=1)["ids"] == [["doc-0"]]
+        del collection._append_log
+        collection.upsert(ids[20:], vectors[20:])
+        assert collection.count() == 40 and collection._rows == 40
+
+        old_vectors, old_scales = collection._matrix, collection._scales
+        original_min_dead = flat_vectorstore._COMPACT_MIN_DEAD
+        flat_vectorstore._COMPACT_MIN_DEAD = 10
+        try:
+            collection.delete(ids=ids[:25])
+        finally:
+            flat_vectorstore._COMPACT_MIN_DEAD = original_min_dead
+        assert old_vectors._mmap.closed and old_scales._mmap.closed
+        del old_vectors, old_scales
+        assert collection._rows == 15 and collection.count() == 15
+        assert sorted(os.listdir(tmp_dir)) == ["flat_meta.jsonl", "flat_scales.npy", "flat_vectors.npy"]
+        assert collection.query(vectors[30:31], n_results=1)["ids"] == [["doc-30"]]
+        collection.close()
+
+        reloaded = FlatCollection(tmp_dir)
+        assert reloaded.count() == 15 and reloaded.get(ids=["doc-0"])["ids"] == []
+        reloaded.close()
+    print("✅ 日志失败与压缩释放映射正常")
+
+
+def test_quantized_rows():
+    """float16 / int8 行按量化精度落盘（int8 带逐行缩放系数），打分时反量化，排序与 float32 一致；压缩与重开后精度不变"""
+    import numpy as np
+    from novel_generator import flat_vectorstore
+    from novel_generator.flat_vectorstore import FlatCollection, FLAT_VECTORS_FILENAME, FLAT_SCALES_FILENAME
+    from novel_generator.vectorstore_utils import update_vector_store, load_vector_store, get_vectorstore_dir, \
+        invalidate_vector_store_handle
+
+    rng = np.random.default_rng(11)
+    vectors = rng.normal(size=(200, 64)).astype(np.float32)
+    queries = vectors[:5] + rng.normal(scale=0.3, size=(5, 64)).astype(np.float32)
+    ids = [f"doc-{i}" for i in range(200)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = {}
+        for dtype in ("float32", "float16", "int8"):
+            directory = os.path.join(tmp_dir, dtype)
+            collection = FlatCollection(directory, dtype)
+            collection.upsert(ids, vectors * rng.uniform(0.5, 3.0, size=(200, 1)), metadatas=[{"i": i} for i in range(200)])
+            results[dtype] = collection.query(queries, n_results=10)
+            collection.close()
+            stored = np.load(os.path.join(directory, FLAT_VECTORS_FILENAME), mmap_mode="r")
+            assert stored.dtype.name == dtype
+            assert os.path.exists(os.path.join(directory, FLAT_SCALES_FILENAME)) == (dtype == "int8")
+
+        for dtype in ("float16", "int8"):
+            assert [r[:5] for r in results[dtype]["ids"]] == [r[:5] for r in results["float32"]["ids"]]
+            errors = np.abs(np.array(results[dtype]["distances"]) - np.array(results["float32"]["distances"]))
+            assert errors.max() < (2e-3 if dtype == "float16" else 2e-2), f"{dtype} 距离误差 {errors.max():.4f}"
+
+        directory = os.path.join(tmp_dir, "int8")
+        reloaded = FlatCollection(directory, "float32")  # 已有文件沿用其精度
+        assert reloaded.dtype == "int8"
+        expected = reloaded.query(queries, n_results=5, where={"i": {"$lt": 90}})
+        original_min_dead = flat_vectorstore._COMPACT_MIN_DEAD
+        flat_vectorstore._COMPACT_MIN_DEAD = 10
+        try:
+            reloaded.delete(ids=ids[90:])
+        finally:
+            flat_vectorstore._COMPACT_MIN_DEAD = original_min_dead
+        assert reloaded._rows == 90 and reloaded.dtype == "int8"
+        compacted = reloaded.query(queries, n_results=5)
+        assert compacted["ids"] == expected["ids"]
+        assert np.allclose(compacted["distances"], expected["distances"], atol=1e-6)
+        reloaded.close()
+
+        project = os.path.join(tmp_dir, "project")
+        os.makedirs(project)
+        with open(os.path.join(project, "novel_config.json"), "w", encoding="utf-8") as f:
+            json.dump({"vectorstore_backend": "flat", "vectorstore_dtype": "int8"}, f)
+        adapter = LocalEmbeddingAdapter("local-ngram-64")
+        update_vector_store(adapter, CHAPTERS[1], project, chapter_number=1)
+        assert load_vector_store(adapter, project)._collection.dtype == "int8"
+        invalidate_vector_store_handle(project)
+        stored = np.load(os.path.join(get_vectorstore_dir(project), FLAT_VECTORS_FILENAME), mmap_mode="r")
+        assert stored.dtype.name == "int8"
+        del stored
+    print("✅ 量化存储正常")
+
+
+def test_backend_switch_guard():
+    """已有数据的项目不能直接切换后端；清空后可以"""
+    from novel_generator.vectorstore_utils import (
+        configure_vector_store_backend, update_vector_store, clear_vector_store, get_vector_store_backend
+    )
+
+    adapter = LocalEmbeddingAdapter("local-ngram-64")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        assert configure_vector_store_backend("flat", tmp_dir)
+        update_vector_store(adapter, "第一章：雨夜来信。", tmp_dir, chapter_number=1)
+        assert get_vector_store_backend(tmp_dir) == "flat"
+        assert configure_vector_store_backend("chroma", tmp_dir) is False
+        assert clear_vector_store(tmp_dir)
+        assert get_vector_store_backend(tmp_dir) == "flat"
+        assert configure_vector_store_backend("chroma", tmp_dir)
+        assert get_vector_store_backend(tmp_dir) == "chroma"
+        try:
+            configure_vector_store_backend("faiss")
+            assert False, "未知后端应抛出 ValueError"
+        except ValueError:
+            pass
+    print("✅ 后端切换保护正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试平面向量索引后端")
+    print("=" * 50)
+    try:
+        test_flat_backend_end_to_end()
+        test_collection_delete_compact_and_reload()
+        test_log_failure_and_compact_release()
+        test_quantized_rows()
+        test_backend_switch_guard()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试多服务商对冲路由（延迟后发出对冲请求、延迟样本、429/5xx 故障转移、取消落后的请求、通过配置启用）
+"""
+
+import sys
+import os
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _provider(server, api_key, interface_format="OpenAI"):
+    return {
+        "interface_format": interface_format,
+        "base_url": server.openai_base_url,
+        "model_name": "mock-model",
+        "api_key": api_key,
+        "temperature": 0.7,
+        "max_tokens": 256,
+        "timeout": 10
+    }
+
+
+def test_hedge_fires_after_delay():
+    """主服务商超过对冲等待时间未返回时向备用服务商发出对冲请求，取先返回的结果"""
+    from mock_llm_server import MockLLMServer
+    from llm_adapters import HedgedRoutingAdapter
+
+    with MockLLMServer(latency=1.5, responses=["主服务商回复"]) as slow, \
+            MockLLMServer(responses=["备用服务商回复"]) as fast:
+        router = HedgedRoutingAdapter([_provider(slow, "hedge-primary"), _provider(fast, "hedge-fallback")],
+                                      initial_hedge_delay=0.2, min_hedge_delay=0.1)
+        started = time.perf_counter()
+        assert router.invoke("你好") == "备用服务商回复"
+        elapsed = time.perf_counter() - started
+        assert 0.2 <= elapsed < 1.0, f"对冲耗时 {elapsed:.2f}s"
+        assert router.stats()["hedges_sent"] == 1 and router.stats()["wins"] == [0, 1]
+        assert slow.stats()["by_endpoint"]["openai_chat"] == 1 and fast.stats()["by_endpoint"]["openai_chat"] == 1
+    print("✅ 对冲请求正常")
+
+
+def test_losing_request_cancelled():
+    """胜出后落后的请求被取消：限流器槽位立即释放，不计为成功"""
+    from mock_llm_server import MockLLMServer
+    from llm_adapters import HedgedRoutingAdapter
+
+    with MockLLMServer(latency=3.0) as slow, MockLLMServer(responses=["备用服务商回复"]) as fast:
+        router = HedgedRoutingAdapter([_provider(slow, "cancel-primary"), _provider(fast, "cancel-fallback")],
+                                      initial_hedge_delay=0.1, min_hedge_delay=0.1)
+        primary_limiter = router.adapters[0].rate_limiter
+        started = time.perf_counter()
+        assert router.invoke("你好") == "备用服务商回复"
+        assert time.perf_counter() - started < 1.0
+        stats = primary_limiter.stats()
+        assert stats["in_flight"] == 0 and stats["successes"] == 0
+        assert router.adapters[1].rate_limiter.stats()["successes"] == 1
+    print("✅ 落后请求取消正常")
+
+
+def test_latency_samples_and_per_provider_delay():
+    """被取消的慢请求也计入延迟样本（作为下界）；后续各路按各自服务商的延迟分布决定对冲时间"""
+    from mock_llm_server import MockLLMServer
+    from llm_adapters import HedgedRoutingAdapter
+
+    with MockLLMServer(latency=2.0) as slow, MockLLMServer(latency=2.0) as slower, \
+            MockLLMServer(responses=["第三个服务商回复"]) as fast:
+        router = HedgedRoutingAdapter(
+            [_provider(slow, "samples-primary"), _provider(slower, "samples-second"), _provider(fast, "samples-third")],
+            initial_hedge_delay=0.4, min_hedge_delay=0.05, min_samples=3
+        )
+        router._latencies[1].extend([0.05] * 3)  # 第二个服务商历史上很快返回
+        started = time.perf_counter()
+        assert router.invoke("你好") == "第三个服务商回复"
+        elapsed = time.perf_counter() - started
+        assert 0.4 <= elapsed < 0.7, f"第二路应按自身延迟 0.05s 后对冲，实际耗时 {elapsed:.2f}s"
+        assert router.stats()["hedges_sent"] == 2 and router.stats()["wins"] == [0, 0, 1]
+        assert len(router._latencies[0]) == 1 and router._latencies[0][0] >= 0.4
+        assert len(router._latencies[1]) == 4 and router._latencies[1][-1] >= 0.05
+        assert router.stats()["hedge_delays"][1] >= 0.05
+    print("✅ 延迟样本与分服务商对冲时间正常")
+
+
+def test_failover_on_429_and_5xx():
+    """429 / 5xx 立即转移到下一个服务商（不等待对冲延迟），429 经限流器反馈给该服务商"""
+    from mock_llm_server import MockLLMServer
+    from llm_adapters import HedgedRoutingAdapter
+
+    with MockLLMServer(retry_after=0.05) as primary, \
+            MockLLMServer(responder=lambda prompt, model: "备用服务商回复") as fallback:
+        router = HedgedRoutingAdapter([_provider(primary, "failover-primary"), _provider(fallback, "failover-fallback")],
+                                      initial_hedge_delay=5.0)
+        primary_limiter = router.adapters[0].rate_limiter
+        for status in (429, 503, 500):
+            primary.fail_next(status)
+            started = time.perf_counter()
+            assert router.invoke("你好") == "备用服务商回复"
+            assert time.perf_counter() - started < 1.0
+        assert router.stats()["failovers"] == 3 and router.stats()["hedges_sent"] == 0
+        assert primary_limiter.stats()["throttles"] == 2  # 429 与 503 视为限流
+
+        primary.fail_next(429)
+        fallback.fail_next(500)
+        try:
+            router.invoke("你好")
+            assert False, "所有服务商都失败时应抛出最后一个错误"
+        except AssertionError:
+            raise
+        except Exception as e:
+            assert getattr(e, "status_code", None) == 500
+    print("✅ 故障转移正常")
+
+
+def test_routing_from_config():
+    """config.json 的 llm_routing 启用后 create_llm_adapter 返回缓存的路由适配器，经 invoke_with_cleaning 正常工作"""
+    from mock_llm_server import MockLLMServer
+    from config_manager import apply_llm_routing_config
+    from llm_adapters import create_llm_adapter, configure_llm_routing, HedgedRoutingAdapter, OpenAIAdapter
+    from novel_generator.common import invoke_with_cleaning
+
+    with MockLLMServer(retry_after=0.05) as primary, \
+            MockLLMServer(responder=lambda prompt, model: "备用服务商回复") as fallback:
+        config = {
+            "llm_configs": {
+                "OpenAI": {"api_key": "config-primary", "base_url": primary.openai_base_url, "model_name": "mock-model"},
+                "DeepSeek": {"api_key": "config-fallback", "base_url": fallback.openai_base_url, "model_name": "mock-model"}
+            },
+            "llm_routing": {"fallbacks": ["DeepSeek", "Gemini"], "initial_hedge_delay": 5.0}
+        }
+        try:
+            assert apply_llm_routing_config(config)
+            args = ("OpenAI", primary.openai_base_url, "mock-model", "config-primary", 0.7, 256, 10)
+            router = create_llm_adapter(*args)
+            assert isinstance(router, HedgedRoutingAdapter) and create_llm_adapter(*args) is router
+            assert len(router.adapters) == 2 and router.rate_limiter is None
+            assert router.initial_hedge_delay == 5.0
+            assert isinstance(create_llm_adapter(*args, routing=False), OpenAIAdapter)
+
+            primary.fail_next(429)
+            assert invoke_with_cleaning(router, "你好") == "备用服务商回复"
+            assert router.stats()["failovers"] == 1
+
+            # 备用服务商就是主服务商自己时不做路由
+            fallback_args = ("DeepSeek", fallback.openai_base_url, "mock-model", "config-fallback", 0.7, 256, 10)
+            assert not isinstance(create_llm_adapter(*fallback_args), HedgedRoutingAdapter)
+
+            config["llm_routing"]["enabled"] = False
+            assert not apply_llm_routing_config(config)
+            assert isinstance(create_llm_adapter(*args), OpenAIAdapter)
+        finally:
+            configure_llm_routing(enabled=False)
+    print("✅ 配置启用路由正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试多服务商对冲路由")
+    print("=" * 50)
+    try:
+        test_hedge_fires_after_delay()
+        test_losing_request_cancelled()
+        test_latency_samples_and_per_provider_delay()
+        test_failover_on_429_and_5xx()
+        test_routing_from_config()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
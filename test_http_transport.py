@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试共享 HTTP 连接池的长连接复用、按配置调整池大小（缓存的适配器失效、异步客户端在所属事件循环上关闭）
+"""
+
+import sys
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_session_reuse():
+    """同一 host 的多次请求应复用同一个连接"""
+    from http_transport import get_http_session, get_http_pool_stats, close_all_http_clients
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _EchoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        close_all_http_clients()
+        session = get_http_session(base_url + "/api/embeddings")
+        assert session is get_http_session(base_url + "/v1/embeddings")
+        for _ in range(5):
+            resp = session.post(base_url + "/api/embeddings", json={"prompt": "测试"})
+            assert resp.status_code == 200
+
+        stats = get_http_pool_stats()[base_url]
+        print(f"📊 连接池统计: {stats}")
+        assert stats["requests"] == 5
+        assert stats["connections"] == 1
+        assert stats["reused"] == 4
+        print("✅ 长连接复用正常")
+    finally:
+        close_all_http_clients()
+        server.shutdown()
+        server.server_close()
+
+
+def test_reconfigure_pool():
+    """config.json 的 http_pool 变化时重建连接池：缓存的适配器被丢弃，新适配器可用，异步客户端被关闭"""
+    import time
+    from mock_llm_server import MockLLMServer
+    from config_manager import apply_http_pool_config
+    from http_transport import get_async_httpx_client, get_http_pool_settings, configure_http_pool
+    from llm_adapters import create_llm_adapter
+    from utils import run_coroutine_sync
+
+    defaults = get_http_pool_settings()
+    with MockLLMServer(responses=["第一次", "第二次", "第三次"]) as server:
+        args = ("OpenAI", server.openai_base_url, "mock-model", "sk-pool", 0.7, 256, 10)
+        try:
+            adapter = create_llm_adapter(*args)
+            assert adapter.invoke("你好") == "第一次"
+            assert run_coroutine_sync(adapter.ainvoke("你好")) == "第二次"
+
+            async def _async_client():
+                return get_async_httpx_client(server.openai_base_url)
+            async_client = run_coroutine_sync(_async_client())
+
+            config = {"http_pool": {"pool_connections": 4, "pool_maxsize": "8", "keepalive_expiry": 30}}
+            assert apply_http_pool_config(config)
+            assert get_http_pool_settings() == {"pool_connections": 4, "pool_maxsize": 8, "keepalive_expiry": 30.0}
+            assert not apply_http_pool_config(config), "参数未变化时不应重建连接池"
+            assert not apply_http_pool_config({"http_pool": {"pool_maxsize": "很多"}})
+
+            rebuilt = create_llm_adapter(*args)
+            assert rebuilt is not adapter
+            assert rebuilt.invoke("你好") == "第三次"
+            deadline = time.monotonic() + 2.0
+            while not async_client.is_closed and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert async_client.is_closed, "异步客户端应在其事件循环上关闭"
+        finally:
+            configure_http_pool(**defaults)
+    print("✅ 连接池重新配置正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试共享 HTTP 连接池")
+    print("=" * 50)
+    try:
+        test_session_reuse()
+        test_reconfigure_pool()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
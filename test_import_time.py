@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入耗时回归测试：import novel_generator 不应加载各家 SDK 与 NLP/向量库，且耗时在预算内
+"""
+
+import sys
+import os
+import json
+import subprocess
+
+# 添加项目根目录到Python路径
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_ROOT)
+
+# 可通过环境变量放宽预算（如在较慢的 CI 机器上）
+IMPORT_BUDGET_SECONDS = float(os.environ.get("NOVEL_IMPORT_BUDGET", "1.5"))
+
+HEAVY_MODULES = [
+    "langchain_openai",
+    "openai",
+    "google.genai",
+    "azure.ai.inference",
+    "nltk",
+    "chromadb",
+    "langchain_chroma",
+    "sklearn",
+]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import novel_generator, llm_adapters, embedding_adapters
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def _probe_import():
+    """在全新的解释器中测量导入耗时，避免受当前进程已加载模块的影响"""
+    output = subprocess.check_output([sys.executable, "-c", _PROBE], cwd=PROJECT_ROOT, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_no_heavy_modules_on_import():
+    """导入生成流程时不应加载 SDK 与 NLP/向量库"""
+    result = _probe_import()
+    assert not result["loaded"], f"导入时加载了重量级模块: {result['loaded']}"
+    print("✅ 未加载重量级模块")
+
+
+def test_import_time_budget():
+    """导入耗时不超过预算（取三次中的最小值以降低抖动）"""
+    elapsed = min(_probe_import()["elapsed"] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET_SECONDS, f"import novel_generator 耗时 {elapsed:.2f}s，超过预算 {IMPORT_BUDGET_SECONDS}s"
+    print(f"✅ 导入耗时 {elapsed:.2f}s（预算 {IMPORT_BUDGET_SECONDS}s）")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试导入耗时")
+    print("=" * 50)
+    try:
+        test_no_heavy_modules_on_import()
+        test_import_time_budget()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 LLM 响应持久化缓存（命中、LRU 淘汰、TTL、按阶段启用、按服务商区分、config.json 配置）
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+class _CountingAdapter:
+    """记录调用次数的假适配器"""
+    model_name = "fake-model"
+    temperature = 0.7
+    max_tokens = 1024
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt: str) -> str:
+        self.calls += 1
+        return f"```回复:{prompt}```"
+
+
+def test_cache_hit_and_stage_flags():
+    """相同提示词第二次调用应直接命中缓存，draft 阶段默认不缓存"""
+    from novel_generator.llm_cache import configure_llm_cache
+    from novel_generator.common import invoke_with_cleaning
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = configure_llm_cache(os.path.join(tmp_dir, "llm_cache.sqlite"))
+        try:
+            adapter = _CountingAdapter()
+            first = invoke_with_cleaning(adapter, "核心种子", stage="core_seed")
+            second = invoke_with_cleaning(adapter, "核心种子", stage="core_seed")
+            assert first == second == "回复:核心种子"
+            assert adapter.calls == 1
+
+            invoke_with_cleaning(adapter, "草稿", stage="draft")
+            invoke_with_cleaning(adapter, "草稿", stage="draft")
+            assert adapter.calls == 3
+            assert cache.stats()["hits"] == 1
+            print("✅ 缓存命中与阶段开关正常")
+        finally:
+            configure_llm_cache(None)
+
+
+def test_cache_eviction_and_ttl():
+    """超过条目上限时淘汰最久未访问的条目，过期条目不再命中"""
+    from novel_generator.llm_cache import LLMResponseCache
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = LLMResponseCache(os.path.join(tmp_dir, "llm_cache.sqlite"), max_entries=2)
+        adapter = _CountingAdapter()
+        cache.put(adapter, "a", "A")
+        cache.put(adapter, "b", "B")
+        assert cache.get(adapter, "a") == "A"  # 访问 a，使 b 成为最久未访问
+        cache.put(adapter, "c", "C")
+        assert cache.get(adapter, "b") is None
+        assert cache.get(adapter, "a") == "A"
+        assert cache.get(adapter, "c") == "C"
+
+        cache.ttl_seconds = -1  # 所有条目立即过期
+        assert cache.get(adapter, "a") is None
+        cache.close()
+        print("✅ LRU 淘汰与 TTL 正常")
+
+
+def test_key_separates_providers_and_config():
+    """同名模型挂在不同服务商或 base_url 下不互相命中；config.json 的 llm_cache 段可启用/关闭缓存"""
+    from llm_adapters import create_llm_adapter
+    from novel_generator.llm_cache import LLMResponseCache, get_llm_cache
+    from config_manager import apply_llm_cache_config
+
+    def adapter(fmt, url):
+        return create_llm_adapter(fmt, url, "same-model", "sk-cache", 0.7, 256, 10, routing=False)
+
+    keys = {
+        LLMResponseCache.make_key(adapter("OpenAI", "http://127.0.0.1:9001/v1"), "提示词"),
+        LLMResponseCache.make_key(adapter("OpenAI", "http://127.0.0.1:9002/v1"), "提示词"),
+        LLMResponseCache.make_key(adapter("阿里云百炼", "http://127.0.0.1:9001/v1"), "提示词"),
+    }
+    assert len(keys) == 3, "不同 base_url / interface_format 的缓存键应不同"
+    assert LLMResponseCache.make_key(adapter("OpenAI", "http://127.0.0.1:9001/v1"), "提示词") in keys
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config = {"llm_cache": {"path": os.path.join(tmp_dir, "cache.sqlite"), "max_entries": "10", "ttl_seconds": 60}}
+        try:
+            assert apply_llm_cache_config(config)
+            cache = get_llm_cache()
+            assert cache.max_entries == 10 and cache.ttl_seconds == 60.0
+            assert apply_llm_cache_config(config) and get_llm_cache() is cache, "配置未变化时应复用现有缓存"
+            assert not apply_llm_cache_config({})
+            assert get_llm_cache() is cache, "没有 llm_cache 配置段时保持现状"
+            assert not apply_llm_cache_config({"llm_cache": {"enabled": False}})
+            assert get_llm_cache() is None
+        finally:
+            apply_llm_cache_config({"llm_cache": {"enabled": False}})
+    print("✅ 缓存键按服务商区分、配置启用正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试 LLM 响应缓存")
+    print("=" * 50)
+    try:
+        test_cache_hit_and_stage_flags()
+        test_cache_eviction_and_ttl()
+        test_key_separates_providers_and_config()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试异步 LLM 日志（队列写出、摘要截断、采样、级别、完整转录、异步与流式调用路径）
+"""
+
+import sys
+import os
+import io
+import json
+import tempfile
+import contextlib
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+class EchoAdapter:
+    model_name = "echo"
+
+    def invoke(self, prompt):
+        return "好的。" + "回" * 3000
+
+
+def test_excerpt():
+    """摘要保留首尾并标出省略的字符数"""
+    from llm_logging import make_excerpt
+
+    text = "开头" + "中" * 1000 + "结尾"
+    excerpt = make_excerpt(text, 30)
+    assert excerpt.startswith("开头") and excerpt.endswith("结尾") and "省略 974 字符" in excerpt
+    assert make_excerpt("短文本", 30) == "短文本"
+    print("✅ 摘要截断正常")
+
+
+def test_invoke_logs_excerpts_off_hot_path():
+    """invoke_with_cleaning 不再同步打印完整提示词；控制台为摘要，转录文件为全文"""
+    from llm_logging import configure_llm_logging, flush_llm_logging
+    from novel_generator.common import invoke_with_cleaning
+
+    console = io.StringIO()
+    prompt = "请根据以下设定创作：" + "设" * 20000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        transcript_path = os.path.join(tmp_dir, "transcript.jsonl")
+        try:
+            configure_llm_logging(level="INFO", excerpt_chars=200, sample_rate=1.0,
+                                  transcript_path=transcript_path, stream=console)
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                assert invoke_with_cleaning(EchoAdapter(), prompt, stage="core_seed")
+            assert "设" * 300 not in stdout.getvalue()
+
+            flush_llm_logging()
+            output = console.getvalue()
+            assert "[core_seed] 发送到 LLM 的提示词（20010 字符）" in output
+            assert "[core_seed] LLM 返回的内容" in output
+            assert len(output) < 1000
+
+            configure_llm_logging(sample_rate=0.0)
+            invoke_with_cleaning(EchoAdapter(), "第二次调用", stage="blueprint")
+            flush_llm_logging()
+            assert "blueprint" not in console.getvalue()
+        finally:
+            configure_llm_logging(level="INFO", excerpt_chars=500, sample_rate=1.0, transcript_path="", stream=sys.stdout)
+
+        with open(transcript_path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+    assert [(r["stage"], r["kind"]) for r in records] == [
+        ("core_seed", "prompt"), ("core_seed", "response"), ("blueprint", "prompt"), ("blueprint", "response")
+    ]
+    assert records[0]["text"] == prompt and records[0]["source"] == "invoke_with_cleaning"
+    print("✅ 队列日志、采样与转录正常")
+
+
+def test_async_and_stream_paths_logged():
+    """ainvoke_with_cleaning 与 stream_with_cleaning 走同一套日志；Gemini embedding 不再向 stdout 打印响应"""
+    from llm_logging import configure_llm_logging, flush_llm_logging
+    from novel_generator.common import ainvoke_with_cleaning, stream_with_cleaning
+    from mock_llm_server import MockLLMServer
+    from embedding_adapters import GeminiEmbeddingAdapter
+    from utils import run_coroutine_sync
+
+    class StreamEchoAdapter(EchoAdapter):
+        async def ainvoke(self, prompt):
+            return self.invoke(prompt)
+
+        def stream(self, prompt):
+            yield "流式"
+            yield "回复"
+
+    console = io.StringIO()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        transcript_path = os.path.join(tmp_dir, "transcript.jsonl")
+        try:
+            configure_llm_logging(level="INFO", excerpt_chars=200, sample_rate=1.0,
+                                  transcript_path=transcript_path, stream=console)
+            assert run_coroutine_sync(ainvoke_with_cleaning(StreamEchoAdapter(), "异步提示词", stage="summary"))
+            assert "".join(stream_with_cleaning(StreamEchoAdapter(), "流式提示词", stage="draft")) == "流式回复"
+            flush_llm_logging()
+            assert "[summary] 发送到 LLM 的提示词" in console.getvalue()
+            assert "[draft] LLM 返回的内容（4 字符）" in console.getvalue()
+        finally:
+            configure_llm_logging(level="INFO", excerpt_chars=500, sample_rate=1.0, transcript_path="", stream=sys.stdout)
+
+        with open(transcript_path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+    assert [(r["stage"], r["kind"], r["source"]) for r in records] == [
+        ("summary", "prompt", "ainvoke_with_cleaning"), ("summary", "response", "ainvoke_with_cleaning"),
+        ("draft", "prompt", "stream_with_cleaning"), ("draft", "response", "stream_with_cleaning")
+    ]
+    assert records[3]["text"] == "流式回复"
+
+    with MockLLMServer() as server:
+        adapter = GeminiEmbeddingAdapter("gm-key", "text-embedding-004", server.gemini_base_url)
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            assert adapter._embed_single("林默推开旧宅的门。")
+        assert stdout.getvalue() == ""
+    print("✅ 异步与流式调用日志正常")
+
+
+def test_level_disables_console():
+    """级别高于 INFO 且未启用转录时不入队"""
+    from llm_logging import configure_llm_logging, log_llm_text, flush_llm_logging, PROMPT
+    import llm_logging
+
+    console = io.StringIO()
+    try:
+        configure_llm_logging(level="WARNING", stream=console)
+        assert not llm_logging._logger.isEnabledFor(20)
+        log_llm_text(PROMPT, "不会输出", stage="draft")
+        flush_llm_logging()
+        assert console.getvalue() == ""
+    finally:
+        configure_llm_logging(level="INFO", stream=sys.stdout)
+    print("✅ 日志级别控制正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试异步 LLM 日志")
+    print("=" * 50)
+    try:
+        test_excerpt()
+        test_invoke_logs_excerpts_off_hot_path()
+        test_async_and_stream_paths_logged()
+        test_level_disables_console()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
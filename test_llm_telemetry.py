@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 LLM 调用遥测台账（逐次调用记录、重试计数、缓存命中、轮转与按阶段 p50/p95 汇总）
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+class FlakyAdapter:
+    """前 empty_times 次返回空字符串的假适配器"""
+    model_name = "deepseek-chat"
+
+    def __init__(self, empty_times=0):
+        self.empty_times = empty_times
+
+    def invoke(self, prompt):
+        if self.empty_times > 0:
+            self.empty_times -= 1
+            return ""
+        return f"回复：{prompt}"
+
+    def stream(self, prompt):
+        yield "流式"
+        yield "回复"
+
+
+def test_ledger_records_calls():
+    """invoke / stream / 缓存命中均被记录，重试次数与结果正确"""
+    from novel_generator.common import invoke_with_cleaning, stream_with_cleaning
+    from llm_telemetry import configure_llm_telemetry, read_ledger
+    from novel_generator.llm_cache import configure_llm_cache
+    from retry_policy import RetryPolicy, get_default_retry_policy, set_default_retry_policy
+
+    original = get_default_retry_policy()
+    set_default_retry_policy(RetryPolicy(base_delay=0.001, max_delay=0.002))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ledger_path = os.path.join(tmp_dir, "llm_calls.jsonl")
+        try:
+            configure_llm_telemetry(ledger_path)
+            configure_llm_cache(os.path.join(tmp_dir, "cache.sqlite"))
+            assert invoke_with_cleaning(FlakyAdapter(empty_times=2), "核心种子", stage="core_seed")
+            assert invoke_with_cleaning(FlakyAdapter(), "核心种子", stage="core_seed")
+            assert "".join(stream_with_cleaning(FlakyAdapter(), "正文", stage="draft")) == "流式回复"
+        finally:
+            configure_llm_cache(None)
+            configure_llm_telemetry(None)
+            set_default_retry_policy(original)
+
+        first, cached, streamed = read_ledger(ledger_path)
+    assert (first["stage"], first["attempts"], first["retries"], first["outcome"]) == ("core_seed", 3, 2, "ok")
+    assert first["provider"] == "FlakyAdapter" and first["model"] == "deepseek-chat"
+    assert first["prompt_chars"] == 4 and first["prompt_tokens"] > 0 and first["latency_ms"] >= 0
+    assert cached["outcome"] == "cache_hit" and cached["attempts"] == 0
+    assert streamed["mode"] == "stream" and "ttft_ms" in streamed and streamed["response_chars"] == 4
+    print("✅ 调用记录正常")
+
+
+def test_rotation_and_summary():
+    """台账轮转后仍可完整读取，按阶段计算 p50/p95"""
+    from llm_telemetry import LLMTelemetryLedger, read_ledger, summarize_ledger, format_summary
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "llm_calls.jsonl")
+        ledger = LLMTelemetryLedger(path, max_bytes=300, backup_count=20)
+        for latency in range(1, 21):
+            ledger.record({"stage": "draft", "latency_ms": float(latency * 10), "retries": latency % 2, "outcome": "ok"})
+        ledger.record({"stage": "blueprint", "latency_ms": 5.0, "outcome": "cache_hit"})
+        ledger.close()
+        assert os.path.exists(path + ".1")
+        records = read_ledger(path)
+    assert len(records) == 21 and records[0]["latency_ms"] == 10.0
+
+    summary = summarize_ledger(records)
+    assert summary["draft"]["calls"] == 20 and summary["draft"]["retries"] == 10
+    assert summary["draft"]["p50_ms"] == 105.0 and summary["draft"]["p95_ms"] == 190.5
+    assert summary["blueprint"]["cache_hits"] == 1 and summary["blueprint"]["p50_ms"] == 0.0
+    assert "draft" in format_summary(summary)
+    print("✅ 轮转与汇总正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试 LLM 调用遥测")
+    print("=" * 50)
+    try:
+        test_ledger_records_calls()
+        test_rotation_and_summary()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
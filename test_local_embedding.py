@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试离线本地 embedding（字符 n-gram 特征哈希，无需任何服务）
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_local_vectors():
+    """向量维度取自模型名、结果确定且已归一化，相近文本相似度更高"""
+    from embedding_adapters import create_embedding_adapter, LocalEmbeddingAdapter
+
+    adapter = create_embedding_adapter("Local", "", "", "local-ngram-128")
+    assert isinstance(adapter, LocalEmbeddingAdapter) and adapter.dim == 128
+    a, b, c, empty = adapter.embed_documents(["林默在雨夜收到一封来信", "林默收到来信", "The old house on the hill", ""])
+    assert len(a) == 128 and a == adapter.embed_query("林默在雨夜收到一封来信")
+    assert abs(sum(x * x for x in a) - 1.0) < 1e-9
+    assert sum(x * y for x, y in zip(a, b)) > sum(x * y for x, y in zip(a, c))
+    assert empty == [0.0] * 128
+    assert LocalEmbeddingAdapter("local-ngram-128").embed_query("The OLD house") == adapter.embed_query("the old House")
+    print("✅ 本地向量正常")
+
+
+def test_dimension_validation():
+    """模型名末尾的数字过小（如 bge-m3）时不作为维度；显式 dim 优先，维度与模型名不符时模型标识不同"""
+    from embedding_adapters import LocalEmbeddingAdapter
+    from novel_generator.embedding_cache import get_embedding_model_id
+
+    adapter = LocalEmbeddingAdapter("bge-m3")
+    assert adapter.dim == LocalEmbeddingAdapter.DEFAULT_DIM and len(adapter.embed_query("林默")) == adapter.dim
+    assert get_embedding_model_id(adapter) != "LocalEmbeddingAdapter:bge-m3", "不应与按末尾数字取 3 维的旧向量库混用"
+
+    explicit = LocalEmbeddingAdapter("bge-m3", dim=256)
+    assert explicit.dim == 256 and get_embedding_model_id(explicit) != get_embedding_model_id(adapter)
+    named = LocalEmbeddingAdapter("local-ngram-64")
+    assert named.dim == 64 and get_embedding_model_id(named) == "LocalEmbeddingAdapter:local-ngram-64"
+    try:
+        LocalEmbeddingAdapter("local", dim=4)
+        assert False, "显式指定过小的维度应报错"
+    except ValueError:
+        pass
+    print("✅ 本地向量维度校验正常")
+
+
+def test_local_retrieval():
+    """本地 embedding 可直接用于向量库写入与检索"""
+    from embedding_adapters import create_embedding_adapter
+    from novel_generator.vectorstore_utils import init_vector_store, get_relevant_context_from_vector_store
+
+    adapter = create_embedding_adapter("Local", "", "", "local-ngram-256")
+    texts = ["林默推开旧宅的门，灰尘在月光里浮动。", "港口的货轮鸣笛，苏晴在码头清点货物。", "实验室的警报响起，基因样本不翼而飞。"]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        assert init_vector_store(adapter, texts, tmp_dir) is not None
+        context = get_relevant_context_from_vector_store(adapter, "码头 货物", tmp_dir, k=1)
+        assert context == texts[1]
+    print("✅ 本地检索正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试离线本地 embedding")
+    print("=" * 50)
+    try:
+        test_local_vectors()
+        test_dimension_validation()
+        test_local_retrieval()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
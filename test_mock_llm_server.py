@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试本地模拟 LLM 服务（OpenAI / Gemini 线路格式、流式输出、模板响应、故障注入）
+"""
+
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_openai_and_gemini_wire_formats():
+    """OpenAIAdapter 与 GeminiAdapter 可直接对接模拟服务，包括流式输出"""
+    from mock_llm_server import MockLLMServer
+    from llm_adapters import OpenAIAdapter, GeminiAdapter
+
+    with MockLLMServer(responses=["脚本化回复"], stream_chunk_chars=5) as server:
+        openai_adapter = OpenAIAdapter("k", server.openai_base_url, "mock-model", 1024, timeout=10)
+        assert openai_adapter.invoke("你好") == "脚本化回复"
+        chunks = list(openai_adapter.stream("请写一段300字的正文"))
+        assert len(chunks) > 1 and len("".join(chunks)) >= 300
+
+        gemini_adapter = GeminiAdapter("k", server.gemini_base_url, "gemini-mock", 1024, timeout=10)
+        assert "当前章节摘要" in gemini_adapter.invoke("请输出当前章节摘要")
+        assert len(list(gemini_adapter.stream("请写一段300字的正文"))) > 1
+
+        stats = server.stats()
+        assert stats["by_endpoint"]["openai_chat"] == 2
+        assert stats["by_endpoint"]["gemini_generate"] == 1
+        assert stats["by_endpoint"]["gemini_stream"] == 1
+    print("✅ OpenAI / Gemini 线路格式正常")
+
+
+def test_templated_blueprint():
+    """章节目录提示词返回可被解析的目录格式"""
+    from mock_llm_server import templated_response
+    from chapter_directory_parser import parse_chapter_blueprint
+
+    text = templated_response("现在请设计第3章到第5的节奏分布")
+    chapters = parse_chapter_blueprint(text)
+    assert [c["chapter_number"] for c in chapters] == [3, 4, 5]
+    print("✅ 模板化章节目录正常")
+
+
+def test_fault_injection_with_retry():
+    """注入的 429 由统一重试策略处理，超时请求在客户端超时后失败"""
+    from mock_llm_server import MockLLMServer
+    from llm_adapters import OpenAIAdapter
+    from novel_generator.common import invoke_with_cleaning
+    from retry_policy import RetryPolicy, get_default_retry_policy, set_default_retry_policy
+
+    original = get_default_retry_policy()
+    set_default_retry_policy(RetryPolicy(base_delay=0.01, max_delay=0.05))
+    try:
+        with MockLLMServer(retry_after=0.01, hang_seconds=5) as server:
+            adapter = OpenAIAdapter("k", server.openai_base_url, "mock-model", 1024, timeout=1)
+            server.fail_next(429, count=2)
+            assert invoke_with_cleaning(adapter, "你好")
+            assert server.stats()["rate_limited"] == 2
+
+            server.fail_next(None)
+            try:
+                adapter.invoke("你好")
+                assert False, "挂起的请求应超时"
+            except AssertionError:
+                raise
+            except Exception:
+                pass
+            assert server.stats()["timeouts"] == 1
+    finally:
+        set_default_retry_policy(original)
+    print("✅ 故障注入正常")
+
+
+def test_mock_embeddings():
+    """模拟 embedding 对相同文本返回相同向量"""
+    from mock_llm_server import MockLLMServer
+    from embedding_adapters import OllamaEmbeddingAdapter
+
+    with MockLLMServer(embedding_dim=32) as server:
+        adapter = OllamaEmbeddingAdapter("mock-embedding", f"{server.url}/api")
+        first, second = adapter.embed_documents(["雨夜来信", "雨夜来信"])
+        assert len(first) == 32 and first == second
+    print("✅ 模拟 embedding 正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试本地模拟 LLM 服务")
+    print("=" * 50)
+    try:
+        test_openai_and_gemini_wire_formats()
+        test_templated_blueprint()
+        test_fault_injection_with_retry()
+        test_mock_embeddings()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
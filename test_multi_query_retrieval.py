@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试多查询批量检索（所有关键词组一次批量向量化、一次向量查询，按组返回带分数的结果）
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_adapters import LocalEmbeddingAdapter
+
+
+class CountingAdapter(LocalEmbeddingAdapter):
+    """记录 embed_documents / embed_query 调用次数的本地适配器"""
+    def __init__(self, model_name):
+        super().__init__(model_name)
+        self.document_calls = []
+        self.query_calls = 0
+
+    def embed_documents(self, texts):
+        self.document_calls.append(list(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, query):
+        self.query_calls += 1
+        return super().embed_query(query)
+
+
+def test_one_round_trip_per_chapter():
+    """三个关键词组只发起一次批量向量化请求，结果与逐条检索一致"""
+    from novel_generator.embedding_cache import get_query_embedding_memo
+    from novel_generator.vectorstore_utils import (
+        init_vector_store, load_vector_store, multi_query_similarity_search, get_relevant_contexts_from_vector_store
+    )
+
+    texts = ["林默推开旧宅的门，灰尘扑面。", "苏晴在码头清点货物。", "港口起雾，汽笛声远。", "旧宅地下室藏着一封信。"]
+    queries = ["旧宅 门", "码头 货物", "港口 汽笛"]
+    get_query_embedding_memo().clear()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        adapter = CountingAdapter("local-ngram-96")
+        assert init_vector_store(adapter, texts, tmp_dir) is not None
+        adapter.document_calls.clear()
+
+        results = multi_query_similarity_search(adapter, queries, tmp_dir, k=2)
+        assert adapter.document_calls == [queries] and adapter.query_calls == 0
+        assert [len(hits) for hits in results] == [2, 2, 2]
+        for hits in results:
+            scores = [score for _, score in hits]
+            assert scores == sorted(scores)
+
+        store = load_vector_store(adapter, tmp_dir)
+        for query, hits in zip(queries, results):
+            expected = store.similarity_search_with_score(query, k=2)
+            assert [d.page_content for d, _ in hits] == [d.page_content for d, _ in expected]
+            assert abs(hits[0][1] - expected[0][1]) < 1e-4
+        assert results[1][0][0].page_content == "苏晴在码头清点货物。"
+
+        # 再次检索时已有查询命中 memo，只请求新查询
+        contexts = get_relevant_contexts_from_vector_store(adapter, queries + ["信"], tmp_dir, k=1)
+        assert len(adapter.document_calls) == 2 and adapter.document_calls[1] == ["信"]
+        assert contexts[0] == "林默推开旧宅的门，灰尘扑面。" and contexts[3] == "旧宅地下室藏着一封信。"
+        assert multi_query_similarity_search(adapter, [], tmp_dir) == []
+    print("✅ 批量检索正常")
+
+
+def test_failed_query_embedding_isolated():
+    """个别查询向量化失败时只有该组为空"""
+    from novel_generator.vectorstore_utils import init_vector_store, multi_query_similarity_search
+    from retry_policy import RetryPolicy, get_default_retry_policy, set_default_retry_policy
+
+    class PartialAdapter(LocalEmbeddingAdapter):
+        def embed_documents(self, texts):
+            return [[] if "失败" in t else vec for t, vec in zip(texts, super().embed_documents(texts))]
+
+    original = get_default_retry_policy()
+    set_default_retry_policy(RetryPolicy(base_delay=0.001, max_delay=0.002))
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            adapter = PartialAdapter("local-ngram-48")
+            assert init_vector_store(adapter, ["雨夜来信。", "晴天出海。"], tmp_dir)
+            results = multi_query_similarity_search(adapter, ["雨夜", "失败的查询"], tmp_dir, k=5)
+    finally:
+        set_default_retry_policy(original)
+    assert len(results[0]) == 2 and results[1] == []
+    print("✅ 失败查询隔离正常")
+
+
+def test_query_semantics_preserved():
+    """查询与文档向量化方式不同的 provider：批量查询走查询语义，memo 中只存查询向量"""
+    from embedding_adapters import BaseEmbeddingAdapter
+    from novel_generator.embedding_cache import get_query_embedding_memo, get_embedding_model_id
+    from novel_generator.vectorstore_utils import init_vector_store, multi_query_similarity_search, load_vector_store
+
+    class AsymmetricAdapter(LocalEmbeddingAdapter):
+        """模拟 Gemini 任务类型：查询向量与同文本的文档向量不同"""
+        supports_query_batch = False
+        embed_queries = BaseEmbeddingAdapter.embed_queries
+
+        def __init__(self, model_name):
+            super().__init__(model_name)
+            self.query_calls = []
+
+        def embed_query(self, query):
+            self.query_calls.append(query)
+            return super().embed_documents(["检索：" + query])[0]
+
+    queries = ["旧宅 门", "码头 货物"]
+    get_query_embedding_memo().clear()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        adapter = AsymmetricAdapter("local-ngram-80")
+        assert init_vector_store(adapter, ["林默推开旧宅的门。", "苏晴在码头清点货物。"], tmp_dir)
+        results = multi_query_similarity_search(adapter, queries, tmp_dir, k=2)
+        assert sorted(adapter.query_calls) == sorted(queries)
+
+        memo = get_query_embedding_memo()
+        model_id = get_embedding_model_id(adapter)
+        for query in queries:
+            expected = LocalEmbeddingAdapter.embed_documents(adapter, ["检索：" + query])[0]
+            cached = memo.get(model_id, query)
+            assert len(cached) == len(expected) and all(abs(a - b) < 1e-3 for a, b in zip(cached, expected))
+        store = load_vector_store(adapter, tmp_dir)
+        for query, hits in zip(queries, results):
+            single = store.similarity_search_with_score(query, k=2)
+            assert [d.page_content for d, _ in hits] == [d.page_content for d, _ in single]
+            assert all(abs(a[1] - b[1]) < 1e-4 for a, b in zip(hits, single))
+        assert len(adapter.query_calls) == 2, "单条检索应命中批量检索写入的 memo"
+    print("✅ 查询语义保持正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试多查询批量检索")
+    print("=" * 50)
+    try:
+        test_one_round_trip_per_chapter()
+        test_failed_query_embedding_isolated()
+        test_query_semantics_preserved()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试自适应限流（令牌桶、429 时按 Retry-After 乘性减、成功后加性恢复、已缓存适配器上的参数更新）
+"""
+
+import sys
+import os
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_token_bucket():
+    """令牌桶按速率补充，超过容量的单次请求只需等桶满"""
+    from rate_limiter import _TokenBucket, AdaptiveRateLimiter
+
+    bucket = _TokenBucket(60)
+    now = bucket.updated
+    assert bucket.wait_time(60) == 0.0
+    bucket.consume(60)
+    bucket.refill(now + 0.5)
+    assert abs(bucket.tokens - 0.5) < 1e-9
+    assert abs(bucket.wait_time(1) - 0.5) < 1e-9
+    bucket.refill(now + 120)
+    assert bucket.tokens == 60
+    assert bucket.wait_time(1000) == 0.0  # 超过容量按容量计
+
+    limiter = AdaptiveRateLimiter(tpm=600)  # 每秒补充 10 个 token
+    with limiter.slot(600):
+        pass
+    started = time.monotonic()
+    with limiter.slot(3):
+        pass
+    waited = time.monotonic() - started
+    assert 0.2 <= waited < 1.0, f"等待 {waited:.2f}s"
+    print("✅ 令牌桶正常")
+
+
+def test_aimd_throttle_and_recovery():
+    """429 时并发上限减半并按 Retry-After 暂停；成功请求逐步加性恢复到上限"""
+    from rate_limiter import AdaptiveRateLimiter
+    from retry_policy import ProviderHTTPError
+    from novel_generator.common import _invoke_rate_limited
+
+    class ThrottledAdapter:
+        model_name = "mock-model"
+        max_tokens = 0
+
+        def __init__(self, limiter):
+            self.rate_limiter = limiter
+
+        def invoke(self, prompt):
+            raise ProviderHTTPError(429, "Too Many Requests", retry_after=0.3)
+
+    limiter = AdaptiveRateLimiter(max_concurrency=8, min_concurrency=1)
+    try:
+        _invoke_rate_limited(ThrottledAdapter(limiter), "你好")
+        assert False, "429 应原样抛出"
+    except ProviderHTTPError:
+        pass
+    assert limiter.concurrency_limit == 4 and limiter.stats()["throttles"] == 1
+    started = time.monotonic()
+    limiter.acquire()
+    limiter.release()
+    waited = time.monotonic() - started
+    assert 0.25 <= waited < 1.0, f"Retry-After 冷却 {waited:.2f}s"
+
+    for expected in (2, 1, 1):
+        limiter.on_throttle()
+        assert limiter.concurrency_limit == expected
+
+    limits = []
+    for _ in range(60):
+        limiter.on_success()
+        limits.append(limiter.concurrency_limit)
+    assert limits == sorted(limits) and limits[0] == 2 and limits[-1] == 8
+    assert limits.count(2) >= 2, "加性增每个成功只应增加 1/当前上限"
+    print("✅ AIMD 减半与恢复正常")
+
+
+def test_configure_updates_cached_adapters():
+    """调整限流参数后，已缓存的 LLM / embedding 适配器持有的限流器立即使用新参数"""
+    from rate_limiter import configure_rate_limit, get_rate_limiter
+    from llm_adapters import create_llm_adapter, llm_adapter_registry
+    from embedding_adapters import create_embedding_adapter, embedding_adapter_registry
+
+    llm_adapter_registry.clear()
+    embedding_adapter_registry.clear()
+    try:
+        llm = create_llm_adapter("OpenAI", "http://127.0.0.1:9/v1", "mock-model", "sk-limit", 0.7, 512, 10)
+        embedding = create_embedding_adapter("Local", "sk-limit", "", "local-ngram-32")
+        llm_limiter, embedding_limiter = llm.rate_limiter, embedding.rate_limiter
+        assert llm_limiter.concurrency_limit == 8 and llm_limiter._request_bucket is None
+
+        configure_rate_limit("OpenAI", rpm=30, tpm=9000, max_concurrency=2)
+        configure_rate_limit("local embedding", max_concurrency=3)
+        llm = create_llm_adapter("OpenAI", "http://127.0.0.1:9/v1", "mock-model", "sk-limit", 0.7, 512, 10)
+        assert llm.rate_limiter is llm_limiter is get_rate_limiter("openai", "sk-limit")
+        assert llm_limiter.concurrency_limit == 2
+        assert llm_limiter._request_bucket.capacity == 30 and llm_limiter._token_bucket.capacity == 9000
+        assert embedding.rate_limiter is embedding_limiter and embedding_limiter.concurrency_limit == 3
+
+        llm_limiter.acquire(9000)
+        llm_limiter.release()
+        configure_rate_limit("OpenAI", rpm=30, tpm=6000, max_concurrency=2)
+        assert llm_limiter._token_bucket.tokens < 1, "更新参数不应重新放满令牌桶"
+    finally:
+        configure_rate_limit("OpenAI")
+        configure_rate_limit("local embedding")
+        llm_adapter_registry.clear()
+        embedding_adapter_registry.clear()
+    assert llm_limiter.concurrency_limit == 8 and llm_limiter._request_bucket is None
+    print("✅ 已缓存适配器的限流参数更新正常")
+
+
+def test_rate_limits_from_config():
+    """config.json 的 rate_limits 段经 apply_runtime_config 生效；参数不变时不重置，删除后恢复默认"""
+    from config_manager import apply_rate_limit_config
+    from rate_limiter import get_rate_limiter
+
+    limiter = get_rate_limiter("OpenAI", "sk-config")
+    config = {"rate_limits": {"OpenAI": {"rpm": "30", "max_concurrency": 2}, "OpenAI embedding": {"tpm": 5000}}}
+    try:
+        assert sorted(apply_rate_limit_config(config)) == ["OpenAI", "OpenAI embedding"]
+        assert limiter.concurrency_limit == 2 and limiter._request_bucket.capacity == 30
+        assert get_rate_limiter("openai embedding", "sk-config")._token_bucket.capacity == 5000
+
+        limiter.on_throttle()  # 被 429 限流后并发减半
+        throttled = limiter.concurrency_limit
+        assert apply_rate_limit_config(config) == [], "参数未变化时不应重新配置"
+        assert limiter.concurrency_limit == throttled
+
+        assert apply_rate_limit_config({"rate_limits": {"OpenAI": {"rpm": "很多"}}}) == ["OpenAI", "openai embedding"]
+        assert limiter._request_bucket is None and limiter.concurrency_limit == 8
+    finally:
+        apply_rate_limit_config({})
+    print("✅ config.json 限流配置正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试自适应限流")
+    print("=" * 50)
+    try:
+        test_token_bucket()
+        test_aimd_throttle_and_recovery()
+        test_configure_updates_cached_adapters()
+        test_rate_limits_from_config()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试统一重试策略（错误分类、空结果重试、截止时间预算、单层重试）
+"""
+
+import sys
+import os
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+class _ScriptedAdapter:
+    """按预设脚本依次返回结果或抛出异常的假适配器"""
+    model_name = "fake-model"
+    temperature = 0.7
+    max_tokens = 1024
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+
+    def invoke(self, prompt: str) -> str:
+        self.calls += 1
+        step = self.script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+
+def test_error_classification():
+    """认证/参数错误立即失败，限流、服务端错误与网络错误可重试"""
+    from retry_policy import ProviderHTTPError, classify_error, FATAL, RETRYABLE
+
+    assert classify_error(ProviderHTTPError(401)) == FATAL
+    assert classify_error(ProviderHTTPError(400)) == FATAL
+    assert classify_error(ProviderHTTPError(429)) == RETRYABLE
+    assert classify_error(ProviderHTTPError(503)) == RETRYABLE
+    assert classify_error(ConnectionError("connection reset")) == RETRYABLE
+    assert classify_error(ValueError("Invalid Azure OpenAI base_url format")) == FATAL
+    # 响应解析失败（截断的 JSON 等）虽是 ValueError 子类，仍应重试
+    import json
+    import requests
+    try:
+        json.loads('{"choices": [')
+    except ValueError as e:
+        assert classify_error(e) == RETRYABLE
+    try:
+        requests.models.complexjson.loads("<html>502</html>")
+    except ValueError as e:
+        assert classify_error(requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos)) == RETRYABLE
+    assert classify_error(UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")) == RETRYABLE
+
+    class OutputParserException(ValueError):
+        pass
+    assert classify_error(OutputParserException("Could not parse LLM output")) == RETRYABLE
+    print("✅ 错误分类正常")
+
+
+def test_invoke_with_cleaning_single_retry_layer():
+    """invoke_with_cleaning 对可重试错误（含响应解析失败）与空结果重试，对认证错误不重试"""
+    from retry_policy import RetryPolicy, ProviderHTTPError, get_default_retry_policy, set_default_retry_policy
+    from novel_generator.common import invoke_with_cleaning
+
+    original = get_default_retry_policy()
+    set_default_retry_policy(RetryPolicy(base_delay=0.01, max_delay=0.05))
+    try:
+        adapter = _ScriptedAdapter([ProviderHTTPError(429), "", "```结果```"])
+        assert invoke_with_cleaning(adapter, "提示词") == "结果"
+        assert adapter.calls == 3
+
+        import json
+        adapter = _ScriptedAdapter([json.JSONDecodeError("Expecting value", "", 0), "```结果```"])
+        assert invoke_with_cleaning(adapter, "提示词") == "结果"
+        assert adapter.calls == 2
+
+        adapter = _ScriptedAdapter([ProviderHTTPError(401), "不应被调用"])
+        try:
+            invoke_with_cleaning(adapter, "提示词")
+            assert False, "认证错误应直接抛出"
+        except ProviderHTTPError as e:
+            assert e.status_code == 401
+        assert adapter.calls == 1
+        print("✅ 单层重试与快速失败正常")
+    finally:
+        set_default_retry_policy(original)
+
+
+def test_deadline_budget():
+    """下一次退避会超出截止时间预算时停止重试"""
+    from retry_policy import RetryPolicy
+
+    policy = RetryPolicy(max_attempts=10, base_delay=0.2, jitter=0.0, deadline=0.3)
+    calls = []
+
+    def always_fail():
+        calls.append(1)
+        raise TimeoutError("timeout")
+
+    started = time.monotonic()
+    try:
+        policy.call(always_fail)
+        assert False, "应在预算耗尽后抛出"
+    except TimeoutError:
+        pass
+    assert len(calls) == 2
+    assert time.monotonic() - started < 0.5
+    print("✅ 截止时间预算正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试统一重试策略")
+    print("=" * 50)
+    try:
+        test_error_classification()
+        test_invoke_with_cleaning_single_retry_layer()
+        test_deadline_budget()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
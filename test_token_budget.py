@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试离线 token 估算与提示词预算（模型家族标定、按 token 截断、分块大小）
+"""
+
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_count_tokens_by_family():
+    """中文文本按模型家族标定估算，DeepSeek 分词更省 token"""
+    from token_budget import count_tokens, get_model_family
+
+    text = "主角在雨夜收到一封来自已故父亲的信。" * 10
+    assert get_model_family("deepseek-chat") == "deepseek"
+    assert get_model_family("gpt-4o-mini") == "o200k"
+    assert get_model_family("unknown-model") == "default"
+    assert count_tokens(text, "deepseek-chat") < count_tokens(text, "gpt-4o-mini") < count_tokens(text)
+    assert count_tokens("") == 0
+    print("✅ token 估算正常")
+
+
+def test_truncate_and_budget():
+    """截断结果不超过预算，keep='tail' 保留结尾，预算扣除固定部分与输出预留"""
+    from token_budget import count_tokens, truncate_to_tokens, PromptBudget
+
+    text = "".join(f"第{i}段内容。" for i in range(200))
+    head = truncate_to_tokens(text, 100, suffix="...")
+    assert count_tokens(head) <= 100 and head.endswith("...")
+    tail = truncate_to_tokens(text, 100, keep="tail")
+    assert count_tokens(tail) <= 100 and text.endswith(tail)
+    assert truncate_to_tokens("短文本", 100) == "短文本"
+
+    budget = PromptBudget("deepseek-chat", max_output_tokens=1000, context_window=2000, safety_margin=0.0)
+    assert budget.remaining("固定" * 100) == 2000 - 1000 - count_tokens("固定" * 100, "deepseek-chat")
+    fitted = budget.fit(text, cap=50, keep="tail")
+    assert count_tokens(fitted, "deepseek-chat") <= 50
+    print("✅ 截断与预算正常")
+
+
+def test_compute_chunk_size():
+    """分块大小随模型分词效率变化，并限制在 [1, 章节数]"""
+    from novel_generator.blueprint import compute_chunk_size
+
+    assert compute_chunk_size(100, 4096, "deepseek-chat") > compute_chunk_size(100, 4096)
+    assert compute_chunk_size(5, 4096) == 5
+    assert compute_chunk_size(100, 10) == 1
+    print("✅ 分块大小计算正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试 token 估算与提示词预算")
+    print("=" * 50)
+    try:
+        test_count_tokens_by_family()
+        test_truncate_and_budget()
+        test_compute_chunk_size()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
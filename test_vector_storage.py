@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试向量紧凑存储（float16/int8 量化）与向量库模型/维度头信息校验
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_quantized_roundtrip():
+    """float16/int8 编码后体积分别约为 1/2、1/4，解码误差在可接受范围内"""
+    import numpy as np
+    from novel_generator.embedding_cache import encode_vector, decode_vector
+
+    rng = np.random.default_rng(0)
+    vector = rng.normal(size=768)
+    vector = (vector / np.linalg.norm(vector)).tolist()
+    sizes = {dtype: len(encode_vector(vector, dtype)) for dtype in ("float32", "float16", "int8")}
+    assert sizes == {"float32": 768 * 4, "float16": 768 * 2, "int8": 768 + 4}
+    for dtype, tolerance in (("float16", 1e-3), ("int8", 1e-2)):
+        decoded = np.asarray(decode_vector(encode_vector(vector, dtype), dtype))
+        cosine = float(decoded @ np.asarray(vector) / np.linalg.norm(decoded))
+        assert cosine > 1 - tolerance, f"{dtype} 量化后余弦相似度 {cosine:.5f}"
+    assert decode_vector(encode_vector([0.0, 0.0], "int8"), "int8") == [0.0, 0.0]
+    print("✅ 量化编解码正常")
+
+
+def test_cache_dtype_and_legacy_rows():
+    """缓存按配置精度写入，并能读取不同精度写入的旧条目"""
+    from novel_generator.embedding_cache import EmbeddingCache
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "cache.sqlite")
+        cache = EmbeddingCache(db_path, dtype="float32")
+        cache.put_many("m", ["甲"], [[0.5, -0.25]])
+        cache.close()
+
+        cache = EmbeddingCache(db_path, dtype="int8")
+        cache.put_many("m", ["乙"], [[0.5, -0.25]])
+        found = cache.get_many("m", ["甲", "乙"])
+        assert found[0] == [0.5, -0.25]
+        assert max(abs(a - b) for a, b in zip(found[1], [0.5, -0.25])) < 0.01
+        assert cache.stats()["bytes"] == 8 + 6
+        cache.close()
+    print("✅ 缓存精度配置正常")
+
+
+def test_store_meta_and_mismatch():
+    """向量库记录模型与维度，换用其他 embedding 模型时加载/初始化快速失败"""
+    from embedding_adapters import LocalEmbeddingAdapter
+    from novel_generator.vectorstore_utils import (
+        init_vector_store, load_vector_store, update_vector_store, read_vector_store_meta,
+        check_vector_store_compat, VectorStoreMismatchError
+    )
+
+    texts = ["林默推开旧宅的门。", "苏晴在码头清点货物。"]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        adapter = LocalEmbeddingAdapter("local-ngram-64")
+        assert init_vector_store(adapter, texts, tmp_dir) is not None
+        assert read_vector_store_meta(tmp_dir) == {"model": "LocalEmbeddingAdapter:local-ngram-64", "dim": 64, "backend": "chroma"}
+        assert load_vector_store(adapter, tmp_dir) is not None
+
+        other = LocalEmbeddingAdapter("local-ngram-32")
+        try:
+            check_vector_store_compat(other, tmp_dir)
+            assert False, "模型不一致时应抛出 VectorStoreMismatchError"
+        except VectorStoreMismatchError as e:
+            assert "local-ngram-64" in str(e)
+        for action in (lambda: load_vector_store(other, tmp_dir),
+                       lambda: init_vector_store(other, texts, tmp_dir),
+                       lambda: update_vector_store(other, "新的章节内容。港口起雾。", tmp_dir, chapter_number=2)):
+            try:
+                action()
+                assert False, "不一致时应抛出 VectorStoreMismatchError 交由界面提示"
+            except VectorStoreMismatchError:
+                pass
+        assert read_vector_store_meta(tmp_dir)["dim"] == 64
+        assert load_vector_store(adapter, tmp_dir)._collection.count() == 2
+    print("✅ 向量库头信息校验正常")
+
+
+def test_legacy_store_dimension_probe():
+    """没有头信息的旧向量库：按已存储向量的维度校验当前适配器"""
+    from embedding_adapters import LocalEmbeddingAdapter
+    from novel_generator.vectorstore_utils import (
+        init_vector_store, load_vector_store, multi_query_similarity_search, invalidate_vector_store_handle,
+        get_vectorstore_dir, VECTORSTORE_META_FILENAME, VectorStoreMismatchError
+    )
+
+    class UndeclaredDimAdapter(LocalEmbeddingAdapter):
+        """不声明维度的适配器（如云端 API），只能通过探测请求得知维度"""
+        def __init__(self, model_name):
+            super().__init__(model_name)
+            self.vector_dim = self.dim
+            del self.dim
+
+        def embed_documents(self, texts):
+            self.dim = self.vector_dim
+            try:
+                return super().embed_documents(texts)
+            finally:
+                del self.dim
+
+    texts = ["林默推开旧宅的门。", "苏晴在码头清点货物。"]
+    for other in (LocalEmbeddingAdapter("local-ngram-32"), UndeclaredDimAdapter("local-ngram-48")):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            adapter = LocalEmbeddingAdapter("local-ngram-64")
+            assert init_vector_store(adapter, texts, tmp_dir) is not None
+            invalidate_vector_store_handle(tmp_dir)
+            os.remove(os.path.join(get_vectorstore_dir(tmp_dir), VECTORSTORE_META_FILENAME))  # 模拟旧版本向量库
+            for action in (lambda: load_vector_store(other, tmp_dir),
+                           lambda: multi_query_similarity_search(other, ["旧宅"], tmp_dir)):
+                try:
+                    action()
+                    assert False, "旧向量库维度不一致时应抛出 VectorStoreMismatchError"
+                except VectorStoreMismatchError as e:
+                    assert "64" in str(e)
+            assert load_vector_store(adapter, tmp_dir)._collection.count() == 2
+            invalidate_vector_store_handle(tmp_dir)
+    print("✅ 旧向量库维度探测正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试向量紧凑存储与维度校验")
+    print("=" * 50)
+    try:
+        test_quantized_roundtrip()
+        test_cache_dtype_and_legacy_rows()
+        test_store_meta_and_mismatch()
+        test_legacy_store_dimension_probe()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试向量库句柄池（同一进程内每个项目只打开一次 Chroma，清空后失效并可重新创建）
+"""
+
+import sys
+import os
+import tempfile
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_single_open_per_session():
+    """检索、定稿、导入共用同一句柄；清空后重新打开，且可在同一进程内重建向量库"""
+    from embedding_adapters import LocalEmbeddingAdapter
+    from novel_generator.vectorstore_utils import (
+        init_vector_store, load_vector_store, update_vector_store, clear_vector_store,
+        get_relevant_context_from_vector_store, get_vector_store_pool_stats, get_vectorstore_dir
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_dir = os.path.abspath(get_vectorstore_dir(tmp_dir))
+        before = get_vector_store_pool_stats()["opens_by_dir"].get(store_dir, 0)
+        adapter = LocalEmbeddingAdapter("local-ngram-64")
+        store = init_vector_store(adapter, ["林默推开旧宅的门。", "苏晴在码头清点货物。"], tmp_dir)
+        assert store is not None
+
+        for query in ("旧宅", "码头", "货物"):
+            assert get_relevant_context_from_vector_store(LocalEmbeddingAdapter("local-ngram-64"), query, tmp_dir, k=1)
+        update_vector_store(LocalEmbeddingAdapter("local-ngram-64"), "港口起雾，汽笛声远。", tmp_dir)
+        assert load_vector_store(adapter, tmp_dir) is store
+        assert store._collection.count() == 3
+
+        stats = get_vector_store_pool_stats()
+        assert stats["opens_by_dir"][store_dir] == before + 1
+        assert stats["reuses"] >= 5
+
+        assert clear_vector_store(tmp_dir)
+        assert load_vector_store(adapter, tmp_dir) is None
+        rebuilt = init_vector_store(adapter, ["重新导入的设定。"], tmp_dir)
+        assert rebuilt is not None and rebuilt is not store
+        assert rebuilt._collection.count() == 1
+        stats = get_vector_store_pool_stats()
+        assert stats["opens_by_dir"][store_dir] == before + 2 and stats["invalidations"] >= 1
+        clear_vector_store(tmp_dir)
+    print("✅ 句柄池复用与失效正常")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 测试向量库句柄池")
+    print("=" * 50)
+    try:
+        test_single_open_per_session()
+        return True
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
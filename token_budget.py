@@ -0,0 +1,138 @@
+# token_budget.py
+# -*- coding: utf-8 -*-
+"""
+离线 token 估算与提示词预算管理。
+按模型家族标定每类字符（中日韩字符、ASCII 字母数字、其他符号）的平均 token 开销，
+无需下载分词器；PromptBudget 据此在模型上下文窗口内为各段内容分配 token 额度。
+"""
+import math
+import re
+
+# 各模型家族的标定参数：每个字符平均消耗的 token 数与默认上下文窗口
+# 数值来自各家分词器对中文小说语料的实测均值，宁可略微高估以避免超窗
+MODEL_FAMILY_PROFILES = {
+    "deepseek": {"cjk": 0.6, "ascii": 0.3, "other": 0.6, "context_window": 65536},
+    "qwen": {"cjk": 0.65, "ascii": 0.3, "other": 0.6, "context_window": 32768},
+    "glm": {"cjk": 0.6, "ascii": 0.3, "other": 0.6, "context_window": 131072},
+    "o200k": {"cjk": 0.8, "ascii": 0.27, "other": 0.6, "context_window": 128000},
+    "cl100k": {"cjk": 1.3, "ascii": 0.27, "other": 0.7, "context_window": 128000},
+    "gemini": {"cjk": 0.9, "ascii": 0.27, "other": 0.6, "context_window": 1048576},
+    "claude": {"cjk": 1.2, "ascii": 0.3, "other": 0.7, "context_window": 200000},
+    "llama": {"cjk": 1.4, "ascii": 0.3, "other": 0.8, "context_window": 8192},
+    "default": {"cjk": 1.0, "ascii": 0.3, "other": 0.7, "context_window": 32768},
+}
+
+# 模型名到家族的匹配规则，按顺序取第一个命中项
+_FAMILY_PATTERNS = [
+    (re.compile(r"deepseek"), "deepseek"),
+    (re.compile(r"qwen|qwq"), "qwen"),
+    (re.compile(r"glm|chatglm"), "glm"),
+    (re.compile(r"gpt-4o|gpt-4\.1|gpt-5|(^|/)o[134](-|$)"), "o200k"),
+    (re.compile(r"gpt"), "cl100k"),
+    (re.compile(r"gemini"), "gemini"),
+    (re.compile(r"claude"), "claude"),
+    (re.compile(r"llama|mistral|mixtral"), "llama"),
+]
+
+_CJK_CHARS = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+_ASCII_ALNUM = re.compile(r"[A-Za-z0-9]")
+_WHITESPACE = re.compile(r"\s")
+
+
+def get_model_family(model_name: str = None) -> str:
+    name = (model_name or "").strip().lower()
+    for pattern, family in _FAMILY_PATTERNS:
+        if pattern.search(name):
+            return family
+    return "default"
+
+
+def get_context_window(model_name: str = None) -> int:
+    return MODEL_FAMILY_PROFILES[get_model_family(model_name)]["context_window"]
+
+
+def count_tokens(text: str, model_name: str = None) -> int:
+    """估算 text 在指定模型下的 token 数（空白字符不计）"""
+    if not text:
+        return 0
+    profile = MODEL_FAMILY_PROFILES[get_model_family(model_name)]
+    cjk = len(_CJK_CHARS.findall(text))
+    ascii_alnum = len(_ASCII_ALNUM.findall(text))
+    whitespace = len(_WHITESPACE.findall(text))
+    other = len(text) - cjk - ascii_alnum - whitespace
+    return math.ceil(cjk * profile["cjk"] + ascii_alnum * profile["ascii"] + other * profile["other"])
+
+
+def _char_costs(text: str, profile: dict) -> list:
+    costs = []
+    for ch in text:
+        if _CJK_CHARS.match(ch):
+            costs.append(profile["cjk"])
+        elif _ASCII_ALNUM.match(ch):
+            costs.append(profile["ascii"])
+        elif _WHITESPACE.match(ch):
+            costs.append(0.0)
+        else:
+            costs.append(profile["other"])
+    return costs
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model_name: str = None, keep: str = "head", suffix: str = "") -> str:
+    """
+    截断 text 使其估算 token 数不超过 max_tokens。
+    :param keep: "head" 保留开头，"tail" 保留结尾（如前文章节取最近的内容）
+    :param suffix: 发生截断时追加（keep="tail" 时前置）的标记，如 "..."
+    """
+    if not text or max_tokens <= 0:
+        return ""
+    if count_tokens(text, model_name) <= max_tokens:
+        return text
+    profile = MODEL_FAMILY_PROFILES[get_model_family(model_name)]
+    costs = _char_costs(text, profile)
+    budget = max_tokens - count_tokens(suffix, model_name)
+    total = 0.0
+    if keep == "tail":
+        index = len(text)
+        while index > 0 and total + costs[index - 1] <= budget:
+            index -= 1
+            total += costs[index]
+        return suffix + text[index:]
+    index = 0
+    while index < len(text) and total + costs[index] <= budget:
+        total += costs[index]
+        index += 1
+    return text[:index] + suffix
+
+
+class PromptBudget:
+    """
+    以模型上下文窗口为总预算：扣除最大输出 token、安全余量与提示词中的固定部分后，
+    剩余额度分配给可伸缩的内容段（前文、检索结果等）。
+    :param model_name: 模型名称，用于选择标定参数与默认上下文窗口
+    :param max_output_tokens: 为模型输出预留的 token 数（通常即 max_tokens 配置）
+    :param context_window: 覆盖默认的上下文窗口大小
+    :param safety_margin: 估算误差的安全余量（占上下文窗口的比例）
+    """
+    def __init__(self, model_name: str = None, max_output_tokens: int = 0, context_window: int = None, safety_margin: float = 0.05):
+        self.model_name = model_name
+        self.max_output_tokens = int(max_output_tokens or 0)
+        self.context_window = int(context_window or get_context_window(model_name))
+        self.safety_margin = safety_margin
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model_name)
+
+    def remaining(self, *fixed_texts: str) -> int:
+        """扣除固定文本后可供伸缩内容使用的 token 数"""
+        usable = int(self.context_window * (1 - self.safety_margin)) - self.max_output_tokens
+        return max(0, usable - sum(self.count(t) for t in fixed_texts))
+
+    def fit(self, text: str, cap: int = None, fixed_texts=(), keep: str = "head", suffix: str = "") -> str:
+        """
+        将 text 截断到 min(cap, 剩余预算) 个 token 以内。
+        cap 为该内容段自身的上限（控制成本），None 表示只受上下文窗口约束。
+        """
+        limit = self.remaining(*fixed_texts)
+        if cap is not None:
+            limit = min(limit, cap)
+        return truncate_to_tokens(text, limit, self.model_name, keep=keep, suffix=suffix)
@@ -4,7 +4,7 @@ from tkinter import messagebox
 
 import customtkinter as ctk
 
-from config_manager import load_config, save_config
+from config_manager import load_config, save_config, apply_runtime_config
 from tooltips import tooltips
 
 
@@ -187,6 +187,9 @@ def build_embeddings_config_tab(self):
             elif new_value == "SiliconFlow":
                 self.embedding_url_var.set("https://api.siliconflow.cn/v1/embeddings")
                 self.embedding_model_name_var.set("BAAI/bge-m3")
+            elif new_value == "Local":
+                self.embedding_url_var.set("")
+                self.embedding_model_name_var.set("local-ngram-512")
 
     for i in range(5):
         self.embeddings_config_tab.grid_rowconfigure(i, weight=0)
@@ -202,7 +205,7 @@ def build_embeddings_config_tab(self):
     # 2) Embedding 接口格式
     create_label_with_help(self, parent=self.embeddings_config_tab, label_text="Embedding 接口格式:", tooltip_key="embedding_interface_format", row=1, column=0, font=("Microsoft YaHei", 12))
 
-    emb_interface_options = ["DeepSeek", "OpenAI", "Azure OpenAI", "Gemini", "Ollama", "ML Studio","SiliconFlow"]
+    emb_interface_options = ["DeepSeek", "OpenAI", "Azure OpenAI", "Gemini", "Ollama", "ML Studio","SiliconFlow", "Local"]
 
     emb_interface_dropdown = ctk.CTkOptionMenu(self.embeddings_config_tab, values=emb_interface_options, variable=self.embedding_interface_format_var, command=on_embedding_interface_changed, font=("Microsoft YaHei", 12))
     emb_interface_dropdown.grid(row=1, column=1, padx=5, pady=5, sticky="nsew")
@@ -313,6 +316,7 @@ def save_config_btn(self):
     existing_config["other_params"] = other_params
 
     if save_config(existing_config, self.config_file):
+        apply_runtime_config(existing_config)
         messagebox.showinfo("提示", "配置已保存至 config.json")
         self.log("配置已保存。")
     else:
@@ -265,6 +265,10 @@ def generate_chapter_draft_ui(self):
 
             self.safe_log("开始生成章节草稿...")
             from novel_generator.chapter import generate_chapter_draft
+            # 流式生成：先清空正文框，再逐段追加
+            self.master.after(0, lambda: self.show_chapter_in_textbox(""))
+            def on_chunk(chunk):
+                self.master.after(0, lambda c=chunk: self.append_chapter_in_textbox(c))
             draft_text = generate_chapter_draft(
                 api_key=api_key,
                 base_url=base_url,
@@ -286,7 +290,8 @@ def generate_chapter_draft_ui(self):
                 interface_format=interface_format,
                 max_tokens=max_tokens,
                 timeout=timeout_val,
-                custom_prompt_text=edited_prompt  # 使用用户编辑后的提示词
+                custom_prompt_text=edited_prompt,  # 使用用户编辑后的提示词
+                on_chunk=on_chunk
             )
             if draft_text:
                 self.safe_log(f"✅ 第{chap_num}章草稿生成完成。请在左侧查看或编辑。")
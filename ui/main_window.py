@@ -10,7 +10,7 @@ from tkinter import filedialog, messagebox
 from .role_library import RoleLibrary
 from llm_adapters import create_llm_adapter
 
-from config_manager import load_config, save_config, test_llm_config, test_embedding_config
+from config_manager import load_config, save_config, test_llm_config, test_embedding_config, apply_runtime_config
 from utils import read_file, save_string_to_txt, clear_file_content
 from tooltips import tooltips
 
@@ -51,6 +51,7 @@ class NovelGeneratorGUI:
         # --------------- 配置文件路径 ---------------
         self.config_file = "config.json"
         self.loaded_config = load_config(self.config_file)
+        apply_runtime_config(self.loaded_config)
 
         if self.loaded_config:
             last_llm = self.loaded_config.get("last_interface_format", "OpenAI")
@@ -176,6 +177,10 @@ class NovelGeneratorGUI:
         self.chapter_result.delete("0.0", "end")
         self.chapter_result.insert("0.0", text)
         self.chapter_result.see("end")
+
+    def append_chapter_in_textbox(self, text: str):
+        self.chapter_result.insert("end", text)
+        self.chapter_result.see("end")
     
     def test_llm_config(self):
         """
@@ -377,7 +377,8 @@ class RoleLibrary:
             prompt = f"{Character_Import_Prompt}\n<<待分析小说文本开始>>\n{content}\n<<待分析小说文本结束>>"
             response = invoke_with_cleaning(
                 self.llm_adapter,
-                prompt
+                prompt,
+                stage="role_import"
             )
             
             # 解析LLM响应
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 import os
 import json
+import asyncio
+import threading
 
 def read_file(filename: str) -> str:
     """读取文件的全部内容，若文件不存在或异常则返回空字符串。"""
@@ -51,3 +53,31 @@ def save_data_to_json(data: dict, file_path: str) -> bool:
     except Exception as e:
         print(f"[save_data_to_json] 保存数据到JSON文件时出错: {e}")
         return False
+
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+def _get_background_loop():
+    """获取进程内常驻的后台事件循环（守护线程），异步连接池可在多次调用间复用"""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="async-runner", daemon=True).start()
+            _background_loop = loop
+        return _background_loop
+
+def run_coroutine_sync(coro):
+    """
+    在同步代码中执行协程并等待结果。
+    协程统一提交到常驻后台事件循环执行，因此调用方线程中是否已有运行中的事件循环（如 Web 服务）都不受影响。
+    """
+    loop = _get_background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_coroutine_sync cannot be called from the background event loop itself")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
@@ -13,7 +13,8 @@ import traceback
 from typing import Optional, Tuple, Dict, Any
 
 # 导入原有的核心功能模块
-from config_manager import load_config, save_config, test_llm_config, test_embedding_config
+from config_manager import load_config, save_config, test_llm_config, test_embedding_config, apply_runtime_config, \
+    RUNTIME_CONFIG_SECTIONS
 from novel_generator import (
     Novel_architecture_generate,
     Chapter_blueprint_generate,
@@ -33,6 +34,7 @@ class NovelGeneratorWebApp:
     def __init__(self):
         self.config_file = "config.json"
         self.loaded_config = load_config(self.config_file)
+        apply_runtime_config(self.loaded_config)
 
         # 初始化默认配置
         self.init_default_config()
@@ -138,6 +140,14 @@ class NovelGeneratorWebApp:
                 }
             }
 
+            # 保留其他服务商的配置与路由、连接池等运行时设置（路由的备用服务商引用 llm_configs 中的条目）
+            existing_config = load_config(self.config_file)
+            for name, conf in existing_config.get("llm_configs", {}).items():
+                global_config_data["llm_configs"].setdefault(name, conf)
+            for section in RUNTIME_CONFIG_SECTIONS:
+                if section in existing_config:
+                    global_config_data[section] = existing_config[section]
+
             # 保存全局配置（不包含小说参数）
             success = save_config(global_config_data, self.config_file)
             if not success:
@@ -148,6 +158,7 @@ class NovelGeneratorWebApp:
 
             if success:
                 self.loaded_config = global_config_data
+                apply_runtime_config(global_config_data)
                 return f"✅ 配置保存成功！{novel_config_result}"
             else:
                 return "❌ 配置保存失败！"
@@ -2525,12 +2536,14 @@ def handle_generate_blueprint(llm_interface, llm_api_key, llm_base_url, llm_mode
 def handle_generate_chapter_draft(llm_interface, llm_api_key, llm_base_url, llm_model, temperature, max_tokens, timeout,
                                  embedding_interface, embedding_api_key, embedding_base_url, embedding_model, retrieval_k,
                                  filepath, chapter_num, word_number, user_guidance, current_log):
-    """处理生成章节草稿事件"""
+    """处理生成章节草稿事件（流式输出：生成过程中逐步刷新章节内容）"""
     import os
+    import queue
+    import threading
     from utils import read_file
 
     if not filepath:
-        return (
+        yield (
             "",  # chapter_content
             "",  # all_chapters_content
             current_log + app.log_message("❌ 请先设置保存文件路径"),
@@ -2538,13 +2551,16 @@ def handle_generate_chapter_draft(llm_interface, llm_api_key, llm_base_url, llm_
             chapter_num,  # current_chapter (保持原值)
             gr.Dropdown(choices=[], value=None)  # chapter_selector
         )
+        return
 
     try:
         log_msg = current_log + app.log_message(f"🚀 开始生成第{chapter_num}章草稿...")
+        chunk_queue = queue.Queue()
+        outcome = {}
 
         def generate_task():
             try:
-                result = generate_chapter_draft(
+                generate_chapter_draft(
                     interface_format=llm_interface,
                     api_key=llm_api_key,
                     base_url=llm_base_url,
@@ -2564,7 +2580,8 @@ def handle_generate_chapter_draft(llm_interface, llm_api_key, llm_base_url, llm_
                     time_constraint="",  # 从章节蓝图中自动获取
                     temperature=temperature,
                     max_tokens=int(max_tokens),
-                    timeout=int(timeout)
+                    timeout=int(timeout),
+                    on_chunk=chunk_queue.put
                 )
 
                 # 读取生成的章节内容
@@ -2574,11 +2591,37 @@ def handle_generate_chapter_draft(llm_interface, llm_api_key, llm_base_url, llm_
                 # 设置章节状态为草稿
                 set_chapter_status(filepath, int(chapter_num), "草稿")
 
-                return chapter_content, "✅ 章节草稿生成完成！"
+                outcome["result"] = (chapter_content, "✅ 章节草稿生成完成！")
             except Exception as e:
-                return "", f"❌ 生成章节草稿时出错: {str(e)}"
-
-        chapter_content, result_msg = generate_task()
+                outcome["result"] = ("", f"❌ 生成章节草稿时出错: {str(e)}")
+            finally:
+                chunk_queue.put(None)
+
+        worker = threading.Thread(target=generate_task, daemon=True)
+        worker.start()
+
+        # 生成过程中逐步输出已收到的文本
+        partial_content = ""
+        pending_button = gr.Button("✅ 内容定稿", variant="secondary", interactive=False)
+        finished = False
+        while not finished:
+            try:
+                chunk = chunk_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            received = [chunk]
+            while not chunk_queue.empty():
+                received.append(chunk_queue.get_nowait())
+            for item in received:
+                if item is None:
+                    finished = True
+                else:
+                    partial_content += item
+            if not finished:
+                yield partial_content, gr.update(), log_msg, pending_button, chapter_num, gr.update()
+        worker.join()
+
+        chapter_content, result_msg = outcome.get("result", ("", "❌ 生成章节草稿时出错: 未知错误"))
         final_log = log_msg + app.log_message(result_msg)
 
         # 加载所有章节内容
@@ -2595,10 +2638,10 @@ def handle_generate_chapter_draft(llm_interface, llm_api_key, llm_base_url, llm_
         else:
             next_button = gr.Button("✅ 内容定稿", variant="secondary", interactive=False)
 
-        return chapter_content, all_chapters, final_log, next_button, chapter_num, chapter_selector_update
+        yield chapter_content, all_chapters, final_log, next_button, chapter_num, chapter_selector_update
 
     except Exception as e:
-        return (
+        yield (
             "",  # chapter_content
             "",  # all_chapters_content
             current_log + app.log_message(f"❌ 生成章节草稿时出错: {str(e)}"),